@@ -1,168 +1,128 @@
-import streamlit as st
-import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
-from rapidfuzz import process
 import os
-import re 
 
-# ========== HELPER FUNCTIONS ==========
-def add_rating(df, restaurant, food, new_rating):
-    mask = (df['restaurant'].str.lower() == restaurant.lower()) & \
-           (df['food'].str.lower() == food.lower())
-    
-    if not mask.any():
-        return None, f"❌ No entry found for '{food}' at '{restaurant}'. Add it first!"
-    
-    idx = df[mask].index[0]
-    
-    # 🔥 SAFELY CONVERT TO NUMERIC
-    old_avg = pd.to_numeric(df.at[idx, 'taste'], errors='coerce')
-    old_votes = pd.to_numeric(df.at[idx, 'votes_count'], errors='coerce')
-    
-    # Handle NaN or invalid values
-    if pd.isna(old_avg) or pd.isna(old_votes):
-        old_avg = 0.0
-        old_votes = 0
-    
-    # Calculate new average
-    new_avg = (old_avg * old_votes + new_rating) / (old_votes + 1)
-    
-    # Update DataFrame
-    df.at[idx, 'taste'] = new_avg
-    df.at[idx, 'votes_count'] = old_votes + 1
-    
-    msg = f"✅ Updated {food} at {restaurant}: new avg taste = {new_avg:.2f} ({int(old_votes + 1)} votes)"
-    return df, msg
-def get_matching_dishes(df, query_rest="", query_food=""):
-    """
-    Returns list of (restaurant, food) tuples matching partial input.
-    """
-    mask = True
-    if query_rest.strip():
-        mask &= df['restaurant'].str.contains(query_rest, case=False, na=False)
-    if query_food.strip():
-        mask &= df['food'].str.contains(query_food, case=False, na=False)
-    matches = df[mask][['restaurant', 'food']].drop_duplicates().head(5)
-    return [(row['restaurant'], row['food']) for _, row in matches.iterrows()]
+import streamlit as st
+import pandas as pd
 
-def add_new_entry(df, restaurant, food, price, rating, location, portion_size, category, description="", source="user"):
-    new_row = {
-        "restaurant": restaurant.strip().title(),
-        "food": food.strip().title(),
-        "price": float(price),
-        "taste": float(rating),
-        "location": location.strip().title(),
-        "portion_size": portion_size,
-        "dish_category": category.strip().title() if category else "Uncategorized",
-        "description": description.strip() if description else None,
-        "source_url": source,
-        "votes_count": 1
-    }
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    return df
+import instrumentation
+from instrumentation import stage
+from service import TastePrice, TastePriceClient
 
 # ========== Load & Prepare Data ==========
-@st.cache_data
-def load_data():
-    if not os.path.exists("ghana_restaurants_master.csv"):
-        st.error("Dataset not found! Please run data prep script first.")
-        return None
-    df = pd.read_csv("ghana_restaurants_master.csv")
-    df['price'] = pd.to_numeric(df['price'], errors='coerce')
-    df['taste'] = pd.to_numeric(df['taste'], errors='coerce')
-    df = df.dropna(subset=["price"])
-
-    # 🔥 CRITICAL: Ensure 'votes_count' exists
-    if 'votes_count' not in df.columns:
-        df['votes_count'] = 1  # Default to 1 vote for all existing entries
-    else:
-        df['votes_count'] = pd.to_numeric(df['votes_count'], errors='coerce').fillna(1).astype(int)
-        
-    # Normalize
-    scaler = MinMaxScaler()
-    df['price_norm'] = 1 - scaler.fit_transform(df[['price']])
-    df['taste_norm'] = scaler.fit_transform(df[['taste']].fillna(0))
-    
-    # Optional: Weight score by popularity (log scale to avoid dominance)
-    df['popularity_weight'] = (df['votes_count'].fillna(1).apply(lambda x: max(1, x))).apply(lambda x: x**0.2)
-    df['weighted_score'] = df['price_norm'] * 0.5 + df['taste_norm'] * 0.5
-    df['score'] = df['weighted_score'] * df['popularity_weight']
-    
-    return df
+@st.cache_resource
+def load_backend():
+    """
+    Recommend / rate / add logic (see service.py). In-process by default,
+    sharing one array-backed engine across sessions; with TASTEPRICE_API
+    set, this script is only a thin client of `python service.py`.
+    """
+    api_url = os.environ.get("TASTEPRICE_API")
+    return TastePriceClient(api_url) if api_url else TastePrice()
 
-df = load_data()
-if df is None:
+backend = load_backend()
+if not backend.ready():
+    st.error("Dataset not found! Please run data prep script first.")
     st.stop()
 
-# ======== Recommender Function (Slightly Enhanced) ========
-def recommend_dish_fuzzy(dish_name, df, top_k=5, cheap_bias=0.5, cutoff=70):
-    unique_dishes = df['food'].dropna().unique().tolist()
-    
-    # Use process.extract → returns LIST of (match, score, index)
-    results = process.extract(dish_name, unique_dishes, limit=10, score_cutoff=cutoff)
-    
-    if not results:  # if empty list
-        return None, f"No close matches found for '{dish_name}'"
-    
-    # Extract ALL matched dish names (not just one!)
-    matched_names = [r[0] for r in results]  # r[0] = the matched string
-    
-    # Create a regex pattern: "waakye|wakye|waaky3|..."
-    pattern = '|'.join([re.escape(name) for name in matched_names])
-    
-    # Filter rows where 'food' contains ANY of the matched names
-    mask = df['food'].str.contains(pattern, case=False, na=False, regex=True)
-    subset = df[mask].copy()
-    
-    if subset.empty:
-        return None, f"No dishes found matching any of: {matched_names}"
-    
-    # Compute score based on user preference
-    subset['user_score'] = cheap_bias * subset['price_norm'] + (1 - cheap_bias) * subset['taste_norm']
-    
-    # Return first match (for display) + top K sorted results
-    return matched_names[0], subset.sort_values('user_score', ascending=False).head(top_k)
 # ========= Streamlit UI =========
 st.set_page_config(page_title="🍗 TastePrice Ghana", page_icon="🍗", layout="centered")
 
 st.title("🍗 TastePrice Food Recommender")
 st.markdown("*Find affordable, tasty meals in Accra, Kumasi & beyond — powered by community data.*")
 
+# --- Diagnostics switch (process-wide: traces every session of this app) ---
+with st.sidebar:
+    diagnostics_on = st.toggle("🩺 Diagnostics", value=instrumentation.enabled(),
+                               help=f"Time each stage of searches, ratings and submissions "
+                                    f"and log them to {instrumentation.QUERY_LOG}")
+if diagnostics_on != instrumentation.enabled():
+    instrumentation.enable() if diagnostics_on else instrumentation.disable()
+
+# --- Who is searching / rating (optional): personal rankings once factors are trained ---
+with st.sidebar:
+    user = st.text_input("👤 Your name", value=st.query_params.get("user", ""), placeholder="optional",
+                         help="Your ratings are kept under this name. After the next `python personalize.py`, "
+                              "searches rank dishes by your own taste instead of the crowd average.").strip()
+
 # --- Search + Preference ---
 col1, col2 = st.columns([3,1])
 with col1:
-    dish_name = st.text_input("🔍 Search for a dish (e.g., Waakye, Jollof, Kebab)", placeholder="Type a dish name...")
+    dish_name = st.text_input("🔍 Search for a dish (e.g., Waakye, Jollof, Kebab)", placeholder="Type a dish name...",
+                              key="dish_query")
 with col2:
     cheap_bias = st.slider("💰 vs 😋", 0.0, 1.0, 0.5, 
                            help="Slide left for tastier, right for cheaper",
                            label_visibility="collapsed")
 
-# --- Display Results ---
+semantic = st.toggle("🧠 Also match descriptions & categories",
+                     help="Find dishes by what they are (\"spicy rice\", \"fried yam kontomire\"), "
+                          "not just by name. Name searches with no match fall back to this anyway.")
+
+# --- Filters: where and what kind of dish (either optional) ---
+f1, f2 = st.columns(2)
+with f1:
+    location = st.text_input("📍 Location", placeholder="e.g., Osu, East Legon", key="location_filter").strip()
+with f2:
+    category = st.text_input("🗂️ Category", placeholder="e.g., Rice, Soup", key="category_filter").strip()
+
+# --- Typeahead: most voted dishes starting with / containing what was typed ---
+def pick_suggestion(name):
+    st.session_state.dish_query = name
+
 if dish_name:
-    with st.spinner("Finding the best bites..."):
-        match, results_or_msg = recommend_dish_fuzzy(dish_name, df, top_k=5, cheap_bias=cheap_bias)
+    suggestions = [s for s in backend.suggest(query=dish_name, limit=5) if s.lower() != dish_name.strip().lower()]
+    if suggestions:
+        chips = st.columns(len(suggestions))
+        for i, (chip, name) in enumerate(zip(chips, suggestions)):
+            chip.button(name, key=f"suggestion_{i}", on_click=pick_suggestion, args=(name,),
+                        use_container_width=True)
 
+# --- Display Results ---
+def show_results(match, results_or_msg):
     if isinstance(results_or_msg, str):  # error message
         st.warning(results_or_msg)
-    else:
-        st.success(f"✅ Matched to: **{match}**")
-        st.subheader("🏆 Top Recommendations")
-        
-        for idx, row in results_or_msg.iterrows():
-            with st.container(border=True):
-                cols = st.columns([3,1])
-                with cols[0]:
-                    st.markdown(f"### {row['restaurant']}")
-                    st.write(f"📍 {row['location']}")
-                    st.write(f"🍽️ **{row['food']}** — ₵{row['price']:.2f}")
-                    if not pd.isna(row.get('description')):
-                        st.caption(f"*{row['description']}*")
-                with cols[1]:
-                    st.metric("Taste", f"{row['taste']}/10" if not pd.isna(row['taste']) else "N/A")
-                    st.metric("Value Score", f"{row['user_score']:.2f}")
-                    st.caption(f"({int(row['votes_count'])} votes)")
+        return
+    st.success(f"✅ Matched to: **{match}**")
+    st.subheader("🏆 Top Recommendations")
+    show_rows(results_or_msg)
+
+def show_rows(rows):
+    for row in rows:
+        with st.container(border=True):
+            cols = st.columns([3,1])
+            with cols[0]:
+                st.markdown(f"### {row['restaurant']}")
+                st.write(f"📍 {row['location']}")
+                st.write(f"🍽️ **{row['food']}** — ₵{row['price']:.2f}")
+                if not pd.isna(row.get('description')):
+                    st.caption(f"*{row['description']}*")
+            with cols[1]:
+                st.metric("Taste", f"{row['taste']}/10" if not pd.isna(row['taste']) else "N/A")
+                st.metric("Value Score", f"{row['user_score']:.2f}")
+                st.caption(f"({int(row['votes_count'])} votes)")
+
+            st.divider()
 
-                st.divider()
+if dish_name:
+    # one traced request: the service's stages + rendering (a no-op unless diagnostics are on)
+    mode = "semantic" if semantic else "auto"
+    with instrumentation.request("search", query=dish_name, bias=cheap_bias, top_k=5, mode=mode):
+        with st.spinner("Finding the best bites..."):
+            match, results_or_msg = backend.recommend(dish_name, top_k=5, cheap_bias=cheap_bias, mode=mode,
+                                                      user=user or None, location=location, category=category)
+        with stage("render"):
+            show_results(match, results_or_msg)
+elif location or category:
+    # no dish typed: the best-value dishes of the filtered area / category
+    with instrumentation.request("leaderboard", location=location, category=category, bias=cheap_bias, top_k=10):
+        best = backend.leaderboard(location, category, cheap_bias=cheap_bias, top_k=10)
+        with stage("render"):
+            scope = " ".join(part for part in (f"**{category}**" if category else "",
+                                               f"in **{location}**" if location else "") if part)
+            if best:
+                st.subheader(f"🏅 Best value {scope}")
+                show_rows(best)
+            else:
+                st.warning(f"No dishes found {scope}")
 
 # --- Rate Existing Dish ---
 # --- Rate Existing Dish ---
@@ -179,7 +139,7 @@ with st.form("rating_form", clear_on_submit=True):
     
     # 🔍 LIVE SUGGESTIONS (optional but helpful)
     if rate_rest or rate_food:
-        suggestions = get_matching_dishes(df, rate_rest, rate_food)
+        suggestions = backend.suggest(restaurant=rate_rest, food=rate_food)
         if suggestions:
             st.caption("🔎 Matching dishes:")
             for rest, food in suggestions:
@@ -193,16 +153,15 @@ with st.form("rating_form", clear_on_submit=True):
         if not all([rate_rest, rate_food]):
             st.error("Please fill in both restaurant and dish name.")
         else:
-            # Reload current live data
-            current_df = pd.read_csv("ghana_restaurants_master.csv")
-            updated_df, msg = add_rating(current_df, rate_rest, rate_food, new_taste)
-            
-            if updated_df is not None:
-                updated_df.to_csv("ghana_restaurants_master.csv", index=False, encoding="utf-8")
-                st.success(msg)
-                st.cache_data.clear()
+            # Validated against the live catalog, then recorded as one vote
+            with instrumentation.request("rate", restaurant=rate_rest, food=rate_food, rating=new_taste):
+                dish = backend.rate(rate_rest, rate_food, new_taste, user=user or None)
+
+            if dish is not None:
+                st.success(f"✅ Updated {rate_food} at {rate_rest}: new avg taste = {dish['taste']:.2f} "
+                           f"({int(dish['votes_count'])} votes)")
             else:
-                st.warning(msg)
+                st.warning(f"❌ No entry found for '{rate_food}' at '{rate_rest}'. Add it first!")
                 st.info("💡 Try adding this dish using the 'Add New Meal' form below.")
                              
 # --- User Contribution Form ---
@@ -219,7 +178,7 @@ with st.form("contribution_form", clear_on_submit=True):
     with c2:
         taste = st.slider("Taste Rating (1-10)", 1, 10, 7)
         portion = st.selectbox("Portion Size", ["Small", "Medium", "Large", "Extra Large"])
-        category = st.text_input("Dish Category", placeholder="e.g., Breakfast, Street Food")
+        new_category = st.text_input("Dish Category", placeholder="e.g., Breakfast, Street Food")
         desc = st.text_area("Description (optional)", placeholder="Crispy yam, spicy sauce, generous serving")
 
     submitted = st.form_submit_button("✅ Submit Entry", use_container_width=True)
@@ -228,32 +187,31 @@ with st.form("contribution_form", clear_on_submit=True):
         if not all([rest, food, price, loc]):
             st.error("Please fill in all required fields (*)")
         else:
-            # Create new row
-            new_entry = {
-                "restaurant": rest.strip().title(),
-                "food": food.strip().title(),
-                "price": price,
-                "taste": taste,
-                "location": loc.strip().title(),
-                "portion_size": portion,
-                "dish_category": category.strip().title() if category else "Uncategorized",
-                "description": desc.strip() if desc else None,
-                "source_url": "user_submission",
-                "votes_count": 1
-            }
-            
-            # Append to master CSV
+            # One append / insert through the store; no full-file rewrite
             try:
-                # Reload current data
-                current_df = pd.read_csv("ghana_restaurants_master.csv")
-                updated_df = pd.concat([current_df, pd.DataFrame([new_entry])], ignore_index=True)
-                updated_df.to_csv("ghana_restaurants_master.csv", index=False, encoding="utf-8")
-                
+                with instrumentation.request("add_dish", restaurant=rest, food=food, price=price):
+                    backend.add_dish(rest, food, price, taste, loc, portion, new_category, desc)
                 st.success("🎉 Thank you! Your submission helps the community find better meals.")
-                st.cache_data.clear()  # Clear cache so next search includes new data
             except Exception as e:
                 st.error(f"Failed to save: {e}")
 
+# --- Diagnostics panel ---
+def show_diagnostics(title, diag):
+    st.markdown(f"**{title}** — last {diag['requests']} requests")
+    if diag["cache_hit_rate"] is not None:
+        st.metric("Ranking cache hits", f"{diag['cache_hit_rate']:.0%}")
+    if diag["stages"]:
+        st.dataframe(pd.DataFrame(diag["stages"]), hide_index=True, use_container_width=True)
+
+if diagnostics_on:
+    with st.sidebar:
+        show_diagnostics("This app", instrumentation.summary())
+        if isinstance(backend, TastePriceClient):
+            try:
+                show_diagnostics("API worker", backend.diagnostics())
+            except (OSError, RuntimeError) as e:
+                st.caption(f"API diagnostics unavailable: {e}")
+
 # --- Footer ---
 st.markdown("---")
 st.caption("💡 Built for students, workers, and food lovers across Ghana. Data is crowdsourced — your input makes it better!")
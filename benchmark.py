@@ -0,0 +1,339 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from catalog import prepare_catalog
+from engine import RecommendationEngine
+from service import TastePrice
+from storage import CsvStore, SQLiteStore
+
+BASELINE = "benchmark_baseline.json"
+SIZES = [10_000, 100_000, 1_000_000]
+
+# ========== SYNTHETIC CATALOG ==========
+# (dish, category, typical price in GH₵), most ordered first
+DISHES = [
+    ("Jollof Rice", "Rice", 45), ("Waakye", "Rice", 30), ("Fried Rice", "Rice", 45),
+    ("Banku", "Local", 40), ("Fufu", "Local", 45), ("Kenkey", "Local", 25),
+    ("Red Red", "Local", 30), ("Kelewele", "Snacks", 15), ("Plain Rice", "Rice", 35),
+    ("Omo Tuo", "Local", 40), ("Tuo Zaafi", "Local", 30), ("Ampesi", "Local", 35),
+    ("Gari Foto", "Local", 25), ("Light Soup", "Soup", 40), ("Groundnut Soup", "Soup", 45),
+    ("Palm Nut Soup", "Soup", 45), ("Okro Stew", "Stew", 40), ("Kontomire Stew", "Stew", 35),
+    ("Abunuabunu", "Soup", 50), ("Etor", "Local", 30), ("Yam Chips", "Snacks", 30),
+    ("Kebab", "Grills", 20), ("Shawarma", "Fast Food", 55), ("Chicken Wings", "Grills", 60),
+    ("Indomie", "Fast Food", 30), ("Beans Stew", "Stew", 25), ("Grilled Tilapia", "Grills", 90),
+    ("Spaghetti", "Fast Food", 35), ("Koko", "Breakfast", 10), ("Hausa Koko", "Breakfast", 12),
+]
+PROTEINS = [("", 1.0), ("with Chicken", 1.3), ("with Tilapia", 1.6), ("with Goat", 1.5),
+            ("with Beef", 1.3), ("with Egg", 1.1), ("with Wele", 1.1), ("with Fish", 1.3),
+            ("Assorted", 1.8)]
+SIZES_LABELS = [("", 1.0), ("", 1.0), ("Small", 0.7), ("Regular", 1.0), ("Large", 1.4), ("Family", 2.5)]
+
+FIRST_NAMES = ["Auntie Ama", "Auntie Esi", "Mama Akos", "Sister Adjoa", "Papa Kofi", "Uncle Yaw",
+               "Maame Efua", "Obaapa", "Chef Kwame", "Nana Yaa", "Aunty Muni", "Hajia Fati",
+               "Kwesi", "Abena", "Mercy", "Faith", "Grace", "Blessed", "Osei", "Mensah"]
+SUFFIXES = ["Chop Bar", "Kitchen", "Spot", "Joint", "Restaurant", "Canteen", "Eatery",
+            "Local Dishes", "Fast Food", "Waakye"]
+LOCATIONS = ["Osu", "East Legon", "Madina", "Adenta", "Tema", "Kaneshie", "Dansoman", "Labone",
+             "Spintex", "Achimota", "Lapaz", "Kumasi"]
+LEET = {"e": "3", "a": "4", "o": "0", "i": "1"}
+
+
+def zipf_weights(n, s=1.1):
+    w = 1.0 / np.arange(1, n + 1) ** s
+    return w / w.sum()
+
+
+def typo(text, rng):
+    """One keyboard-style slip: dropped / doubled / swapped letter, leetspeak ("waaky3") or lower case."""
+    kind = rng.integers(5)
+    i = int(rng.integers(1, max(2, len(text) - 1)))
+    if kind == 0:
+        return text[:i] + text[i + 1:]
+    if kind == 1:
+        return text[:i] + text[i] + text[i:]
+    if kind == 2 and i + 1 < len(text):
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    if kind == 3:
+        spots = [j for j, c in enumerate(text.lower()) if c in LEET]
+        if spots:
+            j = spots[-1]
+            return (text[:j] + LEET[text[j].lower()] + text[j + 1:]).lower()
+    return text.lower()
+
+
+def synthetic_catalog(n, seed=0, typo_rate=0.08):
+    """
+    `n` master rows shaped like the real catalog: Zipf-popular Ghanaian
+    dishes with size / protein variants, restaurants of Zipf-distributed
+    menu sizes, lognormal prices around each dish's going rate, sparse
+    taste ratings and votes, and ~8% misspelled names.
+    """
+    rng = np.random.default_rng(seed)
+    m = 2 * n + 100  # (restaurant, food) duplicates are dropped below
+
+    # "<name> <suffix>", then branches: "<name> <suffix> <area>", "<name> <suffix> <area> 2", ...
+    n_rest = max(20, n // 40)
+    branch = np.arange(n_rest) // 200
+    rest_loc = np.where(branch > 0, branch % len(LOCATIONS), np.arange(n_rest) % len(LOCATIONS))
+    rest_names = np.array([f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {SUFFIXES[(i // len(FIRST_NAMES)) % len(SUFFIXES)]}"
+                           + (f" {LOCATIONS[rest_loc[i]]}" if branch[i] else "")
+                           + (f" {branch[i] // len(LOCATIONS) + 1}" if branch[i] >= len(LOCATIONS) else "")
+                           for i in range(n_rest)])
+    rest = rng.choice(n_rest, size=m, p=zipf_weights(n_rest, 0.8))
+    dish = rng.choice(len(DISHES), size=m, p=zipf_weights(len(DISHES)))
+    protein = rng.integers(len(PROTEINS), size=m)
+    size = rng.integers(len(SIZES_LABELS), size=m)
+
+    names = np.array([d[0] for d in DISHES], dtype=object)
+    food = pd.Series([" ".join(p for p in parts if p) for parts in
+                      zip(np.array([s[0] for s in SIZES_LABELS], dtype=object)[size], names[dish],
+                          np.array([p[0] for p in PROTEINS], dtype=object)[protein])])
+    slips = np.flatnonzero(rng.random(m) < typo_rate)
+    food.iloc[slips] = [typo(food.iloc[i], rng) for i in slips]
+
+    base = np.array([d[2] for d in DISHES], dtype=float)[dish]
+    price = (base * np.array([p[1] for p in PROTEINS])[protein] * np.array([s[1] for s in SIZES_LABELS])[size]
+             * rng.lognormal(0.0, 0.25, size=m))
+    price = np.round(price * 2) / 2
+    price[rng.random(m) < 0.03] = np.nan  # "ask the vendor"
+    taste = np.round(np.clip(rng.normal(7.0, 1.3, size=m), 1, 10), 1)
+    taste[rng.random(m) < 0.3] = np.nan
+    votes = np.where(rng.random(m) < 0.05, 1 + rng.geometric(0.3, size=m), 1)
+
+    df = pd.DataFrame({
+        "restaurant": rest_names[rest],
+        "food": food.to_numpy(),
+        "price": price,
+        "taste": taste,
+        "location": np.array(LOCATIONS)[rest_loc[rest]],
+        "portion_size": "N/A",
+        "dish_category": np.array([d[1] for d in DISHES])[dish],
+        "description": np.nan,
+        "source_url": "synthetic",
+        "votes_count": votes,
+    })
+    key = df["restaurant"].str.lower() + "\x00" + df["food"].str.lower()
+    return df[~key.duplicated()].head(n).reset_index(drop=True)
+
+
+def workload(df, seed=0, queries=500, suggestions=300, ratings=200):
+    """
+    Search queries (popular dishes, 30% misspelled), a location for each,
+    leaderboard filters, typeahead prefixes and votes on existing rows.
+    """
+    rng = np.random.default_rng(seed + 1)
+    dish = rng.choice(len(DISHES), size=queries, p=zipf_weights(len(DISHES)))
+    search = []
+    for d in dish:
+        q = DISHES[d][0]
+        if rng.random() < 0.2:
+            q = f"{q} {PROTEINS[rng.integers(1, len(PROTEINS))][0]}"
+        search.append(typo(q, rng) if rng.random() < 0.3 else q)
+    biases = rng.choice([0.0, 0.25, 0.5, 0.75, 1.0], size=queries)
+
+    picks = df.iloc[rng.integers(len(df), size=suggestions)]
+    suggest = [(r[:rng.integers(3, 8)], f[:rng.integers(0, 6)])
+               for r, f in zip(picks["restaurant"], picks["food"])]
+
+    priced = df[df["price"].notna()]
+    rated = priced.iloc[rng.integers(len(priced), size=ratings)]
+    rate = list(zip(rated["restaurant"], rated["food"], rng.integers(1, 11, size=ratings).astype(float).tolist()))
+
+    locations = rng.choice(LOCATIONS, size=queries).tolist()
+    categories = sorted({c for _, c, _ in DISHES})
+    # half location only, 30% location + category, 20% category only
+    browse = [(loc if r < 0.8 else "", str(rng.choice(categories)) if r >= 0.5 else "", b)
+              for loc, r, b in zip(locations, rng.random(queries), biases.tolist())]
+    return {"search": list(zip(search, biases.tolist())), "located": list(zip(search, biases.tolist(), locations)),
+            "browse": browse, "suggest": suggest, "rate": rate}
+
+
+# ========== MEASUREMENT ==========
+def measure(fn, inputs, memory_calls=20, reset=None):
+    """
+    Latency percentiles and throughput of fn(*args) over `inputs`, then
+    peak traced allocation (tracemalloc) over the first `memory_calls`
+    calls, in a second pass so tracing does not skew the timings.
+    `reset` runs before that pass (e.g. to drop caches the first warmed).
+    """
+    times = np.empty(len(inputs))
+    started = time.perf_counter()
+    for i, args in enumerate(inputs):
+        t = time.perf_counter()
+        fn(*args)
+        times[i] = time.perf_counter() - t
+    wall = time.perf_counter() - started
+
+    if reset is not None:
+        reset()
+    tracemalloc.start()
+    for args in inputs[:memory_calls]:
+        fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(times, [50, 95, 99]) * 1000
+    return {"calls": len(inputs), "p50_ms": round(p50, 4), "p95_ms": round(p95, 4), "p99_ms": round(p99, 4),
+            "mean_ms": round(times.mean() * 1000, 4), "throughput_per_s": round(len(inputs) / wall, 1),
+            "peak_mib": round(peak / 2 ** 20, 2)}
+
+
+def make_store(backend, workdir):
+    if backend == "sqlite":
+        return SQLiteStore(os.path.join(workdir, "bench.db"))
+    return CsvStore(os.path.join(workdir, "bench_master.csv"), os.path.join(workdir, "bench_events.jsonl"))
+
+
+def bench_size(n, backend="csv", seed=0, loads=3, **sizes):
+    """
+    Every stage on an n-row synthetic catalog:
+
+      load_data  : cold start from the store (parse + prepare + index
+                   build + snapshot write), then from the snapshot
+      recommend  : fuzzy match + rank (TastePrice.recommend)
+      recommend (semantic) : the same queries through TF-IDF retrieval
+      recommend (location) : the same queries filtered to one location
+      leaderboard : best value per location / category at the
+                   materialized cheap_bias levels
+      suggest    : rating-form (restaurant, food) suggestions
+      add_rating : record a vote and fold it into the shared engine
+    """
+    workdir = tempfile.mkdtemp(prefix="tasteprice-bench-")
+    try:
+        df = synthetic_catalog(n, seed)
+        work = workload(df, seed, **sizes)
+        store = make_store(backend, workdir)
+        store.replace_catalog(df)
+
+        def cold():
+            shutil.rmtree(store.snapshot_dir, ignore_errors=True)
+            return TastePrice(store)
+
+        results = {"load_data (cold)": measure(cold, [()] * loads, memory_calls=1)}
+        results["load_data (snapshot)"] = measure(lambda: TastePrice(store), [()] * loads, memory_calls=1)
+
+        app = TastePrice(store)
+        results["recommend"] = measure(lambda q, b: app.recommend(q, cheap_bias=b), work["search"],
+                                       reset=app.engine._clear_rankings)
+        results["recommend (semantic)"] = measure(lambda q, b: app.recommend(q, cheap_bias=b, mode="semantic"),
+                                                  work["search"], reset=app.engine._clear_rankings)
+        results["recommend (location)"] = measure(lambda q, b, l: app.recommend(q, cheap_bias=b, location=l),
+                                                  work["located"], reset=app.engine._clear_rankings)
+        results["leaderboard"] = measure(lambda l, c, b: app.leaderboard(l, c, cheap_bias=b), work["browse"],
+                                         reset=app.engine._boards.clear)
+        results["suggest"] = measure(lambda r, f: app.suggest(restaurant=r, food=f), work["suggest"])
+        results["add_rating"] = measure(app.rate, work["rate"])
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ========== MEMORY ==========
+def memory_report(df):
+    """
+    Bytes per row of the catalog a worker holds, per column: the frame
+    prepare_catalog builds (strings, float64, five derived columns) against
+    the engine's compact layout (categoricals, float32 / int32 arrays,
+    description store counted as loaded). Search indexes are left out of
+    both; the old engine's own float64 arrays are left out of "before".
+    """
+    prepared = prepare_catalog(df)
+    before = prepared.memory_usage(deep=True) / len(prepared)
+    after = RecommendationEngine(prepared).memory_usage() / len(prepared)
+    parts = list(before.index) + [name for name in after.index if name not in before.index]
+    table = pd.DataFrame({"before": before, "after": after}).reindex(parts).fillna(0)
+    table.loc["total"] = table.sum()
+    return table.round(1)
+
+
+# ========== BASELINE ==========
+def compare(results, baseline, tolerance=0.25, min_delta_ms=0.5):
+    """
+    Regressions against a saved run: p95 latency or peak memory up, or
+    throughput down, by more than `tolerance` (and p95 by at least
+    `min_delta_ms`, so sub-millisecond jitter is not flagged).
+    """
+    flagged = []
+    for size, stages in results["sizes"].items():
+        for stage, now in stages.items():
+            then = baseline.get("sizes", {}).get(size, {}).get(stage)
+            if then is None:
+                continue
+            if now["p95_ms"] > then["p95_ms"] * (1 + tolerance) and now["p95_ms"] - then["p95_ms"] >= min_delta_ms:
+                flagged.append(f"{size} rows / {stage}: p95 {then['p95_ms']:.2f} → {now['p95_ms']:.2f} ms")
+            if now["throughput_per_s"] < then["throughput_per_s"] / (1 + tolerance):
+                flagged.append(f"{size} rows / {stage}: throughput {then['throughput_per_s']:.0f} → "
+                               f"{now['throughput_per_s']:.0f}/s")
+            if now["peak_mib"] > then["peak_mib"] * (1 + tolerance) and now["peak_mib"] - then["peak_mib"] >= 1:
+                flagged.append(f"{size} rows / {stage}: peak {then['peak_mib']:.1f} → {now['peak_mib']:.1f} MiB")
+    return flagged
+
+
+def report(results):
+    rows = [{"rows": size, "stage": stage, **stats}
+            for size, stages in results["sizes"].items() for stage, stats in stages.items()]
+    return pd.DataFrame(rows).to_markdown(index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency / throughput / memory benchmark of the recommendation path")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="synthetic catalog sizes (rows)")
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--suggestions", type=int, default=300)
+    parser.add_argument("--ratings", type=int, default=200)
+    parser.add_argument("--loads", type=int, default=3, help="timed cold / snapshot loads per size")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("--out", default=None, help="also write this run as JSON")
+    parser.add_argument("--memory", action="store_true", help="only print bytes per row, old vs compact layout")
+    args = parser.parse_args()
+
+    if args.memory:
+        for n in args.sizes:
+            print(f"\n🧮 {n} rows, bytes per row:\n")
+            print(memory_report(synthetic_catalog(n, args.seed)).to_markdown())
+        raise SystemExit(0)
+
+    results = {"backend": args.backend, "seed": args.seed, "python": platform.python_version(),
+               "machine": platform.machine(), "cpus": os.cpu_count(), "created_at": time.time(), "sizes": {}}
+    for n in args.sizes:
+        print(f"⏱️ {n} rows ({args.backend})...")
+        results["sizes"][str(n)] = bench_size(n, args.backend, args.seed, args.loads, queries=args.queries,
+                                              suggestions=args.suggestions, ratings=args.ratings)
+    print("\n📊 BENCHMARK:\n")
+    print(report(results))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+
+    status = 0
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+        print(f"\n💾 Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("backend") != args.backend:
+            print(f"\n⚠️ Baseline was recorded on the {baseline.get('backend')} backend; not comparing")
+        else:
+            flagged = compare(results, baseline, args.tolerance)
+            for line in flagged:
+                print(f"❌ Regression: {line}")
+            if not flagged:
+                print(f"\n✅ No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+            status = 1 if flagged else 0
+    raise SystemExit(status)
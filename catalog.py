@@ -0,0 +1,141 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+# Repeated text columns, held as pandas categoricals: a small integer code
+# per row and every distinct value once
+CATEGORICAL_COLUMNS = ["restaurant", "location", "portion_size", "dish_category", "source_url"]
+# What prepare_catalog adds for ranking; the engine keeps price_norm /
+# taste_norm in its own arrays and computes the rest for displayed rows
+DERIVED_COLUMNS = ["price_norm", "taste_norm", "popularity_weight", "weighted_score", "score"]
+
+
+def popularity_weight(votes):
+    """max(1, votes) ** 0.2 — dampened so popular dishes don't dominate."""
+    return np.maximum(votes, 1) ** 0.2
+
+
+def min_max(values):
+    """(min, scale) exactly as MinMaxScaler fits them; a zero range scales by 1."""
+    lo, hi = float(np.min(values)), float(np.max(values))
+    return lo, (hi - lo) or 1.0
+
+
+def prepare_catalog(df):
+    """Coerce types and add the normalized / popularity columns used for ranking."""
+    df = df.copy()
+    df['price'] = pd.to_numeric(df['price'], errors='coerce')
+    df['taste'] = pd.to_numeric(df['taste'], errors='coerce')
+    df = df.dropna(subset=["price"])
+
+    # 🔥 CRITICAL: Ensure 'votes_count' exists
+    if 'votes_count' not in df.columns:
+        df['votes_count'] = 1  # Default to 1 vote for all existing entries
+    else:
+        df['votes_count'] = pd.to_numeric(df['votes_count'], errors='coerce').fillna(1).astype(int)
+
+    # Normalize
+    scaler = MinMaxScaler()
+    df['price_norm'] = 1 - scaler.fit_transform(df[['price']])
+    df['taste_norm'] = scaler.fit_transform(df[['taste']].fillna(0))
+
+    # Optional: Weight score by popularity (log scale to avoid dominance)
+    df['popularity_weight'] = popularity_weight(df['votes_count'].fillna(1))
+    df['weighted_score'] = df['price_norm'] * 0.5 + df['taste_norm'] * 0.5
+    df['score'] = df['weighted_score'] * df['popularity_weight']
+
+    return df
+
+
+# ========== COMPACT LAYOUT ==========
+class Descriptions:
+    """
+    Dish descriptions, kept beside the catalog frame instead of in it: an
+    int32 code per row into a table of distinct texts (-1 = none). Most
+    rows have none and only result cards and the semantic index read them,
+    so the table can come as a `loader` that is called on first use.
+    """
+
+    def __init__(self, codes, texts=None, loader=None):
+        self.codes = codes
+        self._texts = texts
+        self._loader = loader
+        self._table = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_values(cls, values):
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+        return cls(codes.astype(np.int32), [str(u) for u in uniques])
+
+    @property
+    def texts(self):
+        if self._texts is None:
+            with self._lock:
+                if self._texts is None:
+                    self._texts = list(self._loader())
+                    self._loader = None
+        return self._texts
+
+    def take(self, rows):
+        """Descriptions of these row positions (NaN where there is none)."""
+        table = self._table
+        if table is None:
+            table = self._table = np.array(self.texts + [np.nan], dtype=object)
+        return table[self.codes[rows]]
+
+    def append(self, text):
+        self.codes = np.append(self.codes, self._code(text))
+
+    def set(self, i, text):
+        self.codes[i] = self._code(text)
+
+    def _code(self, text):
+        if text is None or text != text or not str(text).strip():
+            return -1
+        texts = self.texts
+        texts.append(str(text))
+        self._table = None
+        return len(texts) - 1
+
+    def state(self):
+        return {"codes": self.codes, "texts": self.texts}
+
+    def nbytes(self):
+        """Codes plus the UTF-8 size of the texts (reading them if they are not loaded yet)."""
+        return self.codes.nbytes + sum(len(t.encode("utf-8")) for t in self.texts)
+
+
+def compact_catalog(df):
+    """
+    The prepared catalog in its in-memory layout: CATEGORICAL_COLUMNS (and
+    food, when names repeat) as categoricals, price / taste float32,
+    votes_count int32, no derived columns, and the descriptions split off.
+    Returns (frame, Descriptions, or None when there is no description column).
+    """
+    df = df.drop(columns=[c for c in DERIVED_COLUMNS if c in df.columns])
+    descriptions = df.pop("description") if "description" in df.columns else None
+    interned = [c for c in CATEGORICAL_COLUMNS if c in df.columns]
+    if "food" in df.columns and df["food"].nunique() * 2 <= len(df):
+        interned.append("food")
+    df = df.astype({**{c: "category" for c in interned},
+                    "price": np.float32, "taste": np.float32, "votes_count": np.int32})
+    return df, None if descriptions is None else Descriptions.from_values(descriptions)
+
+
+def with_categories(df, values):
+    """
+    `df` with the categories of its categorical columns extended by
+    {column: [values]} that are not categories yet, so cells can be set
+    to them and rows holding them appended without falling back to object.
+    """
+    grown = {}
+    for column, new in values.items():
+        dtype = df[column].dtype if column in df.columns else None
+        if isinstance(dtype, pd.CategoricalDtype):
+            missing = [v for v in dict.fromkeys(new) if pd.notna(v) and v not in dtype.categories]
+            if missing:
+                grown[column] = df[column].cat.add_categories(missing)
+    return df.assign(**grown) if grown else df
@@ -1,5 +1,19 @@
+import argparse
+import csv
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
+
+BASE_URL = "https://api.chowdeck.com"
+OUTPUT_CSV = "chowdeck_full_dump.csv"
 
 # Always be polite with headers
 headers = {
@@ -7,84 +21,275 @@ headers = {
     "Accept": "application/json"
 }
 
-# Example: a few vendors (replace with your full vendor dict with names)
-vendors = {
-    "https://api.chowdeck.com/customer/vendor/117067/menu": "KFC",
-    "https://api.chowdeck.com/customer/vendor/120564/menu": "Just Taste",
-    "https://api.chowdeck.com/customer/vendor/116436/menu": "Bliss on Plate",
-    "https://api.chowdeck.com/customer/vendor/118542/menu": "Pizzaman Chickenman",
-    "https://api.chowdeck.com/customer/vendor/119220/menu": "Pious Fast Food",
-    "https://api.chowdeck.com/customer/vendor/117306/menu": "Papaye",
-    "https://api.chowdeck.com/customer/vendor/119326/menu": "Pizza Hut",
-    "https://api.chowdeck.com/customer/vendor/117051/menu": "Papa’s Pizza",
-    "https://api.chowdeck.com/customer/vendor/124955/menu": "Faridish",
-    "https://api.chowdeck.com/customer/vendor/124548/menu": "Dowu’s Kitchen",
-    "https://api.chowdeck.com/customer/vendor/124476/menu": "Hotdog Avenue",
-    "https://api.chowdeck.com/customer/vendor/124117/menu": "Floka Eatery",
-    "https://api.chowdeck.com/customer/vendor/123014/menu": "Cups and Cones",
-    "https://api.chowdeck.com/customer/vendor/119442/menu": "Pinkberry",
-    "https://api.chowdeck.com/customer/vendor/120768/menu": "Jollof Express by Yes Chef",
-    "https://api.chowdeck.com/customer/vendor/120534/menu": "Yendidi",
-    "https://api.chowdeck.com/customer/vendor/120429/menu": "Fasee Pork Joint",
-    "https://api.chowdeck.com/customer/vendor/120060/menu": "Delibeli Restaurant and Bar",
-    "https://api.chowdeck.com/customer/vendor/120051/menu": "10:10 Joint",
-    "https://api.chowdeck.com/customer/vendor/119880/menu": "Kiss Burger and Wraps Bar",
-    "https://api.chowdeck.com/customer/vendor/119441/menu": "Cherry’s Mini Pizza",
-    "https://api.chowdeck.com/customer/vendor/119074/menu": "JarToGo Smart-food Hub",
-    "https://api.chowdeck.com/customer/vendor/121757/menu": "Cheezzy Pizza",
-    "https://api.chowdeck.com/customer/vendor/117105/menu": "HM Eatery",
-    "https://api.chowdeck.com/customer/vendor/117102/menu": "Munchy’s Ring Road",
-    "https://api.chowdeck.com/customer/vendor/117094/menu": "Asanka Restaurant",
-    "https://api.chowdeck.com/customer/vendor/117092/menu": "The Gold Coast Restaurant",
-    "https://api.chowdeck.com/customer/vendor/117082/menu": "Wonder Wings",
-    "https://api.chowdeck.com/customer/vendor/117073/menu": "Ninano Restaurant Osu",
-    "https://api.chowdeck.com/customer/vendor/117065/menu": "Yah Restaurant",
-    "https://api.chowdeck.com/customer/vendor/117063/menu": "Pinocchio Osu",
-    "https://api.chowdeck.com/customer/vendor/116945/menu": "Sikada",
-    "https://api.chowdeck.com/customer/vendor/119269/menu": "PS Banku and Tilapia",
-    "https://api.chowdeck.com/customer/vendor/118197/menu": "The Rumson Restaurant",
-    "https://api.chowdeck.com/customer/vendor/120670/menu": "Yehowada",
-    "https://api.chowdeck.com/customer/vendor/120421/menu": "Hi-tech Fast Foods",
-    "https://api.chowdeck.com/customer/vendor/119305/menu": "Express Noodles",
-    "https://api.chowdeck.com/customer/vendor/119384/menu": "Burkina Waakye",
-    "https://api.chowdeck.com/customer/vendor/116641/menu": "The Burger Booth",
-    "https://api.chowdeck.com/customer/vendor/119382/menu": "Burkina Banku and Kenkey",
-    "https://api.chowdeck.com/customer/vendor/119772/menu": "Pinkie’s Bistro",
-    "https://api.chowdeck.com/customer/vendor/121417/menu": "Yes Chef Osu",
-    "https://api.chowdeck.com/customer/vendor/120221/menu": "Junkies Burger",
-    "https://api.chowdeck.com/customer/vendor/119272/menu": "Awo Aduane",
-    "https://api.chowdeck.com/customer/vendor/119380/menu": "Burkina Tasty Fries",
-    "https://api.chowdeck.com/customer/vendor/120106/menu": "Licks Eatery",
-    "https://api.chowdeck.com/customer/vendor/116540/menu": "Waakye Phobia",
-    "https://api.chowdeck.com/customer/vendor/126144/menu": "Ikie Catfish Joint",
-    "https://api.chowdeck.com/customer/vendor/126144/menu": "Burkina Red Red",
-    "https://api.chowdeck.com/customer/vendor/117072/menu": "Peter Pan Osu",
-    "https://api.chowdeck.com/customer/vendor/120230/menu": "Golden Shawarma Palace",
-    "https://api.chowdeck.com/customer/vendor/120056/menu": "Deli Locals",
-    "https://api.chowdeck.com/customer/vendor/116853/menu": "Wok Boyz Osu",
-    "https://api.chowdeck.com/customer/vendor/116452/menu": "Chickie’s Restaurant",
-    "https://api.chowdeck.com/customer/vendor/117080/menu": "Champs and Pataase Restaurant",
-    "https://api.chowdeck.com/customer/vendor/122964/menu": "Garden District Kitchen"
-}
+# (Chowdeck vendor id, restaurant name)
+vendors = [
+    (117067, "KFC"),
+    (120564, "Just Taste"),
+    (116436, "Bliss on Plate"),
+    (118542, "Pizzaman Chickenman"),
+    (119220, "Pious Fast Food"),
+    (117306, "Papaye"),
+    (119326, "Pizza Hut"),
+    (117051, "Papa’s Pizza"),
+    (124955, "Faridish"),
+    (124548, "Dowu’s Kitchen"),
+    (124476, "Hotdog Avenue"),
+    (124117, "Floka Eatery"),
+    (123014, "Cups and Cones"),
+    (119442, "Pinkberry"),
+    (120768, "Jollof Express by Yes Chef"),
+    (120534, "Yendidi"),
+    (120429, "Fasee Pork Joint"),
+    (120060, "Delibeli Restaurant and Bar"),
+    (120051, "10:10 Joint"),
+    (119880, "Kiss Burger and Wraps Bar"),
+    (119441, "Cherry’s Mini Pizza"),
+    (119074, "JarToGo Smart-food Hub"),
+    (121757, "Cheezzy Pizza"),
+    (117105, "HM Eatery"),
+    (117102, "Munchy’s Ring Road"),
+    (117094, "Asanka Restaurant"),
+    (117092, "The Gold Coast Restaurant"),
+    (117082, "Wonder Wings"),
+    (117073, "Ninano Restaurant Osu"),
+    (117065, "Yah Restaurant"),
+    (117063, "Pinocchio Osu"),
+    (116945, "Sikada"),
+    (119269, "PS Banku and Tilapia"),
+    (118197, "The Rumson Restaurant"),
+    (120670, "Yehowada"),
+    (120421, "Hi-tech Fast Foods"),
+    (119305, "Express Noodles"),
+    (119384, "Burkina Waakye"),
+    (116641, "The Burger Booth"),
+    (119382, "Burkina Banku and Kenkey"),
+    (119772, "Pinkie’s Bistro"),
+    (121417, "Yes Chef Osu"),
+    (120221, "Junkies Burger"),
+    (119272, "Awo Aduane"),
+    (119380, "Burkina Tasty Fries"),
+    (120106, "Licks Eatery"),
+    (116540, "Waakye Phobia"),
+    (126144, "Ikie Catfish Joint"),
+    # 126144 was listed for both Ikie Catfish Joint and Burkina Red Red; its menu is
+    # all catfish, so it is Ikie's. Fill in Burkina Red Red's own id to scrape it.
+    (None, "Burkina Red Red"),
+    (117072, "Peter Pan Osu"),
+    (120230, "Golden Shawarma Palace"),
+    (120056, "Deli Locals"),
+    (116853, "Wok Boyz Osu"),
+    (116452, "Chickie’s Restaurant"),
+    (117080, "Champs and Pataase Restaurant"),
+    (122964, "Garden District Kitchen"),
+]
+
+# Menu item fields written to the dump, in its column order (new API fields are dropped)
+DUMP_COLUMNS = [
+    'id', 'group_id', 'rank', 'name', 'popular_name', 'description', 'menu_type',
+    'in_stock', 'is_published', 'is_active', 'price', 'currency', 'price_description',
+    'created_at', 'updated_at', 'container_type_id', 'menu_group_ids', 'reference',
+    'volume_per_portion', 'maximum_quantity', 'maximum_quantity_as_side',
+    'size_description', 'menu_sub_category_id', 'listing_price_factor', 'mark_up_price',
+    'commission_percent', 'review_status', 'reviewed_at', 'reviewed_by', 'review_reason',
+    'vendor_price', 'prep_time', 'existing_menu_ids', 'order_limits',
+    'stock_status_confirmed_at', 'estimated_prep_time',
+    'estimated_prep_time_last_refreshed_at', 'container_name', 'container_price',
+    'container_description', 'container_volume', 'discount', 'discounts', 'discount_price',
+    'discount_rank', 'tags', 'category', 'images', 'has_active_notification', 'restaurant',
+    'source_url'
+]
+
+
+def check_vendors(vendor_list):
+    """A vendor id listed twice would silently collapse two restaurants into one."""
+    seen = {}
+    for vendor_id, name in vendor_list:
+        if vendor_id is not None and vendor_id in seen:
+            raise ValueError(f"vendor {vendor_id} listed for both {seen[vendor_id]!r} and {name!r}")
+        seen[vendor_id] = name
+
+
+def menu_url(vendor_id, base_url=BASE_URL):
+    return f"{base_url.rstrip('/')}/customer/vendor/{vendor_id}/menu"
+
+
+# ========== FETCHING ==========
+class MenuFetcher:
+    """
+    Shared requests.Session (pooled keep-alive connections) with a cap on
+    concurrent requests per host and retries with exponential backoff on
+    connection errors, timeouts, 429 and 5xx.
+
+    concurrency : worker threads / pooled connections
+    per_host    : max in-flight requests to one host
+    retries     : extra attempts after the first
+    backoff     : base delay in seconds (doubles per attempt, plus jitter)
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, concurrency=16, per_host=8, retries=4, backoff=0.5, timeout=15):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._host_slots = {}
+        self._lock = threading.Lock()
 
+    def _slot(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
 
-all_rows = []
+    def _delay(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt * (1 + random.random())
 
-for url, restaurant_name in vendors.items():
-    try:
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        data_json = response.json()
-    except Exception as e:
-        print(f"⚠️ Error fetching {restaurant_name}: {e}")
-        continue
+    def get(self, url, headers=None):
+        """The final Response (2xx or 304) after retries; raises on anything else."""
+        for attempt in range(self.retries + 1):
+            try:
+                with self._slot(url):  # released before any backoff sleep
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(self._delay(attempt))
+                continue
+            if response.status_code in self.RETRY_STATUS and attempt < self.retries:
+                time.sleep(self._delay(attempt, response))
+                continue
+            response.raise_for_status()
+            return response
 
-    for dish in data_json.get("data", []):
+    def get_json(self, url):
+        return self.get(url).json()
+
+    def fetch_all(self, urls, fetch=None):
+        """Yield (url, fetch(url) or exception) in completion order; fetch defaults to get_json."""
+        fetch = fetch or self.get_json
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(fetch, url): url for url in urls}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result()
+                except Exception as e:
+                    yield futures[future], e
+
+
+def menu_rows(payload, restaurant_name, url):
+    for dish in payload.get("data", []):
         dish_copy = dish.copy()
         dish_copy["restaurant"] = restaurant_name
         dish_copy["source_url"] = url
-        all_rows.append(dish_copy)
+        yield dish_copy
+
+
+def scrape(out_path=OUTPUT_CSV, base_url=BASE_URL, fetcher=None, record_dir=None, vendor_list=None):
+    """
+    Fetch every vendor menu concurrently and stream its rows into
+    `out_path` as soon as that vendor completes (written to a temp file and
+    swapped in at the end). With record_dir, each raw response is also
+    saved as <vendor id>.json for the stand-in server. Returns (rows, failed vendor names).
+    """
+    vendor_list = vendors if vendor_list is None else vendor_list
+    check_vendors(vendor_list)
+    fetcher = fetcher or MenuFetcher()
+    by_url = {}
+    for vendor_id, name in vendor_list:
+        if vendor_id is None:
+            print(f"⚠️ Skipping {name}: vendor id unknown")
+            continue
+        by_url[menu_url(vendor_id, base_url)] = (vendor_id, name)
+    if record_dir:
+        os.makedirs(record_dir, exist_ok=True)
+
+    n_rows, failed = 0, []
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=DUMP_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        for url, payload in fetcher.fetch_all(by_url):
+            vendor_id, name = by_url[url]
+            if isinstance(payload, Exception):
+                print(f"⚠️ Error fetching {name}: {payload}")
+                failed.append(name)
+                continue
+            if record_dir:
+                with open(os.path.join(record_dir, f"{vendor_id}.json"), "w", encoding="utf-8") as rec:
+                    json.dump(payload, rec, ensure_ascii=False)
+            # source_url always names the real API, also when fetched from a stand-in
+            rows = list(menu_rows(payload, name, menu_url(vendor_id)))
+            writer.writerows(rows)
+            f.flush()
+            n_rows += len(rows)
+    os.replace(tmp_path, out_path)
+    return n_rows, failed
+
+
+# ========== STAND-IN SERVER ==========
+def serve_recorded(record_dir, port=8765, latency=0.0):
+    """
+    Serve recorded <vendor id>.json files at /customer/vendor/<id>/menu, so
+    the scraper can run offline with --base-url http://127.0.0.1:<port>.
+    `latency` adds a fixed delay per response to mimic the real API.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            path = None
+            if len(parts) == 4 and parts[:2] == ["customer", "vendor"] and parts[3] == "menu":
+                path = os.path.join(record_dir, f"{parts[2]}.json")
+            if path is None or not os.path.exists(path):
+                self.send_error(404)
+                return
+            time.sleep(latency)
+            with open(path, "rb") as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"📼 Serving recorded menus from {record_dir} on http://127.0.0.1:{port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chowdeck menu scraper")
+    parser.add_argument("--out", default=OUTPUT_CSV)
+    parser.add_argument("--base-url", default=BASE_URL, help="API root (point at the stand-in server for offline runs)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--per-host", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--record", metavar="DIR", help="also save each raw menu response into DIR")
+    parser.add_argument("--serve", metavar="DIR", help="run the stand-in server over recorded responses instead")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="stand-in server delay per response (s)")
+    args = parser.parse_args()
 
-df = pd.DataFrame(all_rows)
-df.to_csv("chowdeck_full_dump.csv", index=False)
-print(f"✅ Saved {len(df)} rows with ALL fields into chowdeck_full_dump.csv")
\ No newline at end of file
+    if args.serve:
+        serve_recorded(args.serve, args.port, args.latency)
+    else:
+        started = time.perf_counter()
+        fetcher = MenuFetcher(concurrency=args.concurrency, per_host=args.per_host, retries=args.retries)
+        n, failed = scrape(args.out, args.base_url, fetcher, record_dir=args.record)
+        print(f"✅ Saved {n} rows with ALL fields into {args.out} "
+              f"in {time.perf_counter() - started:.1f}s ({len(failed)} vendor(s) failed)")
@@ -0,0 +1,232 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+from chowdeck_scraper import BASE_URL, MenuFetcher, check_vendors, menu_url, vendors
+from storage import dish_key, get_store
+
+SYNC_STATE = "chowdeck_sync_state.json"
+DELTA_LOG = "chowdeck_deltas.jsonl"
+
+# Item fields whose change is worth looking at; anything else (ranks, discounts,
+# review metadata) changes often and never reaches the catalog
+TRACKED_FIELDS = ("name", "price", "category", "in_stock", "is_published", "is_active")
+
+
+# ========== ITEM → CATALOG ROW ==========
+def is_listed(item):
+    """Unpublished / deactivated items leave the catalog; out-of-stock ones stay (and keep their votes)."""
+    return item.get("is_published") is not False and item.get("is_active") is not False
+
+
+def item_hash(item):
+    payload = json.dumps({k: item.get(k) for k in TRACKED_FIELDS}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def clean_text(value):
+    """Whitespace stripped and collapsed, as in the curated catalog ("Streetwise 2  Rice\n" -> "Streetwise 2 Rice")."""
+    return " ".join(str(value or "").split())
+
+
+def catalog_fields(item):
+    """The catalog columns a menu item owns (taste / votes belong to the crowd)."""
+    category = item.get("category")
+    if isinstance(category, dict):
+        category = category.get("name")
+    price = pd.to_numeric(item.get("price"), errors="coerce")
+    return {
+        "food": clean_text(item.get("name")),
+        # API prices are in pesewas; 0 means "ask the vendor", unpriced like at ingest
+        "price": None if pd.isna(price) or price <= 0 else float(price) / 100,
+        "dish_category": clean_text(category) or "Uncategorized",
+    }
+
+
+def catalog_row(item, restaurant_name):
+    """New master row for a menu item, same shape as the ingested chowdeck rows."""
+    fields = catalog_fields(item)
+    return {"restaurant": restaurant_name, "food": fields["food"], "price": fields["price"], "taste": None,
+            "location": "Accra", "portion_size": "N/A", "dish_category": fields["dish_category"],
+            "description": None, "source_url": "chowdeck", "votes_count": 1}
+
+
+# ========== DIFF ==========
+def diff_vendor(vendor_id, restaurant_name, items, previous, known=None):
+    """
+    Compare one vendor's fresh menu with its saved state.
+
+    previous : {item id: {"updated_at", "hash", "fields"}} from the last
+               sync, or None on the first sync of this vendor
+    known    : {dish key: current catalog fields}; only needed on a first
+               sync, so items already in the catalog become updates
+               instead of duplicate inserts
+
+    The catalog holds one row per (restaurant, food), owned by the first
+    listing of that dish. A vendor listing a dish twice keeps the row as
+    long as either listing is live; when the owner goes, the twin takes
+    the row over (and updates it if its fields differ).
+
+    Returns (deltas, new state). Unchanged items cost one hash each.
+    """
+    deltas, state, owned = [], {}, set()
+    previous = previous or {}
+    base = {"vendor_id": vendor_id, "restaurant": restaurant_name}
+    owners = {}  # dish key -> item id that owned its row at the last sync
+    for item_id, old in previous.items():
+        if old["fields"]["food"].strip():
+            owners.setdefault(dish_key(restaurant_name, clean_text(old["fields"]["food"])), item_id)
+
+    for item in items:
+        if item.get("id") is None or not is_listed(item):
+            continue
+        item_id = str(item["id"])
+        digest = item_hash(item)
+        fields = catalog_fields(item)
+        state[item_id] = {"updated_at": item.get("updated_at"), "hash": digest, "fields": fields}
+        key = dish_key(restaurant_name, fields["food"])
+        if not fields["food"].strip() or key in owned:
+            continue
+        owned.add(key)
+
+        owner = owners.get(key)
+        old = None
+        if owner is not None:
+            old = previous[owner]
+            if owner != item_id:  # handed over from a twin listing: compare fields, not hashes
+                old = {**old, "hash": None}
+        elif known is not None and key in known:
+            old = {"hash": None, "fields": known[key]}
+        if old is None:
+            deltas.append({**base, "op": "insert", "item_id": item_id, "row": catalog_row(item, restaurant_name)})
+            continue
+        if old["hash"] == digest:
+            continue
+        if (old["fields"]["price"] is None) != (fields["price"] is None):
+            # (un)priced: unpriced rows are not in the engine, so the row is replaced whole
+            deltas.append({**base, "op": "remove", "item_id": item_id, "food": old["fields"]["food"]})
+            deltas.append({**base, "op": "insert", "item_id": item_id, "row": catalog_row(item, restaurant_name)})
+            continue
+        changed = {c: v for c, v in fields.items() if c != "food" and old["fields"].get(c) != v}
+        if changed:
+            deltas.append({**base, "op": "update", "item_id": item_id, "food": old["fields"]["food"],
+                           "fields": changed})
+
+    # rows whose dish no listing carries any more (delisted, or renamed away)
+    for key, item_id in owners.items():
+        if key not in owned:
+            deltas.append({**base, "op": "remove", "item_id": item_id, "food": previous[item_id]["fields"]["food"]})
+    return deltas, state
+
+
+def apply_deltas(store, deltas):
+    """Write deltas through the store; running engines pick them up on their next sync()."""
+    for delta in deltas:
+        if delta["op"] == "insert":
+            if delta["row"]["price"] is not None:
+                store.record_new_dish(delta["row"])
+        elif delta["op"] == "update":
+            store.record_dish_update(delta["restaurant"], delta["food"], delta["fields"])
+        elif delta["op"] == "remove":
+            store.record_dish_removal(delta["restaurant"], delta["food"])
+    store.maybe_compact()
+
+
+def known_dishes(store):
+    """
+    {dish key: catalog fields} of the chowdeck rows already in the catalog
+    (first sync only), keyed on clean_text(food) like catalog_fields.
+    """
+    df, _ = store.load()
+    df = df[df["source_url"] == "chowdeck"]
+    price = pd.to_numeric(df["price"], errors="coerce")
+    known = {}
+    for restaurant, food, p, category in zip(df["restaurant"], df["food"], price, df["dish_category"]):
+        known.setdefault(dish_key(restaurant, clean_text(food)), {
+            "food": str(food), "price": None if pd.isna(p) else float(p),
+            "dish_category": (clean_text(category) if isinstance(category, str) else "") or "Uncategorized"})
+    return known
+
+
+# ========== SYNC ==========
+def load_state(path=SYNC_STATE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, path=SYNC_STATE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def sync(store=None, fetcher=None, base_url=BASE_URL, state_path=SYNC_STATE, delta_path=DELTA_LOG,
+         vendor_list=None, dry_run=False):
+    """
+    Fetch every menu, diff it against the saved per-vendor state, append
+    the deltas to `delta_path` and apply them to the catalog. Vendors that
+    fail to fetch keep their old state and produce no removals.
+    Returns {"insert": n, "update": n, "remove": n, "failed": [...]}.
+    """
+    vendor_list = vendors if vendor_list is None else vendor_list
+    check_vendors(vendor_list)
+    store = store if store is not None else get_store()
+    fetcher = fetcher or MenuFetcher()
+    state = load_state(state_path)
+    by_url = {menu_url(v, base_url): (v, name) for v, name in vendor_list if v is not None}
+
+    known = None
+    if any(str(v) not in state for v, _ in by_url.values()):
+        known = known_dishes(store) if store.exists() else {}
+
+    all_deltas, failed = [], []
+    for url, payload in fetcher.fetch_all(by_url):
+        vendor_id, name = by_url[url]
+        if isinstance(payload, Exception):
+            print(f"⚠️ Error fetching {name}: {payload}")
+            failed.append(name)
+            continue
+        previous = state.get(str(vendor_id))
+        deltas, vendor_state = diff_vendor(vendor_id, name, payload.get("data", []),
+                                           previous and previous["items"],
+                                           known if previous is None else None)
+        all_deltas.extend(deltas)
+        state[str(vendor_id)] = {"restaurant": name, "synced_at": time.time(), "items": vendor_state}
+
+    counts = {op: sum(d["op"] == op for d in all_deltas) for op in ("insert", "update", "remove")}
+    if dry_run:
+        return {**counts, "failed": failed, "deltas": all_deltas}
+    if all_deltas:
+        with open(delta_path, "a", encoding="utf-8") as f:
+            for delta in all_deltas:
+                f.write(json.dumps({**delta, "ts": time.time()}, ensure_ascii=False) + "\n")
+        apply_deltas(store, all_deltas)
+    save_state(state, state_path)
+    return {**counts, "failed": failed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental Chowdeck menu sync")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--state", default=SYNC_STATE)
+    parser.add_argument("--deltas", default=DELTA_LOG)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--per-host", type=int, default=8)
+    parser.add_argument("--dry-run", action="store_true", help="print the deltas, change nothing")
+    args = parser.parse_args()
+
+    fetcher = MenuFetcher(concurrency=args.concurrency, per_host=args.per_host)
+    result = sync(fetcher=fetcher, base_url=args.base_url, state_path=args.state,
+                  delta_path=args.deltas, dry_run=args.dry_run)
+    if args.dry_run:
+        for delta in result["deltas"]:
+            print(json.dumps(delta, ensure_ascii=False))
+    print(f"✅ Chowdeck sync: {result['insert']} new, {result['update']} changed, "
+          f"{result['remove']} removed ({len(result['failed'])} vendor(s) failed)")
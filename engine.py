@@ -0,0 +1,1073 @@
+import heapq
+import os
+import threading
+import zipfile
+from bisect import bisect_right
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from catalog import Descriptions, compact_catalog, min_max, popularity_weight, prepare_catalog, with_categories
+from instrumentation import count, note, stage
+from personalize import TasteFactors
+from search_index import (DishKeyIndex, DishNameIndex, FacetIndex, RowTokenIndex, SemanticIndex, Typeahead,
+                          normalize_name)
+from snapshot import current_version, load_snapshot, publish_lock, save_snapshot
+from storage import EVENT_LOG, MASTER_CSV, CsvStore, dish_key
+
+# cheap_bias levels whose per-location / per-category leaderboards are
+# materialized, the longest leaderboard served from them, and how many rows
+# each keeps (the slack absorbs rows falling off before a rescore)
+LEADERBOARD_BIASES = (0.0, 0.25, 0.5, 0.75, 1.0)
+LEADERBOARD_SIZE = 20
+LEADERBOARD_DEPTH = 100
+
+# Per-row arrays; added dishes fill spare capacity behind them (see _extend)
+ROW_ARRAYS = ("price", "taste", "votes_count", "price_norm", "taste_norm", "alive")
+
+
+def top_k_positions(scores, k):
+    """
+    Positions of the k largest scores, best first.
+    argpartition is O(n); only the k winners get fully sorted.
+    """
+    n = len(scores)
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        winners = np.flatnonzero(scores >= kth)
+    else:
+        winners = np.arange(n)
+    # ties broken by position keeps results deterministic
+    order = np.lexsort((winners, -scores[winners]))
+    return winners[order[:k]]
+
+
+def exact_floats(values):
+    """float32 values as the float64 that prints the same (12.99, not 12.989999771118164)."""
+    return np.asarray(values).astype(str).astype(np.float64)
+
+
+def k_skyband(p, t, k):
+    """
+    Positions of the points that are beaten by fewer than k others on both
+    price_norm and taste_norm. A point outside the k-skyband is below at
+    least k others for every cheap_bias in [0, 1], so it can never make the
+    top k. Ties are broken by position, the same way ranking does.
+    """
+    n = len(p)
+    if n <= k:
+        return np.arange(n)
+
+    # Cheap vectorized pass: prune anything dominated by k of a small
+    # reference set (leaders on each axis and at bias 0.5).
+    ref = np.unique(np.concatenate([
+        top_k_positions(t, 2 * k), top_k_positions(p, 2 * k), top_k_positions(p + t, 2 * k),
+    ]))
+    pos = np.arange(n)
+    rp, rt, rpos = p[ref][:, None], t[ref][:, None], pos[ref][:, None]
+    ahead_t = (rt > t) | ((rt == t) & (rpos < pos))
+    ahead_p = (rp > p) | ((rp == p) & (rpos < pos))
+    survivors = np.flatnonzero((ahead_t & ahead_p).sum(axis=0) < k)
+
+    # Exact pass on the survivors: sweep by taste (desc), keep the k best
+    # (price, -position) keys seen so far in a min-heap.
+    order = survivors[np.lexsort((survivors, -t[survivors]))]
+    heap, keep = [], []
+    for i in order:
+        key = (p[i], -i)
+        if len(heap) < k or key > heap[0]:
+            keep.append(i)
+        if len(heap) < k:
+            heapq.heappush(heap, key)
+        elif key > heap[0]:
+            heapq.heapreplace(heap, key)
+    return np.sort(np.asarray(keep, dtype=np.intp))
+
+
+class BiasRanking:
+    """
+    Top-k for every cheap_bias over one fixed candidate set.
+
+    user_score(b) = taste_norm + b × (price_norm - taste_norm) is a line in b,
+    so the top k only changes at a finite set of crossing points. The
+    k-level of those lines over the k-skyband is swept once; afterwards a
+    bias value is a bisect into the breakpoints plus a sort of k rows.
+
+    rows      : candidate row positions (sorted)
+    p, t      : price_norm / taste_norm of those rows
+    top_k     : size of the ranking to maintain
+    max_sweep : skybands larger than this (price and taste strongly
+                anti-correlated) skip the sweep and are scored directly
+    """
+
+    def __init__(self, rows, p, t, top_k=5, max_sweep=2048):
+        self.top_k = top_k
+        band = k_skyband(p, t, top_k)
+        self.rows = rows[band]
+        self.p = p[band]
+        self.t = t[band]
+        self.bounds = self.at = self.after = None
+        if len(band) <= max_sweep:
+            self.bounds, self.at, self.after = self._sweep()
+
+    def _exact(self, b):
+        """Top k at exactly bias b (score ties broken by position)."""
+        return top_k_positions(b * self.p + (1 - b) * self.t, self.top_k)
+
+    def _sweep(self):
+        """
+        Breakpoints [0, b1, ..., 1] with the top k exactly at each one
+        (`at`) and on the open interval that follows it (`after`).
+        """
+        k, p, t = self.top_k, self.p, self.t
+        slope = p - t
+        idx = np.arange(len(p))
+        # order just after b = 0: taste first, then whoever rises fastest
+        order = np.lexsort((idx, -slope, -t))
+        top, rest = order[:k], order[k:]
+        bounds, at, after = [0.0], [self._exact(0.0)], [top]
+        b = 0.0
+        while True:
+            events = []
+            # adjacent swaps inside the current top k
+            a, c = top[:-1], top[1:]
+            rising = slope[c] > slope[a]
+            if rising.any():
+                events.append((t[a][rising] - t[c][rising]) / (slope[c][rising] - slope[a][rising]))
+            # someone outside overtakes the k-th row
+            enter, enter_at = rest[:0], np.empty(0)
+            if len(rest):
+                last = top[-1]
+                rising = slope[rest] > slope[last]
+                if rising.any():
+                    enter = rest[rising]
+                    enter_at = (t[last] - t[enter]) / (slope[enter] - slope[last])
+                    events.append(enter_at)
+            crossings = np.concatenate(events) if events else np.empty(0)
+            crossings = crossings[(crossings > b) & (crossings < 1.0)]
+            if not len(crossings):
+                break
+            b = float(crossings.min())
+            # order just after b over the top k plus whoever enters at b;
+            # rounding lets float near-ties fall back to the slope order,
+            # so no crossing is skipped
+            enter = enter[enter_at <= b + 1e-12]
+            pool = np.concatenate([top, enter])
+            score = np.round(t[pool] + b * slope[pool], 12)
+            pool = pool[np.lexsort((pool, -slope[pool], -score))]
+            top = pool[:k]
+            if len(enter):
+                rest = np.concatenate([np.setdiff1d(rest, enter, assume_unique=True), pool[k:]])
+            bounds.append(b)
+            at.append(self._exact(b))
+            after.append(top)
+        bounds.append(1.0)
+        at.append(self._exact(1.0))
+        after.append(top)
+        return np.asarray(bounds), at, after
+
+    def top(self, cheap_bias):
+        """(row positions, user_scores) of the top k at this bias, best first."""
+        if self.bounds is None:
+            scores = cheap_bias * self.p + (1 - cheap_bias) * self.t
+            best = top_k_positions(scores, self.top_k)
+            return self.rows[best], scores[best]
+        i = min(max(bisect_right(self.bounds, cheap_bias) - 1, 0), len(self.bounds) - 2)
+        # the segment plus the exact sets at both ends absorbs float fuzz
+        # around breakpoints; it is at most 3k rows
+        seg = np.unique(np.concatenate([self.after[i], self.at[i], self.at[i + 1]]))
+        scores = cheap_bias * self.p[seg] + (1 - cheap_bias) * self.t[seg]
+        best = top_k_positions(scores, self.top_k)
+        return self.rows[seg[best]], scores[best]
+
+
+class PersonalRanking:
+    """
+    BiasRanking's top() over one user's predicted taste. The candidates are
+    scored directly at the bias asked for; nothing is swept or cached,
+    since the taste side differs per user.
+
+    rows : candidate row positions
+    p, t : price_norm and the user's predicted taste_norm of those rows
+    """
+
+    def __init__(self, rows, p, t, top_k=5):
+        self.rows, self.p, self.t, self.top_k = rows, p, t, top_k
+
+    def top(self, cheap_bias):
+        """(row positions, user_scores) of the top k at this bias, best first."""
+        scores = cheap_bias * self.p + (1 - cheap_bias) * self.t
+        best = top_k_positions(scores, self.top_k)
+        return self.rows[best], scores[best]
+
+
+class RecommendationEngine:
+    """
+    Array-backed ranking over a prepared catalog (see catalog.prepare_catalog).
+
+    price / taste (float32), votes_count (int32) and price_norm / taste_norm
+    live in contiguous NumPy arrays indexed by row position, so a query is:
+    fuzzy match -> candidate rows from the token index -> one vectorized
+    score -> partial top-k. Only the k winners are materialized back into a
+    DataFrame for display, with their description and derived scores.
+
+    The frame itself keeps just the text columns, in the compact layout of
+    catalog.compact_catalog (categoricals for repeated values); descriptions
+    sit in a side store that a snapshot-loaded engine only reads on demand.
+
+    Moving the cheap_bias slider does not rerun the pipeline: the candidate
+    set of each query is kept in a small LRU as a BiasRanking, so another
+    bias on the same query is a lookup.
+
+    Ratings, new dishes, menu updates and removals are applied in place
+    (apply_event / sync): only the touched row is rescored, and the whole
+    price/taste normalization is redone only when the min or max moves.
+    Removed rows keep their position but leave the token index, so they are
+    never candidates again (`alive` marks the rest). Dishes are found by
+    name through a hashed (restaurant, food) index (DishKeyIndex).
+
+    Typeahead suggestions (search box, rating form) come from a
+    prefix / trigram index over restaurant and dish names, kept up to date
+    by the same incremental updates.
+
+    recommend_semantic() retrieves by TF-IDF similarity over name, category
+    and description instead (SemanticIndex, built on first use) and blends
+    it into the same price / taste ranking.
+
+    With taste factors trained on per-user votes (personalize.py), name
+    searches for a known user rank the query's candidates by that user's
+    predicted taste instead of the global average (PersonalRanking); other
+    users get the shared ranking.
+
+    Rows are also partitioned by location, dish category and both
+    (FacetIndex). Searches take those as filters and rank only the
+    candidates inside the matching partitions; leaderboard() serves the
+    best-value dishes of a partition at the LEADERBOARD_BIASES levels from
+    boards that are materialized on first use and then kept current by
+    every rating, new dish and menu change.
+
+    df           : prepared catalog DataFrame (full or compact layout)
+    name_index   : optional prebuilt DishNameIndex
+    row_index    : optional prebuilt RowTokenIndex
+    typeahead    : optional prebuilt Typeahead
+    text_index   : optional prebuilt SemanticIndex
+    key_index    : optional prebuilt DishKeyIndex
+    facets       : optional prebuilt FacetIndex
+    descriptions : optional catalog.Descriptions, when df comes without them
+    cache_size   : number of queries whose BiasRanking is kept
+    """
+
+    def __init__(self, df, name_index=None, row_index=None, typeahead=None, text_index=None, key_index=None,
+                 facets=None, descriptions=None, cache_size=256):
+        df, split = compact_catalog(df)
+        if descriptions is None:
+            descriptions = split if split is not None else Descriptions(np.full(len(df), -1, np.int32), [])
+        self.descriptions = descriptions
+        self.columns = list(df.columns)
+        self.price = df['price'].to_numpy(dtype=np.float32, copy=True)
+        self.taste = df['taste'].to_numpy(dtype=np.float32, copy=True)
+        self.votes_count = df['votes_count'].to_numpy(dtype=np.int32, copy=True)
+        self.alive = np.ones(len(df), dtype=bool)
+        self.name_index = name_index if name_index is not None else DishNameIndex.from_frame(df)
+        self.row_index = row_index if row_index is not None else RowTokenIndex.from_frame(df)
+        self.typeahead = typeahead if typeahead is not None else Typeahead.from_frame(df)
+        self._text_index = text_index
+        self.key_index = key_index if key_index is not None else DishKeyIndex.from_frame(df)
+        self.facets = facets if facets is not None else FacetIndex.from_frame(df)
+        self._boards = {}  # partition -> leaderboard per LEADERBOARD_BIASES level, see _board
+        self.cache_size = cache_size
+        self._rankings = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+
+        self._price_range = min_max(self.price) if len(df) else (0.0, 1.0)
+        self._taste_range = min_max(np.nan_to_num(self.taste)) if len(df) else (0.0, 1.0)
+        self.price_norm = self._price_norm(self.price)
+        self.taste_norm = self._taste_norm(self.taste)
+        self._buffers = {name: getattr(self, name) for name in ROW_ARRAYS}
+        self._new_rows = []  # text columns of added dishes not yet in df
+        self.df = df.drop(columns=['price', 'taste', 'votes_count'])  # the arrays above are the numbers
+
+        # where sync() resumes, and the snapshot version this engine was
+        # mapped from / published as; set by from_store
+        self.store = None
+        self.cursor = None
+        self.version = None
+        # (TasteFactors, factor row per catalog row or -1) once attached,
+        # and the factors file it came from
+        self._factors = None
+        self._factors_stamp = None
+
+    @classmethod
+    def from_store(cls, store, use_snapshot=True, **kwargs):
+        """
+        Engine over a storage backend (storage.CsvStore / SQLiteStore), ready
+        to sync. None if empty.
+
+        With use_snapshot the prepared columns and indexes are mapped from
+        the store's published snapshot (see snapshot.py) and only the events
+        recorded since it was written are applied. When there is none, or
+        the store has replaced its data since, one process per host takes
+        the publish lock, builds from the store and publishes; the others
+        wait for it and map what it published.
+        """
+        if not store.exists():
+            return None
+        if not use_snapshot:
+            return cls._build(store, **kwargs)
+        engine = cls._mapped(store, **kwargs)
+        if engine is not None:
+            return engine
+        try:
+            with publish_lock(store.snapshot_dir):
+                engine = cls._mapped(store, **kwargs)  # published while we waited
+                if engine is None:
+                    engine = cls._build(store, **kwargs)
+                    engine.publish()
+                return engine
+        except (OSError, TimeoutError):
+            # read-only deployment or a stuck builder: keep serving, just without a snapshot
+            return engine or cls._build(store, **kwargs)
+
+    @classmethod
+    def _mapped(cls, store, **kwargs):
+        snap = load_snapshot(store.snapshot_dir)
+        if snap is None:
+            return None
+        df, descriptions, indexes, cursor, version = snap
+        engine = cls(df, descriptions=descriptions, **indexes, **kwargs)
+        engine.store, engine.cursor, engine.version = store, cursor, version
+        return engine if engine.sync() else None
+
+    @classmethod
+    def _build(cls, store, **kwargs):
+        raw, cursor = store.load()
+        engine = cls(prepare_catalog(raw), **kwargs)
+        engine.store, engine.cursor = store, cursor
+        engine.refresh_factors()
+        return engine
+
+    def publish(self):
+        """
+        Write the catalog and indexes as they are now as the store's current
+        snapshot version. Callers hold snapshot.publish_lock. Returns the
+        version directory.
+        """
+        with self._write_lock:
+            indexes = {"name_index": self.name_index, "row_index": self.row_index, "typeahead": self.typeahead,
+                       "text_index": self.text_index, "key_index": self.key_index, "facets": self.facets}
+            dirpath = save_snapshot(self.store.snapshot_dir, self.frame(), self.descriptions, indexes, self.cursor)
+        self.version = os.path.basename(dirpath)
+        return dirpath
+
+    def superseded(self):
+        """True when a newer snapshot version than this engine's has been published."""
+        if self.store is None:
+            return False
+        version = current_version(self.store.snapshot_dir)
+        return version is not None and version != self.version
+
+    @classmethod
+    def from_files(cls, master_path=MASTER_CSV, log_path=EVENT_LOG, **kwargs):
+        """Engine over the CSV master + pending events."""
+        return cls.from_store(CsvStore(master_path, log_path), **kwargs)
+
+    def __len__(self):
+        return len(self.alive)
+
+    @property
+    def df(self):
+        """Text columns of the catalog; dishes added since the last read are appended first, in one concat."""
+        if self._new_rows:
+            self._flush_rows()
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+
+    def _flush_rows(self):
+        with self._write_lock:
+            rows, self._new_rows = self._new_rows, []
+            if not rows:
+                return
+            start = (self._df.index.max() + 1) if len(self._df) else 0
+            entries = pd.DataFrame(rows, index=range(start, start + len(rows)))
+            df = with_categories(self._df, {c: entries[c].tolist() for c in entries.columns})
+            entries = entries.astype({c: df[c].dtype for c in entries.columns if c in df.columns})
+            self._df = pd.concat([df, entries])
+
+    def frame(self, rows=None):
+        """
+        Catalog rows (default: all, removed ones included) in the compact
+        layout with their current price / taste / votes_count: what a
+        snapshot stores. No descriptions or derived scores.
+        """
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.intp)
+        return pd.DataFrame(self._columns(rows), index=self.df.index[rows], copy=False)
+
+    def _columns(self, rows):
+        """{column: values of these rows} in catalog order; one take per column, no frame copies."""
+        columns = {c: self.df[c].array.take(rows) for c in self.df.columns}
+        columns.update(price=self.price[rows], taste=self.taste[rows], votes_count=self.votes_count[rows])
+        return {c: columns[c] for c in self.columns + [c for c in columns if c not in self.columns]}
+
+    @property
+    def catalog(self):
+        """The compact catalog without removed rows."""
+        return self.frame() if self.alive.all() else self.frame(np.flatnonzero(self.alive))
+
+    def memory_usage(self):
+        """
+        Bytes held per part of the catalog: each frame column (deep), the
+        ranking arrays and the description store (counted as if loaded).
+        Search indexes are not included.
+        """
+        usage = self.df.memory_usage(deep=True)
+        for name in ('price', 'taste', 'votes_count', 'price_norm', 'taste_norm', 'alive'):
+            usage[name] = getattr(self, name).nbytes
+        usage['description'] = self.descriptions.nbytes()
+        if self._factors is not None:
+            usage['factor_codes'] = self._factors[1].nbytes
+        return usage
+
+    # ========== PERSONALIZATION ==========
+    @property
+    def taste_factors(self):
+        """The attached personalize.TasteFactors, or None."""
+        return self._factors[0] if self._factors is not None else None
+
+    def use_factors(self, model):
+        """Rank with these TasteFactors from now on (None: global ranking for everyone)."""
+        with self._write_lock:
+            if model is None:
+                self._factors = None
+                return
+            rows = self.positions(model.restaurants, model.foods)
+            found = rows >= 0
+            codes = np.full(len(self), -1, dtype=np.int32)
+            codes[rows[found]] = np.flatnonzero(found)
+            self._factors = (model, codes)
+
+    def refresh_factors(self):
+        """Attach the store's trained taste factors (personalize.py) when they changed on disk."""
+        path = self.store.factors_path
+        try:
+            info = os.stat(path)
+            stamp = (info.st_mtime_ns, info.st_size)
+        except OSError:
+            stamp = None
+        if stamp == self._factors_stamp:
+            return
+        self._factors_stamp = stamp
+        try:
+            self.use_factors(TasteFactors.load(path) if stamp is not None else None)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            self.use_factors(None)  # half-copied or foreign file: global until the next one
+
+    def user_vector(self, user):
+        """The user's taste factors, or None (no factors attached, or a user they were not trained on)."""
+        factors = self._factors
+        if not user or factors is None:
+            return None
+        return factors[0].user_vector(user)
+
+    def personal_taste(self, rows, vector):
+        """
+        taste_norm of these rows as predicted for one user (user_vector):
+        the global taste_norm plus the user's offset on the dishes the
+        factors cover, kept inside the catalog's taste range.
+        """
+        model, codes = self._factors
+        taste = self.taste_norm[rows]
+        codes = codes[rows]
+        known = codes >= 0
+        if known.any():
+            taste[known] += (model.dish_factors[codes[known]] @ vector) / self._taste_range[1]
+            np.clip(taste, 0.0, 1.0, out=taste)
+        return taste
+
+    def predicted_taste(self, rows, user=None):
+        """Taste of these rows on the 1-10 scale as predicted for `user` (the catalog's for unknown users)."""
+        vector = self.user_vector(user)
+        taste = self.taste_norm[rows] if vector is None else self.personal_taste(rows, vector)
+        lo, scale = self._taste_range
+        return lo + taste * scale
+
+    def match(self, dish_name, cutoff=70, limit=10):
+        """Fuzzy-matched dish names for a query, best first."""
+        return [r[0] for r in self.name_index.extract(dish_name, limit=limit, score_cutoff=cutoff)]
+
+    @property
+    def text_index(self):
+        """SemanticIndex over every row; built on first use unless it came with the snapshot."""
+        if self._text_index is None:
+            with self._write_lock:
+                if self._text_index is None:
+                    self._text_index = SemanticIndex.from_frame(
+                        self.df.assign(description=self.descriptions.take(slice(None))))
+        return self._text_index
+
+    def suggest(self, query, limit=5):
+        """Dish names for a partially typed query, most voted first."""
+        return self.typeahead.suggest_dishes(query, limit=limit)
+
+    def suggest_pairs(self, restaurant="", food="", limit=5):
+        """(restaurant, food) pairs for partially typed names, as spelled in the catalog."""
+        rows = self.typeahead.suggest_rows(restaurant, food, limit=limit)
+        return list(zip(self.df['restaurant'].iloc[rows].tolist(), self.df['food'].iloc[rows].tolist()))
+
+    def restaurant_rows(self, restaurant):
+        """Live row positions of one restaurant, however its name is cased / spaced."""
+        return self.typeahead.restaurant_rows(restaurant)
+
+    def candidates(self, matched_names, within=None):
+        """Row positions whose food contains any of the matched names (only among sorted rows `within`)."""
+        return self.row_index.rows_for_names(matched_names, within)
+
+    def score(self, rows, cheap_bias=0.5):
+        """user_score = cheap_bias × price_norm + (1 - cheap_bias) × taste_norm"""
+        return cheap_bias * self.price_norm[rows] + (1 - cheap_bias) * self.taste_norm[rows]
+
+    def rank(self, rows, top_k=5, cheap_bias=0.5):
+        """(winning row positions, their scores), best first."""
+        scores = self.score(rows, cheap_bias)
+        best = top_k_positions(scores, top_k)
+        return rows[best], scores[best]
+
+    def display(self, rows, **extra):
+        """
+        Full catalog rows for these positions: compact columns, description
+        and the derived score columns of catalog.prepare_catalog, computed
+        here for just these rows. `extra` columns are appended.
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        weight, weighted, score = self._derived(rows)
+        columns = self._columns(rows)
+        columns.update(price=exact_floats(self.price[rows]), taste=exact_floats(self.taste[rows]),
+                       description=self.descriptions.take(rows),
+                       price_norm=self.price_norm[rows], taste_norm=self.taste_norm[rows],
+                       popularity_weight=weight, weighted_score=weighted, score=score, **extra)
+        return pd.DataFrame(columns, index=self.df.index[rows], copy=False)
+
+    def materialize(self, rows, scores):
+        """Display rows for the winners only, with their user_score."""
+        return self.display(rows, user_score=scores)
+
+    def ranking(self, dish_name, top_k=5, cutoff=70, location="", category=""):
+        """
+        (matched_names, BiasRanking or None) for a query, cached per
+        (normalized query, top_k, cutoff, partitions). With a `location`
+        and / or dish `category` filter (see FacetIndex.partitions) only
+        the candidates inside the matching partitions are ranked.
+        """
+        return self._ranking(dish_name, top_k, cutoff, location, category)[:2]
+
+    def _ranking(self, dish_name, top_k, cutoff, location="", category=""):
+        """ranking() plus the query's ranked candidate rows (None when nothing matched)."""
+        key = (normalize_name(dish_name), top_k, cutoff)
+        parts = self.facets.partitions(location, category)
+        unscoped = None
+        if parts is not None:
+            key, unscoped = key + (tuple(parts),), key
+        cached = self._cached_ranking(key)
+        if cached is None and unscoped is not None:
+            unscoped = self._cached_ranking(unscoped)
+            if unscoped is not None:  # same match, narrowed to the partitions
+                note(cache="narrowed")
+                return self._build_ranking(key, unscoped[0], unscoped[2])
+        note(cache="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+        with stage("match"):
+            matched_names = self.match(dish_name, cutoff=cutoff)
+        return self._build_ranking(key, matched_names)
+
+    def rankings(self, dish_names, top_k=5, cutoff=70):
+        """
+        ranking() for many queries at once: repeated queries are resolved
+        once, and all uncached ones are fuzzy-matched in one batch
+        (DishNameIndex.extract_many).
+        """
+        keys = [(normalize_name(d), top_k, cutoff) for d in dish_names]
+        found = {}
+        for key in keys:
+            if key not in found:
+                found[key] = self._cached_ranking(key)
+        missing = [key for key, value in found.items() if value is None]
+        note(cache_hits=len(found) - len(missing), cache_misses=len(missing))
+        with stage("match"):
+            matches = self.name_index.extract_many([key[0] for key in missing], limit=10, score_cutoff=cutoff)
+        for key, matched in zip(missing, matches):
+            found[key] = self._build_ranking(key, [m[0] for m in matched])
+        return [found[key][:2] for key in keys]
+
+    def _cached_ranking(self, key):
+        with self._lock:
+            if key in self._rankings:
+                self._rankings.move_to_end(key)
+                return self._rankings[key]
+        return None
+
+    def _build_ranking(self, key, matched_names, rows=None):
+        """Rank (and cache) the candidates of matched_names, or the given candidate `rows`."""
+        ranking = None
+        if matched_names:
+            with stage("filter"):
+                parts = key[3] if len(key) > 3 else None  # scoped to partitions
+                if rows is None:
+                    rows = self.candidates(matched_names, None if parts is None else self.facets.rows_in(parts))
+                elif parts is not None:
+                    rows = rows[self.facets.within(rows, parts)]
+            count(candidates=len(rows))
+            if len(rows):
+                with stage("score"):
+                    ranking = BiasRanking(rows, self.price_norm[rows], self.taste_norm[rows], key[1])
+
+        with self._lock:
+            self._rankings[key] = (matched_names, ranking, rows)
+            while len(self._rankings) > self.cache_size:
+                self._rankings.popitem(last=False)
+        return matched_names, ranking, rows
+
+    def recommend(self, dish_name, top_k=5, cheap_bias=0.5, cutoff=70, user=None, location="", category=""):
+        """
+        Returns (matched_name, DataFrame of top_k rows) on success,
+        or (None, message) when nothing matches. For a `user` the taste
+        factors know, user_score uses their predicted taste. `location` /
+        `category` keep only dishes of matching locations / dish categories.
+        """
+        matched_names, ranking, rows = self._ranking(dish_name, top_k, cutoff, location, category)
+        note(match_count=len(matched_names), matched=matched_names[0] if matched_names else None)
+        vector = self.user_vector(user)
+        if ranking is not None and vector is not None:
+            note(personalized=True)
+            with stage("personalize"):
+                ranking = PersonalRanking(rows, self.price_norm[rows], self.personal_taste(rows, vector), top_k)
+        return self._result(dish_name, matched_names, ranking, cheap_bias, location, category)
+
+    def semantic_ranking(self, query, top_k=5, min_similarity=0.2, relevance=0.5, location="", category=""):
+        """
+        (matched_names, BiasRanking or None) for TF-IDF retrieval, cached
+        like ranking(). Candidates are the rows at least `min_similarity`
+        similar to the query; their score blends similarity into the
+        user_score:
+
+          relevance × similarity + (1 - relevance) × user_score(cheap_bias)
+
+        which is still a line in cheap_bias, so the BiasRanking sweep holds.
+        matched_names are the dish names of the most similar rows.
+        `location` / `category` filter the candidates as in ranking().
+        """
+        key = ("semantic", normalize_name(query), top_k, min_similarity, relevance)
+        parts = self.facets.partitions(location, category)
+        if parts is not None:
+            key += (tuple(parts),)
+        cached = self._cached_ranking(key)
+        note(cache="miss" if cached is None else "hit")
+        if cached is not None:
+            return cached[:2]
+        with stage("match"):
+            rows, sims = self.text_index.search(query, min_similarity)
+            keep = self.alive[rows]
+            if parts is not None:
+                keep &= self.facets.within(rows, parts)
+            rows, sims = rows[keep], sims[keep]
+        count(candidates=len(rows))
+        matched_names = ranking = None
+        if len(rows):
+            best = rows[np.lexsort((rows, -sims))[:10]]
+            matched_names = list(dict.fromkeys(self.df['food'].iloc[best].tolist()))
+            with stage("score"):
+                ranking = BiasRanking(rows, relevance * sims + (1 - relevance) * self.price_norm[rows],
+                                      relevance * sims + (1 - relevance) * self.taste_norm[rows], top_k)
+        with self._lock:
+            self._rankings[key] = (matched_names or [], ranking, rows)
+            while len(self._rankings) > self.cache_size:
+                self._rankings.popitem(last=False)
+        return matched_names or [], ranking
+
+    def recommend_semantic(self, query, top_k=5, cheap_bias=0.5, min_similarity=0.2, relevance=0.5,
+                           location="", category=""):
+        """
+        recommend() by TF-IDF similarity over name, category and description.
+        user_score of the result is the blended score (see semantic_ranking).
+        """
+        matched_names, ranking = self.semantic_ranking(query, top_k=top_k, min_similarity=min_similarity,
+                                                       relevance=relevance, location=location, category=category)
+        note(match_count=len(matched_names), matched=matched_names[0] if matched_names else None)
+        return self._result(query, matched_names, ranking, cheap_bias, location, category)
+
+    def recommend_batch(self, dish_names, biases=(0.5,), top_k=5, cutoff=70):
+        """
+        recommend() for many dishes × cheap_bias values in one pass.
+
+        Returns (matches, results): matches[i] is the matched name for
+        dish_names[i] (None when nothing matched), results is one long
+        DataFrame with the winners of every (dish, bias) pair, tagged with
+        `query` (index into dish_names), `cheap_bias` and `rank`. Each
+        distinct query is matched and ranked once and shared by all biases,
+        and the winners are materialized together instead of per pair.
+        """
+        matches, queries, bias_values, ranks, rows, scores = [], [], [], [], [], []
+        for i, (matched_names, ranking) in enumerate(self.rankings(dish_names, top_k=top_k, cutoff=cutoff)):
+            matches.append(matched_names[0] if ranking is not None else None)
+            if ranking is None:
+                continue
+            for cheap_bias in biases:
+                with stage("sort"):
+                    winners, winner_scores = ranking.top(cheap_bias)
+                queries.append(np.full(len(winners), i))
+                bias_values.append(np.full(len(winners), float(cheap_bias)))
+                ranks.append(np.arange(len(winners)))
+                rows.append(winners)
+                scores.append(winner_scores)
+
+        if not rows:
+            return matches, self.materialize(np.empty(0, dtype=np.int64), np.empty(0)).assign(
+                query=np.empty(0, dtype=np.int64), cheap_bias=np.empty(0), rank=np.empty(0, dtype=np.int64))
+        with stage("materialize"):
+            results = self.materialize(np.concatenate(rows), np.concatenate(scores)).assign(
+                query=np.concatenate(queries), cheap_bias=np.concatenate(bias_values), rank=np.concatenate(ranks))
+        return matches, results
+
+    def _result(self, dish_name, matched_names, ranking, cheap_bias, location="", category=""):
+        scope = "".join(f" {label} '{value}'" for label, value in (("in", location), ("under", category)) if value)
+        if not matched_names:
+            return None, f"No close matches found for '{dish_name}'{scope}"
+        if ranking is None:
+            return None, f"No dishes found matching any of: {matched_names}{scope}"
+
+        with stage("sort"):
+            winners, scores = ranking.top(cheap_bias)
+        with stage("materialize"):
+            return matched_names[0], self.materialize(winners, scores)
+
+    # ========== LEADERBOARDS ==========
+    def leaderboard(self, location="", category="", cheap_bias=0.5, top_k=10):
+        """
+        (row positions, user_scores) of the best live dishes of a location
+        and / or dish category (empty: anywhere / any, see
+        FacetIndex.partitions), best first, ties to the earlier row.
+
+        At a LEADERBOARD_BIASES level with top_k <= LEADERBOARD_SIZE this
+        merges the materialized boards of the matching partitions; any
+        other bias or size scores those partitions' rows directly. Either
+        way no row outside them is read.
+        """
+        parts = self.facets.partitions(location, category) or []
+        if not location and not category:
+            parts = [("all", 0)]
+        level = next((j for j, b in enumerate(LEADERBOARD_BIASES) if abs(b - cheap_bias) < 1e-9), None)
+        with stage("filter"):
+            if level is not None and top_k <= LEADERBOARD_SIZE:
+                note(cache="board")
+                rows = [self._board(part)[level][0] for part in parts]
+            else:
+                rows = [self.facets.rows(*part) for part in parts]
+                rows = [r[self.alive[r]] for r in rows]
+            rows = np.sort(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int32)
+        count(candidates=len(rows))
+        with stage("score"):
+            return self.rank(rows, top_k, cheap_bias)
+
+    def _board(self, part):
+        """
+        The partition's board: per LEADERBOARD_BIASES level, (its best live
+        rows, best first, whether that is all of them). Built on first use.
+        """
+        board = self._boards.get(part)
+        if board is None:
+            with self._write_lock:  # no update lands between scoring and storing it
+                board = self._boards.get(part)
+                if board is None:
+                    board = self._boards[part] = [self._top(part, b) for b in LEADERBOARD_BIASES]
+        return board
+
+    def _top(self, part, bias):
+        rows = self.facets.rows(*part)
+        rows = rows[self.alive[rows]]
+        return self.rank(rows, LEADERBOARD_DEPTH, bias)[0], len(rows) <= LEADERBOARD_DEPTH
+
+    def _ahead(self, a, b, bias):
+        """Row a ranks before row b: higher score, then lower position."""
+        sa, sb = self.score(a, bias), self.score(b, bias)
+        return sa > sb or (sa == sb and a < b)
+
+    def _update_boards(self, row):
+        """
+        Re-place a row whose score (or liveness) changed on the built
+        boards of its partitions. A board holds the exact best rows of its
+        partition down to some depth, so a row that stays above its last
+        entry is moved within it, and one that falls below is dropped.
+        Only when drops leave fewer than LEADERBOARD_SIZE rows is the
+        board rescored from its partition.
+        """
+        for part in self.facets.facets_of(row):
+            board = self._boards.get(part)
+            if board is None:
+                continue
+            for level, bias in enumerate(LEADERBOARD_BIASES):
+                rows, complete = board[level]
+                inside = rows == row
+                if inside.any():
+                    rows = rows[~inside]
+                elif not self.alive[row]:
+                    continue
+                if self.alive[row] and (complete or (len(rows) and self._ahead(row, rows[-1], bias))):
+                    rows = np.append(rows, row)
+                if not complete and len(rows) < LEADERBOARD_SIZE:
+                    board[level] = self._top(part, bias)
+                else:
+                    ranked = self.rank(np.sort(rows), LEADERBOARD_DEPTH, bias)[0]
+                    board[level] = ranked, complete and len(ranked) == len(rows)
+
+    # ========== INCREMENTAL UPDATES ==========
+    def position(self, restaurant, food):
+        """Row position of (restaurant, food), case-insensitive, or None."""
+        key = dish_key(restaurant, food)
+        for i in self.key_index.rows_for(DishKeyIndex.key(*key)):
+            if self.alive[i] and dish_key(self.df['restaurant'].iat[i], self.df['food'].iat[i]) == key:
+                return int(i)
+        return None
+
+    def positions(self, restaurants, foods):
+        """position() for many dishes at once: one row per pair, -1 when not in the catalog."""
+        keys = [DishKeyIndex.key(*dish_key(r, f)) for r, f in zip(restaurants, foods)]
+        rows = self.key_index.lookup(keys)
+        hit = np.flatnonzero(rows >= 0)
+        found = rows[hit]
+        names = {c: pd.Series(self.df[c].array.take(found)).astype(str).str.lower() for c in ('restaurant', 'food')}
+        found_keys = (names['restaurant'] + "\x1f" + names['food']).to_numpy(dtype=object)
+        same = self.alive[found] & (found_keys == np.asarray(keys, dtype=object)[hit])
+        for j in hit[~same]:  # hash collision, or a removed row with a live twin
+            i = self.position(restaurants[j], foods[j])
+            rows[j] = -1 if i is None else i
+        return rows
+
+    def sync(self):
+        """
+        Apply every event recorded (by any process) since the last sync.
+        Returns False when the store replaced its snapshot (compaction,
+        re-ingestion), in which case the caller should rebuild the engine.
+        """
+        if self.store is None:
+            return True
+        with self._write_lock:
+            events, cursor = self.store.changes(self.cursor)
+            if events is None:
+                return False
+            for event in events:
+                self.apply_event(event)
+            self.cursor = cursor
+            self._flush_rows()
+        self.refresh_factors()
+        return True
+
+    def apply_event(self, event):
+        if event["type"] == "rating":
+            return self.apply_rating(event["restaurant"], event["food"], event["rating"])
+        if event["type"] == "new_dish":
+            return self.add_dish(event["row"])
+        if event["type"] == "dish_update":
+            return self.update_dish(event["restaurant"], event["food"], event["fields"])
+        if event["type"] == "dish_remove":
+            return self.remove_dish(event["restaurant"], event["food"])
+        return None
+
+    def apply_rating(self, restaurant, food, rating):
+        """Fold one vote into the row's average taste. Returns the row position or None."""
+        with self._write_lock:
+            i = self.position(restaurant, food)
+            if i is None:
+                return None
+            old_avg, old_votes = float(self.taste[i]), int(self.votes_count[i])
+            if np.isnan(old_avg):
+                old_avg, old_votes = 0.0, 0
+            lo, scale = self._taste_range
+            # moving the current min / max may shrink the range
+            at_edge = old_avg <= lo or old_avg >= lo + scale
+            self.taste[i] = (old_avg * old_votes + rating) / (old_votes + 1)
+            self.votes_count[i] = old_votes + 1
+            self.typeahead.vote(i, old_votes + 1)
+
+            new_avg = float(self.taste[i])  # as stored (float32)
+            if new_avg < lo or new_avg > lo + scale or at_edge:
+                if self._renormalize():
+                    return i
+            self.taste_norm[i] = self._taste_norm(new_avg)
+            self._invalidate(i)
+            return i
+
+    def add_dish(self, row):
+        """Append one new dish (a storage.new_entry_row dict). Returns its position or None."""
+        with self._write_lock:
+            price = pd.to_numeric(row.get("price"), errors="coerce")
+            if pd.isna(price):
+                return None  # prepare_catalog drops unpriced rows too
+            taste = pd.to_numeric(row.get("taste"), errors="coerce")
+            taste = np.nan if pd.isna(taste) else float(taste)
+            votes = pd.to_numeric(row.get("votes_count", 1), errors="coerce")
+            votes = 1 if pd.isna(votes) else int(votes)
+
+            i = len(self)
+            self._extend(i + 1)
+            self.price[i], self.taste[i], self.votes_count[i] = price, taste, votes
+            self.price_norm[i] = self.taste_norm[i] = 0.0
+            self.alive[i] = True
+            self.descriptions.append(row.get("description"))
+            self.name_index.add(row["food"])
+            self.row_index.add(row["food"])
+            self.typeahead.add(row["restaurant"], row["food"], votes)
+            if self._text_index is not None:
+                self._text_index.add(SemanticIndex.document(row["food"], row.get("dish_category"),
+                                                            row.get("description")))
+
+            self._new_rows.append({c: v for c, v in row.items()
+                                   if c not in ('price', 'taste', 'votes_count', 'description')})
+            self.key_index.add(DishKeyIndex.key(*dish_key(row["restaurant"], row["food"])), i)
+            self.facets.add(row.get("location"), row.get("dish_category"))
+
+            (plo, pscale), (tlo, tscale) = self._price_range, self._taste_range
+            price, t0 = float(self.price[i]), float(np.nan_to_num(self.taste[i]))
+            in_range = plo <= price <= plo + pscale and tlo <= t0 <= tlo + tscale
+            if in_range or not self._renormalize():
+                self.price_norm[i] = self._price_norm(price)
+                self.taste_norm[i] = self._taste_norm(t0)
+                self._update_boards(i)
+            self._clear_rankings()
+            return i
+
+    def _extend(self, n):
+        """
+        Make the per-row arrays n long. They are views of buffers with
+        spare capacity, which double when full, so one new dish costs no
+        copy of every array.
+        """
+        if n > len(self._buffers["price"]):
+            capacity = max(2 * n, 1024)
+            for name in ROW_ARRAYS:
+                old = getattr(self, name)
+                buffer = np.zeros(capacity, dtype=old.dtype)
+                buffer[:len(old)] = old
+                self._buffers[name] = buffer
+        for name in ROW_ARRAYS:
+            setattr(self, name, self._buffers[name][:n])
+        if self._factors is not None and len(self._factors[1]) < n:
+            model, codes = self._factors  # rows past the trained ones have no factors (-1)
+            grown = np.full(len(self._buffers["price"]), -1, dtype=np.int32)
+            grown[:len(codes)] = codes
+            self._factors = (model, grown)
+
+    def update_dish(self, restaurant, food, fields):
+        """Overwrite catalog fields of one dish (e.g. a menu price change). Returns its position or None."""
+        with self._write_lock:
+            i = self.position(restaurant, food)
+            if i is None:
+                return None
+            fields = {c: v for c, v in fields.items() if c not in ('restaurant', 'food', 'taste', 'votes_count')}
+            retext = self._text_index is not None and ('description' in fields or 'dish_category' in fields)
+            if retext:
+                old_text = self._document(i)
+            if 'description' in fields:
+                self.descriptions.set(i, fields.pop('description'))
+            text = {c: v for c, v in fields.items() if c != 'price'}
+            if text:
+                label = self.df.index[i]
+                df = with_categories(self.df, {c: [v] for c, v in text.items()})
+                for column, value in text.items():
+                    df.loc[label, column] = value
+                self.df = df
+                if 'location' in text or 'dish_category' in text:
+                    # the row changes partitions: their boards and scoped rankings are rebuilt on next use
+                    for part in self.facets.facets_of(i):
+                        self._boards.pop(part, None)
+                    self.facets.move(i, df['location'].iat[i], df['dish_category'].iat[i])
+                    for part in self.facets.facets_of(i):
+                        self._boards.pop(part, None)
+                    self._clear_rankings()
+            if retext:
+                self._text_index.move(i, self._document(i), old_text)
+                self._clear_rankings()
+            price = pd.to_numeric(fields.get('price'), errors='coerce')
+            if 'price' in fields and not pd.isna(price):
+                lo, scale = self._price_range
+                at_edge = self.price[i] <= lo or self.price[i] >= lo + scale
+                self.price[i] = price
+                price = float(self.price[i])
+                if (price < lo or price > lo + scale or at_edge) and self._renormalize():
+                    return i
+                self.price_norm[i] = self._price_norm(price)
+            self._invalidate(i)
+            return i
+
+    def _document(self, row):
+        """The text SemanticIndex retrieves a row by, as the catalog has it now."""
+        return SemanticIndex.document(self.df['food'].iat[row], self.df['dish_category'].iat[row],
+                                      self.descriptions.take([row])[0])
+
+    def remove_dish(self, restaurant, food):
+        """Take a dish out of the catalog (e.g. delisted from a menu). Returns its position or None."""
+        with self._write_lock:
+            i = self.position(restaurant, food)
+            if i is None:
+                return None
+            self.alive[i] = False
+            self.row_index.remove(i)
+            self.typeahead.remove(i)
+            (plo, pscale), (tlo, tscale) = self._price_range, self._taste_range
+            t0 = 0.0 if np.isnan(self.taste[i]) else self.taste[i]
+            if self.price[i] <= plo or self.price[i] >= plo + pscale or t0 <= tlo or t0 >= tlo + tscale:
+                if self._renormalize():
+                    return i
+            self._invalidate(i)
+            return i
+
+    def _renormalize(self):
+        """
+        Refit min/max on the live rows. If the range moved, rescore every
+        row and return True; otherwise leave everything as is.
+        """
+        if not self.alive.any():
+            return False
+        price_range = min_max(self.price[self.alive])
+        taste_range = min_max(np.nan_to_num(self.taste[self.alive]))
+        if price_range == self._price_range and taste_range == self._taste_range:
+            return False
+        self._price_range, self._taste_range = price_range, taste_range
+        self.price_norm[:] = self._price_norm(self.price)
+        self.taste_norm[:] = self._taste_norm(self.taste)
+        self._boards.clear()
+        self._clear_rankings()
+        return True
+
+    def _price_norm(self, price):
+        """1 - min-max scaled price (cheaper is better), computed in float64."""
+        lo, scale = self._price_range
+        return 1 - (np.asarray(price, dtype=np.float64) - lo) / scale
+
+    def _taste_norm(self, taste):
+        lo, scale = self._taste_range
+        return (np.nan_to_num(np.asarray(taste, dtype=np.float64)) - lo) / scale
+
+    def _derived(self, rows):
+        weight = popularity_weight(self.votes_count[rows])
+        weighted = self.price_norm[rows] * 0.5 + self.taste_norm[rows] * 0.5
+        return weight, weighted, weighted * weight
+
+    def _invalidate(self, row):
+        """Drop cached rankings whose candidate set contains this row; re-place it on the leaderboards."""
+        self._update_boards(row)
+        with self._lock:
+            stale = [key for key, (_, _, rows) in self._rankings.items()
+                     if rows is not None and np.searchsorted(rows, row) < len(rows)
+                     and rows[np.searchsorted(rows, row)] == row]
+            for key in stale:
+                del self._rankings[key]
+
+    def _clear_rankings(self):
+        with self._lock:
+            self._rankings.clear()
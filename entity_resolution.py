@@ -0,0 +1,287 @@
+import argparse
+import re
+import zlib
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz
+
+from search_index import char_ngrams, normalize_name
+from storage import get_store
+
+# Words that never tell two names apart ("Pork & Yam Chips" / "Pork and Yam Chips")
+_FILLER = {"and", "n", "the", "of"}
+_DIGIT = re.compile(r"\d")
+
+
+# ========== MINHASH-LSH BLOCKING ==========
+class MinHashLSH:
+    """
+    Candidate pairs of similar names without comparing all pairs.
+
+    Each name becomes a MinHash signature over its character n-grams;
+    names are bucketed by every band of `rows` signature values (plus their
+    block, e.g. the restaurant), and only names sharing a bucket are
+    candidates. Two names with Jaccard similarity s collide with
+    probability 1 - (1 - s**rows)**bands.
+
+    bands, rows : LSH shape (bands * rows hashes per signature)
+    ngram       : shingle length
+    max_bucket  : larger buckets (degenerate names) are skipped
+    """
+
+    _PRIME = (1 << 31) - 1
+
+    def __init__(self, bands=16, rows=4, ngram=3, max_bucket=64, seed=7):
+        self.bands, self.rows, self.ngram, self.max_bucket = bands, rows, ngram, max_bucket
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, self._PRIME, bands * rows, dtype=np.uint64)
+        self._b = rng.integers(0, self._PRIME, bands * rows, dtype=np.uint64)
+
+    def signatures(self, keys, chunk=4096):
+        """(len(keys), bands * rows) uint64 MinHash signatures of normalized names."""
+        n_hashes = self.bands * self.rows
+        gram_hashes = np.empty(0, dtype=np.uint64)
+        out = np.full((len(keys), n_hashes), self._PRIME, dtype=np.uint64)
+        gram_ids = {}  # n-gram -> id, so each distinct gram is hashed once
+        for start in range(0, len(keys), chunk):
+            owners, grams = [], []
+            for i, key in enumerate(keys[start:start + chunk]):
+                ids = [gram_ids.setdefault(g, len(gram_ids)) for g in char_ngrams(key, self.ngram)]
+                owners.extend([i] * len(ids))
+                grams.extend(ids)
+            if not grams:
+                continue
+            if len(gram_ids) > len(gram_hashes):
+                new = list(gram_ids)[len(gram_hashes):]
+                gram_hashes = np.concatenate(
+                    [gram_hashes, np.fromiter((zlib.crc32(g.encode("utf-8")) for g in new),
+                                              dtype=np.uint64, count=len(new))])
+            x = gram_hashes[grams] % np.uint64(self._PRIME)
+            hashed = (x[:, None] * self._a + self._b) % np.uint64(self._PRIME)
+            owners = np.asarray(owners)
+            starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+            out[start + owners[starts]] = np.minimum.reduceat(hashed, starts, axis=0)
+        return out
+
+    def candidate_pairs(self, keys, blocks=None):
+        """
+        Sorted unique (i, j) index pairs, i < j, that share an LSH bucket
+        within the same block.
+        """
+        sig = self.signatures(keys)
+        blocks = np.zeros(len(keys), dtype=np.int64) if blocks is None else np.asarray(blocks, dtype=np.int64)
+        pairs = []
+        for band in range(self.bands):
+            cols = sig[:, band * self.rows:(band + 1) * self.rows]
+            frame = pd.DataFrame(cols)
+            frame["block"] = blocks
+            bucket = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+            order = np.argsort(bucket, kind="stable")
+            bucket = bucket[order]
+            bounds = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1], True])
+            sizes = np.repeat(np.diff(bounds), np.diff(bounds))
+            # members k and k + d of one bucket, for every distance d in the bucket
+            for d in range(1, min(int(sizes.max()), self.max_bucket)):
+                same = (bucket[:-d] == bucket[d:]) & (sizes[:-d] <= self.max_bucket)
+                if not same.any():
+                    break
+                k = np.flatnonzero(same)
+                pairs.append(np.sort(np.stack([order[k], order[k + d]], axis=1), axis=1))
+        if not pairs:
+            return np.empty((0, 2), dtype=np.int64)
+        return np.unique(np.concatenate(pairs), axis=0)
+
+
+# ========== CLUSTERING ==========
+class UnionFind:
+    def __init__(self, n):
+        self.parent = np.arange(n)
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:  # path compression
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)  # the earliest member is the root
+
+    def labels(self):
+        return np.array([self.find(i) for i in range(len(self.parent))])
+
+
+def same_dish(a, b, cutoff=80):
+    """
+    Two normalized names from one menu denote the same dish: the same words
+    in any order, up to spelling slips ('jolof' / 'jollof'). A word that is
+    added, dropped or really different ('with' / 'without', 'fried' /
+    'grilled', 'pack a' / 'pack b', '2' / '3') keeps them apart.
+
+    cutoff : rapidfuzz ratio two differing words need to count as one
+    """
+    ta = [t for t in a.split() if t not in _FILLER]
+    tb = [t for t in b.split() if t not in _FILLER]
+    if not ta or len(ta) != len(tb):
+        return False
+    sa, sb = set(ta), set(tb)
+    only_a = [t for t in ta if t not in sb]
+    only_b = [t for t in tb if t not in sa]
+    if len(only_a) != len(only_b):
+        return False
+    if not only_a:
+        return sorted(ta) == sorted(tb)
+    if len(only_a) > max(1, len(ta) // 3):
+        return False
+    for x in only_a:
+        fits = [y for y in only_b
+                if min(len(x), len(y)) >= 4 and not _DIGIT.search(x + y) and fuzz.ratio(x, y) >= cutoff]
+        if not fits:
+            return False
+        only_b.remove(max(fits, key=lambda y: fuzz.ratio(x, y)))
+    return True
+
+
+def _price_ok(p, q, ratio):
+    """Unknown prices match anything; known ones within `ratio` of each other."""
+    return np.isnan(p) or np.isnan(q) or max(p, q) <= ratio * min(p, q)
+
+
+def cluster_names(keys, blocks=None, prices=None, cutoff=80, price_ratio=1.25, lsh=None):
+    """
+    Cluster labels (index of each cluster's first member) for normalized
+    names. Identical (block, name) rows are merged directly, distinct names
+    only when LSH makes them candidates and same_dish() accepts them. With
+    `prices`, rows further apart than `price_ratio` stay separate (the same
+    name at 80 and 150 is a small and a large pizza).
+    """
+    keys = list(keys)
+    n = len(keys)
+    blocks = np.zeros(n, dtype=np.int64) if blocks is None else np.asarray(blocks, dtype=np.int64)
+    prices = np.full(n, np.nan) if prices is None else np.asarray(prices, dtype=float)
+    uf = UnionFind(n)
+    groups = {}
+    for i, pair in enumerate(zip(blocks.tolist(), keys)):
+        groups.setdefault(pair, []).append(i)
+    for members in groups.values():
+        if len(members) > 1:  # chain neighbours in price order; unpriced rows join the first
+            members = sorted(members, key=lambda i: (np.isnan(prices[i]), prices[i]))
+            for i, j in zip(members, members[1:]):
+                if _price_ok(prices[i], prices[j], price_ratio):
+                    uf.union(i, j)
+                elif np.isnan(prices[j]):
+                    uf.union(members[0], j)
+
+    reps = np.fromiter((m[0] for m in groups.values()), dtype=np.int64, count=len(groups))
+    rep_keys = [keys[i] for i in reps]
+    lsh = lsh or MinHashLSH()
+    for i, j in lsh.candidate_pairs(rep_keys, blocks[reps]):
+        a, b = reps[i], reps[j]
+        if rep_keys[i] and _price_ok(prices[a], prices[b], price_ratio) and same_dish(rep_keys[i], rep_keys[j], cutoff):
+            uf.union(a, b)
+    return uf.labels()
+
+
+# ========== CATALOG ==========
+def resolve_restaurants(names, cutoff=80):
+    """{spelling: canonical spelling} for restaurant names that are one place ('Papa’s Pizza' / "Papa's Pizza")."""
+    names = pd.Series(names).dropna().astype(str)
+    counts = names.value_counts(sort=False)
+    spellings = counts.index.tolist()
+    labels = cluster_names([normalize_name(s) for s in spellings], cutoff=cutoff)
+    canonical = {}
+    for label in np.unique(labels):
+        members = [spellings[i] for i in np.flatnonzero(labels == label)]
+        best = max(members, key=lambda s: counts[s])  # the most common spelling wins
+        canonical.update({s: best for s in members})
+    return canonical
+
+
+def dish_clusters(df, cutoff=80):
+    """Cluster label per row: rows with the same label are one dish at one restaurant."""
+    restaurants = df["restaurant"].map(resolve_restaurants(df["restaurant"]))
+    blocks, _ = pd.factorize(restaurants)
+    keys = [normalize_name(f) for f in df["food"].tolist()]
+    prices = pd.to_numeric(df["price"], errors="coerce").to_numpy(dtype=float)
+    return cluster_names(keys, blocks, prices, cutoff=cutoff), restaurants
+
+
+def resolve_catalog(df, cutoff=80):
+    """
+    Collapse duplicate rows into one per dish. The first row of a cluster
+    (source order) is canonical; empty fields are filled from the others.
+    Votes are not split: the merged row has the crowd votes of all its
+    rows on top of one seed vote, and its taste is their vote-weighted
+    mean (the seed taste when nobody voted yet), so resolving an already
+    resolved catalog plus fresh source rows changes nothing.
+    Returns (resolved frame, number of rows merged away).
+    """
+    if df.empty:
+        return df, 0
+    df = df.reset_index(drop=True)
+    labels, restaurants = dish_clusters(df, cutoff)
+    if len(np.unique(labels)) == len(df) and restaurants.equals(df["restaurant"].astype(str)):
+        return df, 0
+
+    votes = pd.to_numeric(df["votes_count"], errors="coerce").fillna(1).clip(lower=1)
+    taste = pd.to_numeric(df["taste"], errors="coerce")
+    rated = (votes > 1) & taste.notna()
+    work = pd.DataFrame({
+        "label": labels,
+        "crowd": votes - 1,
+        "w_taste": (taste * votes).where(rated, 0.0),
+        "w": votes.where(rated, 0.0),
+    })
+    agg = work.groupby("label", sort=False).sum()
+
+    out = df.assign(restaurant=restaurants.where(restaurants.notna(), df["restaurant"]))
+    out = out.groupby(labels, sort=False).first()  # canonical row, gaps filled from the rest
+    out["votes_count"] = (1 + agg["crowd"]).astype(int).to_numpy()
+    crowd_taste = (agg["w_taste"] / agg["w"]).where(agg["w"] > 0).to_numpy()
+    out["taste"] = np.where(np.isnan(crowd_taste), pd.to_numeric(out["taste"], errors="coerce"), crowd_taste)
+    out = out.reset_index(drop=True)[df.columns]
+    return out, len(df) - len(out)
+
+
+def find_duplicate(catalog, restaurant, food, price=None, cutoff=80, price_ratio=1.25):
+    """
+    (restaurant, food) of an existing catalog row that is the same dish as
+    a new submission, or None. Used to turn a re-added dish into a vote;
+    `catalog` may be just the restaurant's rows (see engine.restaurant_rows).
+    """
+    r_key, f_key = normalize_name(restaurant), normalize_name(food)
+    if not r_key or not f_key:
+        return None
+    price = np.nan if price is None else float(price)
+    same_place = catalog[catalog["restaurant"].map(normalize_name) == r_key]
+    prices = pd.to_numeric(same_place["price"], errors="coerce").to_numpy(dtype=float)
+    for name, row_price, place in zip(same_place["food"], prices, same_place["restaurant"]):
+        if _price_ok(row_price, price, price_ratio) and same_dish(normalize_name(name), f_key, cutoff):
+            return place, name
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find / merge duplicate dishes in the catalog")
+    parser.add_argument("--apply", action="store_true", help="write the resolved catalog through the store")
+    parser.add_argument("--cutoff", type=int, default=80, help="rapidfuzz ratio for two differently spelt words to count as one")
+    parser.add_argument("--show", type=int, default=20, help="print this many merged clusters")
+    args = parser.parse_args()
+
+    store = get_store()
+    df, _ = store.load()
+    labels, restaurants = dish_clusters(df.reset_index(drop=True), args.cutoff)
+    sizes = pd.Series(labels).value_counts()
+    merged = sizes[sizes > 1]
+    for label in merged.index[:args.show]:
+        rows = df.iloc[np.flatnonzero(labels == label)]
+        print(f"• {restaurants.iloc[label]}: " + " | ".join(rows["food"].astype(str)))
+    resolved, n = resolve_catalog(df, args.cutoff)
+    print(f"✅ {n} duplicate rows in {len(merged)} clusters ({len(df)} → {len(resolved)} rows)")
+    if args.apply and n:
+        store.replace_catalog(resolved)
+        print("   Resolved catalog written")
@@ -0,0 +1,308 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from entity_resolution import resolve_catalog
+from storage import COLUMNS, get_store
+
+ETL_STATE = "etl_state.json"
+CHUNK_ROWS = 50_000
+
+# Master schema without the crowd vote count (every source row starts at 1 vote)
+TARGET_COLS = [c for c in COLUMNS if c != "votes_count"]
+
+
+# ========== PRICES ==========
+_CURRENCY = re.compile(r"gh\s*[₵¢]|ghs|[₵¢]|cedis?", re.IGNORECASE)
+_PRICE = r"^(\d+(?:\.\d+)?)(?:\s*[-–—]\s*(\d+(?:\.\d+)?))?$"
+
+
+def clean_prices(values):
+    """
+    Vectorized clean_price: cedi signs / 'GHS' and thousands separators are
+    stripped, a '95-125' range becomes its midpoint, anything else is NaN.
+    """
+    text = (pd.Series(values).astype("string")
+            .str.replace(_CURRENCY, "", regex=True)
+            .str.replace(",", "", regex=False)
+            .str.strip())
+    parts = text.str.extract(_PRICE)
+    lo = pd.to_numeric(parts[0], errors="coerce")
+    hi = pd.to_numeric(parts[1], errors="coerce")
+    return ((lo + hi.fillna(lo)) / 2).astype(float)
+
+
+def row_hashes(df):
+    """64-bit content hash per row over the master columns (index ignored)."""
+    return pd.util.hash_pandas_object(df[COLUMNS], index=False).to_numpy()
+
+
+def file_sha256(path, block=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ========== SOURCES ==========
+class Source:
+    """
+    One input of the master catalog.
+
+    name       : key in the ETL state; a source is rebuilt only when one of
+                 its input files changed since the last run
+    path       : input CSV
+    usecols    : columns actually parsed (the rest of a wide file is skipped)
+    source_url : tag of the master rows this source owns and replaces
+
+    Subclasses implement clean(chunk) -> rows in the master schema.
+    """
+
+    name = None
+    usecols = None
+    source_url = None
+
+    def __init__(self, path, chunksize=CHUNK_ROWS):
+        self.path = path
+        self.chunksize = chunksize
+
+    @property
+    def paths(self):
+        return [self.path]
+
+    def owns(self, df):
+        return (df["source_url"] == self.source_url).to_numpy()
+
+    def clean(self, chunk):
+        raise NotImplementedError
+
+    def read(self):
+        """Clean, schema-aligned rows, read `chunksize` rows at a time, exact duplicates dropped."""
+        parts, seen = [], np.empty(0, dtype=np.uint64)
+        for chunk in pd.read_csv(self.path, usecols=self.usecols, chunksize=self.chunksize):
+            chunk.columns = chunk.columns.str.strip()
+            rows = self.clean(chunk).reindex(columns=TARGET_COLS)
+            rows = rows.replace(["", " "], np.nan)
+            rows["votes_count"] = 1
+            hashes = row_hashes(rows)
+            first = ~pd.Series(hashes).duplicated().to_numpy() & ~np.isin(hashes, seen)
+            parts.append(rows[first])
+            seen = np.concatenate([seen, hashes[first]])
+        if not parts:
+            return pd.DataFrame(columns=COLUMNS)
+        return pd.concat(parts, ignore_index=True)
+
+
+class ChowdeckMenus(Source):
+    """Curated Chowdeck export (chowdeck_menus.csv): already one row per dish, with seed taste ratings."""
+
+    name = "chowdeck"
+    usecols = ["restaurant", "food", "price", "taste", "location", "portion_size", "dish_category"]
+    source_url = "chowdeck"
+
+    def clean(self, chunk):
+        chunk["price"] = pd.to_numeric(chunk["price"], errors="coerce")
+        chunk["taste"] = pd.to_numeric(chunk["taste"], errors="coerce")
+        chunk["description"] = np.nan
+        chunk["source_url"] = self.source_url
+        return chunk
+
+
+class ChowdeckDump(Source):
+    """
+    Raw API dump (chowdeck_scraper.py output): 50 columns, of which only
+    the six below are parsed. Prices are in pesewas; no taste ratings.
+    """
+
+    name = "chowdeck"
+    usecols = ["name", "price", "category", "restaurant", "is_published", "is_active"]
+    source_url = "chowdeck"
+
+    def clean(self, chunk):
+        listed = (chunk["is_published"].astype(str) != "False") & (chunk["is_active"].astype(str) != "False")
+        chunk = chunk[listed]
+        price = pd.to_numeric(chunk["price"], errors="coerce")
+        # category is a dict repr: "{'id': 1, 'name': 'Soup ', ...}"
+        category = chunk["category"].astype("string").str.extract(r"'name': '([^']*)'")[0].str.strip()
+        return pd.DataFrame({
+            "restaurant": chunk["restaurant"],
+            "food": chunk["name"],
+            "price": (price / 100).where(price > 0),  # 0 = "ask the vendor", unpriced
+            "taste": np.nan,
+            "location": "Accra",
+            "dish_category": category.replace("", pd.NA).fillna("Uncategorized"),
+            "source_url": self.source_url,
+        })
+
+
+class ManualMenus(Source):
+    """Hand-collected menus: prices as typed ('GH₵ 45', '95-125'), free-form casing."""
+
+    name = "manual"
+    usecols = staticmethod(lambda column: column.strip() in TARGET_COLS)  # header has ' source_url'
+    source_url = "manual_entry"
+
+    def clean(self, chunk):
+        chunk = chunk[chunk["restaurant"] != "restaurant"].copy()  # header lines pasted mid-file
+        chunk["food"] = chunk["food"].str.strip().str.title()
+        chunk["dish_category"] = chunk["dish_category"].str.strip().str.title()
+        chunk["price"] = clean_prices(chunk["price"])
+        chunk["source_url"] = self.source_url
+        return chunk
+
+
+class ScrapedMenus(Source):
+    """website_scrape.py output; rows carry their page URL (older hand-scraped rows have none)."""
+
+    name = "scraped"
+    usecols = staticmethod(lambda column: column.strip() in TARGET_COLS)
+
+    def owns(self, df):
+        url = df["source_url"]
+        return (url.isna() | url.astype(str).str.startswith("http")).to_numpy()
+
+    def clean(self, chunk):
+        chunk["price"] = clean_prices(chunk["price"])
+        return chunk
+
+
+def default_sources(chowdeck="menus"):
+    """The inputs the notebook merged; chowdeck="dump" reads the raw API dump instead."""
+    return [
+        ChowdeckDump("DATA/chowdeck_full_dump.csv") if chowdeck == "dump" else ChowdeckMenus("chowdeck_menus.csv"),
+        ManualMenus("DATA/manual_restaurant_menus.csv"),
+        ScrapedMenus("DATA/ghana_restaurant_menus.csv"),
+    ]
+
+
+# ========== STATE ==========
+def load_state(path=ETL_STATE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state, path=ETL_STATE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def fingerprint(source, previous=None):
+    """
+    {path: [size, mtime_ns, sha256]} of a source's inputs. Files whose size
+    and mtime match the previous run reuse its hash instead of re-reading.
+    """
+    previous = (previous or {}).get("inputs", {})
+    out = {}
+    for path in source.paths:
+        st = os.stat(path)
+        old = previous.get(path)
+        if old and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+            out[path] = old
+        else:
+            out[path] = [st.st_size, st.st_mtime_ns, file_sha256(path)]
+    return out
+
+
+def _same_inputs(a, b):
+    return {p: v[2] for p, v in a.items()} == {p: v[2] for p, v in (b or {}).items()}
+
+
+# ========== MERGE ==========
+def carry_ratings(fresh, current):
+    """
+    Rows that already collected crowd votes keep their averaged taste and
+    vote count when their source is reloaded; everything else comes from
+    the source as is.
+    """
+    rated = current[pd.to_numeric(current["votes_count"], errors="coerce").fillna(1) > 1]
+    if rated.empty or fresh.empty:
+        return fresh
+    key = lambda df: df["restaurant"].astype(str).str.lower() + "\x00" + df["food"].astype(str).str.lower()  # noqa: E731
+    rated = rated.assign(_key=key(rated)).drop_duplicates("_key").set_index("_key")
+    keys = key(fresh)
+    hit = keys.isin(rated.index).to_numpy()
+    fresh = fresh.copy()
+    fresh.loc[hit, "taste"] = rated.loc[keys[hit], "taste"].to_numpy()
+    fresh.loc[hit, "votes_count"] = rated.loc[keys[hit], "votes_count"].to_numpy()
+    return fresh
+
+
+def run(sources=None, store=None, state_path=ETL_STATE, force=False, build_index=True, resolve=True):
+    """
+    Rebuild the master catalog from the sources whose inputs changed since
+    the last run. Rows of unchanged sources, and rows no source owns (user
+    submissions), are kept as they are in the store. With `resolve`,
+    near-duplicate dishes are then merged (entity_resolution.py). Returns
+    {source name: rows loaded} for the rebuilt sources, plus the number of
+    "merged duplicates" ({} = nothing to do).
+    """
+    sources = sources if sources is not None else default_sources()
+    store = store if store is not None else get_store()
+    state = load_state(state_path)
+    exists = store.exists()
+
+    prints = {s.name: fingerprint(s, state.get(s.name)) for s in sources}
+    changed = [s for s in sources
+               if force or not exists or not _same_inputs(prints[s.name], state.get(s.name, {}).get("inputs"))]
+    if not changed:
+        return {}
+
+    if exists:
+        current, _ = store.load()
+        current = current.reindex(columns=COLUMNS)
+    else:
+        current = pd.DataFrame(columns=COLUMNS)
+    owned = np.zeros(len(current), dtype=bool)
+    parts, loaded = [], {}
+    for source in sources:
+        mine = source.owns(current)
+        owned |= mine
+        if source in changed:
+            rows = carry_ratings(source.read(), current[mine])
+            loaded[source.name] = len(rows)
+        else:
+            rows = current[mine]
+        parts.append(rows)
+    parts.append(current[~owned])  # user submissions etc.
+
+    master = pd.concat([p for p in parts if len(p)], ignore_index=True).reindex(columns=COLUMNS)
+    if resolve:
+        master, loaded["merged duplicates"] = resolve_catalog(master)
+    store.replace_catalog(master)
+    if build_index:
+        # compile the snapshot (columns + search indexes) now, not on the first request
+        from engine import RecommendationEngine
+        RecommendationEngine.from_store(store)
+
+    for source in changed:
+        state[source.name] = {"inputs": prints[source.name], "rows": loaded[source.name]}
+    save_state(state, state_path)
+    return loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the master catalog from the menu sources")
+    parser.add_argument("--chowdeck", choices=["menus", "dump"], default="menus",
+                        help="curated chowdeck_menus.csv (with seed tastes) or the raw API dump")
+    parser.add_argument("--state", default=ETL_STATE)
+    parser.add_argument("--force", action="store_true", help="rebuild every source")
+    parser.add_argument("--no-resolve", action="store_true", help="keep near-duplicate dishes as separate rows")
+    args = parser.parse_args()
+
+    loaded = run(default_sources(args.chowdeck), state_path=args.state, force=args.force,
+                 resolve=not args.no_resolve)
+    if not loaded:
+        print("✅ Master catalog is up to date; no source changed")
+    else:
+        summary = ", ".join(f"{name} ({n} rows)" for name, n in loaded.items())
+        print(f"✅ Rebuilt {summary}")
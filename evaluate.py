@@ -1,47 +1,17 @@
 # evaluate.py
-import pandas as pd
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler
-from rapidfuzz import process
-from sklearn.metrics import ndcg_score
-import matplotlib.pyplot as plt
-import seaborn as sns
-import re 
-
-# ========== LOAD & PREP DATA ==========
-df = pd.read_csv("ghana_restaurants_master.csv")
-df['price'] = pd.to_numeric(df['price'], errors='coerce')
-df['taste'] = pd.to_numeric(df['taste'], errors='coerce')
-df = df.dropna(subset=["price"])
-
-# Normalize
-scaler = MinMaxScaler()
-df['price_norm'] = 1 - scaler.fit_transform(df[['price']])
-df['taste_norm'] = scaler.fit_transform(df[['taste']].fillna(0))
-
-# ========== RECOMMENDER FUNCTION (copied from app.py) ==========
-def recommend_dish_fuzzy(dish_name, df, top_k=5, cheap_bias=0.5, cutoff=70):
-    unique_dishes = df['food'].dropna().unique().tolist()
-    results = process.extract(dish_name, unique_dishes, limit=10, score_cutoff=cutoff)
-    
-    if not results:
-        # Return empty DataFrame instead of string
-        return dish_name, pd.DataFrame()
-    
-    matched_names = [r[0] for r in results]
-    try:
-        pattern = '|'.join([re.escape(name) for name in matched_names])
-        mask = df['food'].str.contains(pattern, case=False, na=False, regex=True)
-        subset = df[mask].copy()
-    except Exception as e:
-        print(f"Error in pattern matching: {e}")
-        return dish_name, pd.DataFrame()
-    
-    if subset.empty:
-        return dish_name, pd.DataFrame()  # ← RETURN EMPTY DF, NOT STRING
-    
-    subset['user_score'] = cheap_bias * subset['price_norm'] + (1 - cheap_bias) * subset['taste_norm']
-    return matched_names[0], subset.sort_values('user_score', ascending=False).head(top_k)
+import pandas as pd
+
+from engine import RecommendationEngine, top_k_positions
+from personalize import FACTORS, ITERATIONS, REG, train
+from storage import USER_RATING_COLUMNS, get_store
 
 # ========== SIMULATED USERS ==========
 ground_truth = {
@@ -63,96 +33,332 @@ ground_truth = {
 }
 
 
-# ========== HELPER: Get Recommendations for User ==========
-def get_recommendations_for_user(user_profile, df, cheap_bias=0.5, top_k=5):
-    all_results = []
-    for dish in user_profile['liked_dishes']:
-        match, results_df = recommend_dish_fuzzy(dish, df, top_k=top_k, cheap_bias=cheap_bias)
-        print(f"🔍 Searching for '{dish}' → found {len(results_df)} results")
-        if not results_df.empty:
-            # 🚫 DISABLE FILTERS FOR EVALUATION
-            filtered = results_df.copy()  # ← KEY CHANGE
-            print(f"✅ After filtering: {len(filtered)} results")
-            all_results.append(filtered)
-    
-    if not all_results:
-        return pd.DataFrame()
-    
-    combined = pd.concat(all_results).drop_duplicates().sort_values('user_score', ascending=False)
-    return combined.head(top_k)
-
-# ========== METRIC CALCULATION ==========
-def evaluate_metrics(recommended_df, user_profile, all_dishes_in_db):
-    if len(recommended_df) == 0:
+def synthetic_profiles(catalog, n, seed=0, min_keywords=2, max_keywords=5, min_rows=5):
+    """
+    `n` random user profiles shaped like ground_truth: liked keywords drawn
+    from the words of the catalog's dish names (those in at least
+    `min_rows` rows, weighted by frequency), price / taste limits drawn
+    around the catalog's own distribution.
+    """
+    rng = np.random.default_rng(seed)
+    words = catalog["food"].dropna().str.lower().str.findall(r"[a-z]{3,}").explode().value_counts()
+    words = words[words >= min_rows]
+    vocab, weights = words.index.to_numpy(), (words / words.sum()).to_numpy()
+    prices = pd.to_numeric(catalog["price"], errors="coerce").dropna().to_numpy()
+    profiles = {}
+    for i in range(n):
+        k = rng.integers(min_keywords, max_keywords + 1)
+        liked = rng.choice(vocab, size=min(k, len(vocab)), replace=False, p=weights)
+        profiles[f"synthetic_{i:05d}"] = {
+            "liked_dishes": [w.title() for w in liked],
+            "max_price": float(np.round(rng.choice(prices), 1)),
+            "min_taste": float(np.round(rng.uniform(5.0, 8.0), 1)),
+        }
+    return profiles
+
+
+# ========== RELEVANCE ==========
+class KeywordLabels:
+    """
+    Relevance labels over the whole catalog: a row is relevant to a liked
+    keyword when its dish name contains it (case-insensitive substring).
+    One vectorized scan per distinct keyword, memoized for the process.
+    Rows not `alive` (removed from the catalog, never recommended) are
+    never relevant.
+    """
+
+    def __init__(self, foods, alive=None):
+        self.foods = pd.Series(foods, dtype="string").str.lower()
+        self.alive = None if alive is None else np.asarray(alive, dtype=bool)
+        self.masks = {}
+
+    def mask(self, keyword):
+        if keyword not in self.masks:
+            pattern = re.escape(keyword.lower())
+            mask = self.foods.str.contains(pattern, regex=True, na=False).to_numpy()
+            self.masks[keyword] = mask if self.alive is None else mask & self.alive
+        return self.masks[keyword]
+
+    def relevant(self, profile):
+        """Rows relevant to a profile: any of its liked keywords occurs in the name."""
+        return np.logical_or.reduce([self.mask(kw) for kw in profile["liked_dishes"]])
+
+
+# ========== METRICS ==========
+def metrics_at_k(ranked, relevant, k):
+    """
+    Precision / Recall / NDCG at k for a ranked list of catalog rows.
+
+    precision : relevant hits in the top k / k
+    recall    : hits / relevant rows in the whole catalog
+    ndcg      : DCG of the top k over the best DCG the catalog allows
+                (min(k, #relevant) relevant rows on top), binary gains
+    """
+    top = np.asarray(ranked[:k], dtype=np.int64)
+    n_relevant = int(relevant.sum())
+    if n_relevant == 0:
         return 0.0, 0.0, 0.0
-    
-    rec_dishes = recommended_df['food'].str.lower().tolist()
-    liked_dishes = [d.lower() for d in user_profile['liked_dishes']]
-    
-    # 🔥 FUZZY MATCHING: A recommended dish is "relevant" if it CONTAINS any liked keyword
-    relevant_recs = []
-    for rec_dish in rec_dishes:
-        is_relevant = any(liked in rec_dish for liked in liked_dishes)
-        if is_relevant:
-            relevant_recs.append(rec_dish)
-    
-    # Precision@K
-    precision = len(relevant_recs) / len(rec_dishes) if len(rec_dishes) > 0 else 0.0
-    
-    # Recall@K: We'll skip for now (hard to define "all relevant in DB" with fuzzy logic)
-    # For simplicity, set recall = precision in this context
-    recall = precision  # ← Temporary simplification
-    
-    # NDCG@K
-    y_true = []
-    y_score = []
-    for dish in rec_dishes:
-        is_rel = any(liked in dish for liked in liked_dishes)
-        y_true.append(1 if is_rel else 0)
-        row = recommended_df[recommended_df['food'].str.lower() == dish].iloc[0]
-        y_score.append(row['user_score'])
-    
-    if sum(y_true) == 0:
-        ndcg = 0.0
+    gains = relevant[top].astype(float)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    hits = gains.sum()
+    dcg = float(gains @ discounts[:len(top)])
+    idcg = float(discounts[:min(k, n_relevant)].sum())
+    return hits / k, hits / n_relevant, dcg / idcg
+
+
+# ========== RECOMMENDATIONS ==========
+def keyword_results(engine, keywords, biases, top_k, cutoff=70):
+    """
+    {(keyword, bias): (row positions, user scores)}, best first, from one
+    batched ranking per keyword shared by every bias.
+    """
+    out = {}
+    for kw, (_, ranking) in zip(keywords, engine.rankings(keywords, top_k=top_k, cutoff=cutoff)):
+        for bias in biases:
+            out[(kw, bias)] = ranking.top(bias) if ranking is not None else (np.empty(0, np.int64), np.empty(0))
+    return out
+
+
+def recommend_for_user(profile, results, bias, top_k):
+    """
+    The profile's top_k rows at one bias: each liked keyword's winners,
+    merged, de-duplicated and re-sorted by user score (the app-level
+    "search each dish I like" behaviour).
+    """
+    parts = [results[(kw, bias)] for kw in profile["liked_dishes"]]
+    rows = np.concatenate([p[0] for p in parts])
+    scores = np.concatenate([p[1] for p in parts])
+    rows, first = np.unique(rows, return_index=True)
+    scores = scores[first]
+    order = np.lexsort((rows, -scores))  # score desc, then row order for ties
+    return rows[order][:top_k]
+
+
+# ========== GRID ==========
+_engine = _labels = None
+
+
+def _init_worker():
+    global _engine, _labels
+    _engine = RecommendationEngine.from_store(get_store())  # maps the snapshot: cheap per process
+    _labels = KeywordLabels(_engine.df["food"], _engine.alive)
+
+
+def evaluate_chunk(profiles, biases, ks, cutoff=70, engine=None, labels=None):
+    """
+    Metric rows for every profile × bias × k in `profiles` ({name: profile}).
+    Rankings are fetched once per distinct keyword, at the largest k.
+    """
+    engine, labels = engine or _engine, labels or _labels
+    keywords = list(dict.fromkeys(kw for p in profiles.values() for kw in p["liked_dishes"]))
+    max_k = max(ks)
+    results = keyword_results(engine, keywords, biases, max_k, cutoff)
+    rows = []
+    for name, profile in profiles.items():
+        relevant = labels.relevant(profile)
+        for bias in biases:
+            ranked = recommend_for_user(profile, results, bias, max_k)
+            for k in ks:
+                precision, recall, ndcg = metrics_at_k(ranked, relevant, k)
+                rows.append({"profile": name, "cheap_bias": float(bias), "k": int(k),
+                             "precision": precision, "recall": recall, "ndcg": ndcg,
+                             "num_recs": int(min(k, len(ranked))), "num_relevant": int(relevant.sum())})
+    return rows
+
+
+def evaluate_grid(profiles, biases=(0.0, 0.5, 1.0), ks=(5,), cutoff=70, jobs=None, chunk_size=250, engine=None):
+    """
+    DataFrame of metrics for the whole profile × bias × k grid. Profiles are
+    split into chunks fanned out over `jobs` processes (each maps the same
+    catalog snapshot); jobs=1 runs in-process on `engine`.
+    """
+    names = list(profiles)
+    chunks = [{n: profiles[n] for n in names[i:i + chunk_size]} for i in range(0, len(names), chunk_size)]
+    if jobs == 1 or len(chunks) == 1:
+        engine = engine or RecommendationEngine.from_store(get_store())
+        labels = KeywordLabels(engine.df["food"], engine.alive)
+        rows = [r for chunk in chunks for r in evaluate_chunk(chunk, biases, ks, cutoff, engine, labels)]
     else:
-        while len(y_true) < 5:
-            y_true.append(0)
-            y_score.append(0.0)
-        ndcg = ndcg_score([y_true[:5]], [y_score[:5]], k=5)
-    
-    return precision, recall, ndcg
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+            futures = [pool.submit(evaluate_chunk, chunk, biases, ks, cutoff) for chunk in chunks]
+            rows = [r for f in futures for r in f.result()]
+    return pd.DataFrame(rows)
+
+
+# ========== PERSONALIZATION ==========
+def simulated_ratings(catalog, n_users, votes_per_user=40, traits=4, strength=1.5, noise=0.5, seed=0):
+    """
+    Per-user votes (store.user_ratings() shape) from `n_users` simulated
+    people whose taste departs from the catalog's by a low-rank preference:
+    every restaurant and dish category gets a random trait vector, every
+    user a random weighting of the traits, and a vote is
+
+      catalog taste + strength × (weights · traits) + noise, rounded into 1-10
+
+    Each user votes on `votes_per_user` dishes drawn by popularity
+    (votes_count). Lets the personalized ranking be compared before real
+    per-user votes exist.
+    """
+    rng = np.random.default_rng(seed)
+    restaurant_ids, restaurants = pd.factorize(catalog["restaurant"].astype(str))
+    category_ids, categories = pd.factorize(catalog["dish_category"].astype(str))
+    dish_traits = (rng.normal(size=(len(restaurants), traits))[restaurant_ids]
+                   + rng.normal(size=(len(categories), traits))[category_ids]) / np.sqrt(2 * traits)
+    taste = pd.to_numeric(catalog["taste"], errors="coerce").to_numpy(dtype=np.float64)
+    taste = np.where(np.isnan(taste), np.nanmean(taste), taste)
+    popularity = pd.to_numeric(catalog["votes_count"], errors="coerce").fillna(1).clip(lower=1).to_numpy(float)
+    popularity /= popularity.sum()
+
+    per_user = min(votes_per_user, len(catalog))
+    dishes = np.concatenate([rng.choice(len(catalog), size=per_user, replace=False, p=popularity)
+                             for _ in range(n_users)])
+    users = np.repeat(np.arange(n_users), per_user)
+    weights = rng.normal(size=(n_users, traits))
+    votes = taste[dishes] + strength * np.einsum("ij,ij->i", weights[users], dish_traits[dishes])
+    votes = np.clip(np.round(votes + rng.normal(scale=noise, size=len(votes))), 1, 10)
+    return pd.DataFrame({"user": [f"simulated_{u:05d}" for u in users],
+                         "restaurant": catalog["restaurant"].to_numpy()[dishes],
+                         "food": catalog["food"].to_numpy()[dishes],
+                         "rating": votes, "ts": np.arange(len(votes), dtype=float)}, columns=USER_RATING_COLUMNS)
+
+
+def holdout_split(ratings, fraction=0.2):
+    """(train, test) votes: each user's latest `fraction` of votes (rounded down) is held out."""
+    ratings = ratings.sort_values("ts", kind="stable")
+    newest_first = ratings.groupby("user").cumcount(ascending=False)
+    held = newest_first < np.floor(ratings.groupby("user")["user"].transform("size") * fraction)
+    return ratings[~held], ratings[held]
+
+
+def compare_personalized(engine, ratings, biases=(0.0, 0.5, 1.0), ks=(5,), holdout=0.2, relevant_at=7.0,
+                         factors=FACTORS, reg=REG, iterations=ITERATIONS):
+    """
+    Global vs personalized ranking on held-out votes. Factors are trained
+    on all but each user's latest votes (holdout_split) and attached to
+    `engine`; each user's held-out dishes are then ranked by user_score
+    with the global taste and with their predicted taste. A held-out dish
+    is relevant when its vote is at least `relevant_at`.
+
+    Returns (metric rows DataFrame with a `ranking` column, {ranking: RMSE
+    of the predicted taste against the held-out votes}).
+    """
+    train_votes, test_votes = holdout_split(ratings, holdout)
+    model = train(engine, train_votes, factors, reg, iterations)
+    engine.use_factors(model)
+    rows = engine.positions(test_votes["restaurant"].tolist(), test_votes["food"].tolist())
+    test_votes = test_votes.assign(row=rows)[rows >= 0]
+
+    metrics, errors = [], {"global": [], "personal": []}
+    for user, votes in test_votes.groupby("user", sort=False):
+        dishes = votes["row"].to_numpy()
+        actual = votes["rating"].to_numpy(dtype=float)
+        vector = engine.user_vector(user)
+        tastes = {"global": engine.taste_norm[dishes],
+                  "personal": engine.taste_norm[dishes] if vector is None else engine.personal_taste(dishes, vector)}
+        errors["global"].append(engine.predicted_taste(dishes) - actual)
+        errors["personal"].append(engine.predicted_taste(dishes, user) - actual)
+        relevant = actual >= relevant_at
+        if len(dishes) < 2 or not relevant.any():
+            continue  # nothing to order
+        for name, taste in tastes.items():
+            for bias in biases:
+                ranked = top_k_positions(bias * engine.price_norm[dishes] + (1 - bias) * taste, len(dishes))
+                for k in ks:
+                    precision, recall, ndcg = metrics_at_k(ranked, relevant, k)
+                    metrics.append({"profile": user, "ranking": name, "cheap_bias": float(bias), "k": int(k),
+                                    "precision": precision, "recall": recall, "ndcg": ndcg,
+                                    "num_relevant": int(relevant.sum())})
+    rmse = {name: float(np.sqrt(np.mean(np.concatenate(e) ** 2))) if e else float("nan")
+            for name, e in errors.items()}
+    return pd.DataFrame(metrics), rmse
+
+
+def summarize(results):
+    """Mean metrics per (cheap_bias, k) over all profiles (and per ranking, when compared)."""
+    keys = ["ranking", "cheap_bias", "k"] if "ranking" in results else ["cheap_bias", "k"]
+    return results.groupby(keys)[["precision", "recall", "ndcg"]].mean().reset_index()
+
+
+def save_plot(eval_df, path="precision_plot.png"):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.figure(figsize=(10, 6))
+    sns.barplot(data=eval_df, x="User Profile", y="Precision@5", hue="Cheap Bias")
+    plt.title("Precision@5 Across User Profiles")
+    plt.ylabel("Precision@5")
+    plt.xticks(rotation=15)
+    plt.legend(title="Cheap Bias")
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+
+
 # ========== RUN EVALUATION ==========
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline evaluation of the recommender")
+    parser.add_argument("--synthetic", type=int, default=0, metavar="N",
+                        help="evaluate N synthetic profiles instead of the 3 hand-written ones")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--biases", type=float, nargs="+", default=[0.0, 0.5, 1.0])
+    parser.add_argument("--k", type=int, nargs="+", default=[5], help="cutoffs to report (P/R/NDCG@k)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (1 = in-process)")
+    parser.add_argument("--out", default=None, help="write every metric row + the summary as JSON")
+    parser.add_argument("--personalized", action="store_true",
+                        help="compare personalized and global rankings on held-out per-user votes")
+    parser.add_argument("--simulate-users", type=int, default=0, metavar="N",
+                        help="with --personalized: N simulated voters instead of the store's recorded votes")
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of each user's latest votes held out")
+    parser.add_argument("--factors", type=int, default=FACTORS)
+    parser.add_argument("--reg", type=float, default=REG)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    store = get_store()
+    engine = RecommendationEngine.from_store(store)  # same backend as app.py (TASTEPRICE_DB or CSV)
+    if args.personalized:
+        ratings = (simulated_ratings(engine.catalog, args.simulate_users, seed=args.seed) if args.simulate_users
+                   else store.user_ratings())
+        if not len(ratings):
+            raise SystemExit("No per-user votes recorded yet: use --simulate-users N")
+        results, rmse = compare_personalized(engine, ratings, args.biases, args.k, args.holdout,
+                                             factors=args.factors, reg=args.reg, iterations=args.iterations)
+        profiles = ratings["user"].unique()
+    else:
+        profiles = synthetic_profiles(engine.catalog, args.synthetic, args.seed) if args.synthetic else ground_truth
+        results = evaluate_grid(profiles, args.biases, args.k, jobs=args.jobs, engine=engine)
+    elapsed = time.perf_counter() - started
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"profiles": len(profiles), "biases": args.biases, "k": args.k,
+                       "seconds": round(elapsed, 3),
+                       "summary": summarize(results).to_dict("records"),
+                       **({"rmse": rmse} if args.personalized else {}),
+                       "results": results.to_dict("records")}, f, indent=1)
+        print(f"💾 {len(results)} metric rows written to {os.path.abspath(args.out)}")
+
+    if args.personalized:
+        print(f"\n📊 PERSONALIZED vs GLOBAL, {len(profiles)} USERS ({elapsed:.1f}s):\n")
+        print(summarize(results).round(3).to_markdown(index=False))
+        print(f"\n🎯 Taste RMSE on held-out votes: global {rmse['global']:.3f}, personalized {rmse['personal']:.3f}")
+    elif args.synthetic:
+        print(f"\n📊 MEAN OVER {len(profiles)} PROFILES ({elapsed:.1f}s):\n")
+        print(summarize(results).round(3).to_markdown(index=False))
+    else:
+        # Print markdown table for paper (one column group per k)
+        eval_df = results.pivot_table(index=["profile", "cheap_bias"], columns="k", sort=False,
+                                      values=["precision", "recall", "ndcg", "num_recs"])
+        table = pd.DataFrame({"User Profile": eval_df.index.get_level_values(0),
+                              "Cheap Bias": eval_df.index.get_level_values(1)})
+        for k in args.k:
+            table[f"Precision@{k}"] = eval_df[("precision", k)].round(2).to_numpy()
+            table[f"Recall@{k}"] = eval_df[("recall", k)].round(2).to_numpy()
+            table[f"NDCG@{k}"] = eval_df[("ndcg", k)].round(2).to_numpy()
+        table["Num Recs"] = eval_df[("num_recs", max(args.k))].astype(int).to_numpy()
+        print("\n📊 EVALUATION RESULTS:\n")
+        print(table.to_markdown(index=False))
 
-all_dishes_in_db = df['food'].dropna().str.lower().unique().tolist()
-results_table = []
-
-for user_name, profile in ground_truth.items():
-    for bias in [0.0, 0.5, 1.0]:
-        recs = get_recommendations_for_user(profile, df, cheap_bias=bias, top_k=5)
-        prec, rec, ndcg = evaluate_metrics(recs, profile, all_dishes_in_db)
-        results_table.append({
-            "User Profile": user_name,
-            "Cheap Bias": bias,
-            "Precision@5": round(prec, 2),
-            "Recall@5": round(rec, 2),
-            "NDCG@5": round(ndcg, 2),
-            "Num Recs": len(recs)
-        })
-
-# Convert to DataFrame
-eval_df = pd.DataFrame(results_table)
-
-# Print markdown table for paper
-print("\n📊 EVALUATION RESULTS:\n")
-print(eval_df.to_markdown(index=False))
-
-# Optional: Save plot
-plt.figure(figsize=(10, 6))
-sns.barplot(data=eval_df, x="User Profile", y="Precision@5", hue="Cheap Bias")
-plt.title("Precision@5 Across User Profiles")
-plt.ylabel("Precision@5")
-plt.xticks(rotation=15)
-plt.legend(title="Cheap Bias")
-plt.tight_layout()
-plt.savefig("precision_plot.png", dpi=150)
-print("\n📈 Plot saved as 'precision_plot.png'")
+        if 5 in args.k:
+            save_plot(table)
+            print("\n📈 Plot saved as 'precision_plot.png'")
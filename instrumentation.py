@@ -0,0 +1,210 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+QUERY_LOG = os.environ.get("TASTEPRICE_QUERY_LOG", "query_log.jsonl")
+RECENT = 2000  # records kept in memory for the diagnostics panel
+
+
+# ========== TRACES ==========
+class Trace:
+    """
+    Timings of one request (a search, a rating, a submission):
+
+      kind   : "search", "search_batch", "suggest", "rate", "add_dish"
+      fields : what the request was about (query, bias, match count,
+               cache hit / miss, ...), filled in by the code it passes through
+      stages : {stage name: milliseconds}; a stage entered twice adds up
+    """
+
+    __slots__ = ("kind", "fields", "stages", "started")
+
+    def __init__(self, kind, **fields):
+        self.kind = kind
+        self.fields = fields
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def note(self, **fields):
+        self.fields.update(fields)
+
+    def record(self):
+        return {"ts": time.time(), "kind": self.kind, **self.fields,
+                "stages": {name: round(ms, 3) for name, ms in self.stages.items()},
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 3)}
+
+
+class _Stage:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ms = (time.perf_counter() - self.started) * 1000
+        stages = self.trace.stages
+        stages[self.name] = stages.get(self.name, 0.0) + ms
+
+
+class _NullStage:
+    """What stage() hands out when no request is being traced: does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NULL_STAGE = _NullStage()
+_current = contextvars.ContextVar("tasteprice_trace", default=None)
+
+
+# ========== HOOKS ==========
+# Called from engine / service code. With tracing off, or outside a traced
+# request, each is one ContextVar lookup.
+def stage(name):
+    """Context manager timing `name` inside the current request, if any."""
+    trace = _current.get()
+    return _NULL_STAGE if trace is None else _Stage(trace, name)
+
+
+def note(**fields):
+    """Attach fields (match count, cache hit, ...) to the current request, if any."""
+    trace = _current.get()
+    if trace is not None:
+        trace.fields.update(fields)
+
+
+def count(**amounts):
+    """Add to counters of the current request (e.g. candidate rows over a batch's queries)."""
+    trace = _current.get()
+    if trace is not None:
+        for name, amount in amounts.items():
+            trace.fields[name] = trace.fields.get(name, 0) + amount
+
+
+class request:
+    """
+    `with request("search", query=q, bias=b):` traces one request and logs
+    it on exit. A nested request (the app wrapping a service call to also
+    time rendering) joins the outer one and only adds its fields. A no-op
+    while tracing is off.
+    """
+
+    __slots__ = ("trace", "token")
+
+    def __init__(self, kind, **fields):
+        self.trace = self.token = None
+        if not _log.enabled:
+            return
+        outer = _current.get()
+        if outer is None:
+            self.trace = Trace(kind, **fields)
+        else:
+            for name, value in fields.items():
+                outer.fields.setdefault(name, value)
+
+    def __enter__(self):
+        if self.trace is not None:
+            self.token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace is None:
+            return None
+        _current.reset(self.token)
+        if exc_type is not None:
+            self.trace.note(error=exc_type.__name__)
+        _log.write(self.trace.record())
+        return None
+
+
+# ========== LOG ==========
+class QueryLog:
+    """
+    Where finished requests go: the last `keep` records in memory (for the
+    diagnostics panel) and, when `path` is set, one JSON line each appended
+    to the query log with a single O_APPEND write, so several workers can
+    share the file.
+    """
+
+    def __init__(self, path=None, keep=RECENT):
+        self.enabled = False
+        self.path = path
+        self.recent = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        self.recent.append(record)
+        if self.path:
+            line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+            with self._lock:
+                fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+                try:
+                    os.write(fd, line)
+                finally:
+                    os.close(fd)
+
+
+_log = QueryLog()
+
+
+def enable(path=QUERY_LOG):
+    """Start tracing requests (process-wide); path=None keeps them in memory only."""
+    _log.path = path
+    _log.enabled = True
+
+
+def disable():
+    _log.enabled = False
+
+
+def enabled():
+    return _log.enabled
+
+
+def recent(kind=None):
+    """The in-memory records, oldest first, optionally of one kind only."""
+    return [r for r in list(_log.recent) if kind is None or r["kind"] == kind]
+
+
+def summary(records=None, percentiles=(50, 95, 99)):
+    """
+    Rolling latency table over `records` (default: everything in memory):
+    [{"kind", "stage", "count", "p50_ms", ...}], the request total first,
+    plus the ranking-cache hit rate of searches.
+    """
+    records = recent() if records is None else records
+    timings = {}
+    for r in records:
+        timings.setdefault((r["kind"], "total"), []).append(r["total_ms"])
+        for name, ms in r["stages"].items():
+            timings.setdefault((r["kind"], name), []).append(ms)
+    rows = []
+    for (kind, name), values in sorted(timings.items(), key=lambda kv: (kv[0][0], kv[0][1] != "total")):
+        qs = np.percentile(values, percentiles)
+        rows.append({"kind": kind, "stage": name, "count": len(values),
+                     **{f"p{p}_ms": round(float(q), 2) for p, q in zip(percentiles, qs)}})
+    searches = [r for r in records if r["kind"] == "search" and "cache" in r]
+    hit_rate = sum(r["cache"] == "hit" for r in searches) / len(searches) if searches else None
+    return {"stages": rows, "cache_hit_rate": hit_rate, "requests": len(records)}
+
+
+if os.environ.get("TASTEPRICE_TRACE", "").lower() in ("1", "true", "yes"):
+    enable()
@@ -0,0 +1,358 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import QUERY_LOG
+from storage import EVENT_LOG, MASTER_CSV, CsvStore, dish_key
+
+LEVELS = [1, 2, 4, 8, 16]
+
+
+# ========== WORKLOAD ==========
+def read_query_log(path=QUERY_LOG, limit=None):
+    """
+    Replayable operations from an instrumentation.py query log. Batch
+    searches only record their size and are skipped.
+    """
+    ops = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue  # torn last line of a live log
+            kind = r.get("kind")
+            if kind == "search":
+                ops.append({"op": "search", "query": r["query"], "bias": float(r.get("bias", 0.5)),
+                            "top_k": int(r.get("top_k", 5))})
+            elif kind == "suggest":
+                ops.append({"op": "suggest", "query": r.get("query", ""),
+                            "restaurant": r.get("restaurant", ""), "food": r.get("food", "")})
+            elif kind == "rate":
+                ops.append({"op": "rate", "restaurant": r["restaurant"], "food": r["food"],
+                            "rating": float(r["rating"])})
+            elif kind == "add_dish":
+                ops.append({"op": "add_dish", "restaurant": r["restaurant"], "food": r["food"],
+                            "price": r.get("price"), "taste": r.get("taste", 7), "location": r.get("location", "Accra")})
+            if limit and len(ops) >= limit:
+                break
+    return ops
+
+
+def synthetic_mix(catalog, n, seed=0, rate_share=0.1):
+    """
+    `n` operations shaped like app sessions: typeahead on a growing prefix,
+    a search, a few slider moves (same query, new bias), and now and then
+    a vote on one of the dishes, so that about `rate_share` of all
+    operations are writes.
+    """
+    rng = np.random.default_rng(seed)
+    foods = catalog["food"].dropna().astype(str)
+    words = foods.str.lower().str.findall(r"[a-z]{4,}").explode().value_counts()
+    words = words[words >= 3]
+    vocab, weights = words.index.to_numpy(), (words / words.sum()).to_numpy()
+    dishes = list(zip(catalog["restaurant"].astype(str), foods))
+
+    ops = []
+    while len(ops) < n:
+        session = []
+        query = " ".join(rng.choice(vocab, size=rng.integers(1, 3), replace=False, p=weights))
+        for cut in range(3, len(query) + 1, 2):
+            session.append({"op": "suggest", "query": query[:cut], "restaurant": "", "food": ""})
+        session.append({"op": "search", "query": query, "bias": 0.5, "top_k": 5})
+        for _ in range(rng.integers(0, 4)):
+            session.append({"op": "search", "query": query, "bias": float(rng.integers(0, 11)) / 10, "top_k": 5})
+        for _ in range(rng.poisson(rate_share / (1 - rate_share) * len(session))):
+            restaurant, food = dishes[rng.integers(len(dishes))]
+            session.append({"op": "rate", "restaurant": restaurant, "food": food,
+                            "rating": float(rng.integers(1, 11))})
+        ops.extend(session)
+    return ops[:n]
+
+
+# ========== IN-PROCESS DRIVERS ==========
+def run_op(app, op):
+    """Execute one operation against a TastePrice; returns its outcome."""
+    kind = op["op"]
+    if kind == "search":
+        match, _ = app.recommend(op["query"], top_k=op["top_k"], cheap_bias=op["bias"])
+        return "ok" if match is not None else "no match"
+    if kind == "suggest":
+        app.suggest(op["query"], op["restaurant"], op["food"])
+        return "ok"
+    if kind == "rate":
+        return "ok" if app.rate(op["restaurant"], op["food"], op["rating"]) is not None else "unknown dish"
+    if kind == "add_dish":
+        app.add_dish(op["restaurant"], op["food"], op["price"], op["taste"], op["location"])
+        return "ok"
+    raise ValueError(f"unknown operation {kind!r}")
+
+
+def run_ops(app, ops, think=0.0):
+    """[(op kind, start, seconds, outcome)] for a closed-loop client; lock timeouts are write contention."""
+    results = []
+    for op in ops:
+        start = time.monotonic()
+        try:
+            outcome = run_op(app, op)
+        except TimeoutError:
+            outcome = "lock timeout"
+        except Exception as e:  # reported, not fatal: the point is to see what breaks under load
+            outcome = f"error: {type(e).__name__}"
+        results.append((op["op"], start, time.monotonic() - start, outcome))
+        if think:
+            time.sleep(think)
+    return results
+
+
+_app = None
+
+
+def _init_process(master_path, log_path):
+    global _app
+    from service import TastePrice
+    _app = TastePrice(CsvStore(master_path, log_path))
+
+
+def _process_client(ops, think, barrier):
+    barrier.wait()  # every process has loaded its engine
+    return run_ops(_app, ops, think)
+
+
+def drive_threads(app, slices, think=0.0):
+    """One shared TastePrice, one thread per client (Streamlit sessions in one process)."""
+    with ThreadPoolExecutor(max_workers=len(slices)) as pool:
+        return [r for rs in pool.map(lambda ops: run_ops(app, ops, think), slices) for r in rs]
+
+
+def drive_processes(master_path, log_path, slices, think=0.0):
+    """One TastePrice per process over the same CSV store (several app / worker processes)."""
+    with multiprocessing.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=len(slices), initializer=_init_process,
+                                initargs=(master_path, log_path)) as pool:
+        barrier = manager.Barrier(len(slices))
+        futures = [pool.submit(_process_client, ops, think, barrier) for ops in slices]
+        return [r for f in futures for r in f.result()]
+
+
+# ========== HTTP DRIVER ==========
+def http_request(op):
+    """(method, path, body) of service.py's endpoint for an operation."""
+    kind = op["op"]
+    if kind == "search":
+        query = urlencode({"q": op["query"], "bias": op["bias"], "k": op["top_k"]})
+        return "GET", f"/recommend?{query}", None
+    if kind == "suggest":
+        query = urlencode({"q": op["query"], "restaurant": op["restaurant"], "food": op["food"]})
+        return "GET", f"/suggest?{query}", None
+    if kind == "rate":
+        return "POST", "/rate", {k: op[k] for k in ("restaurant", "food", "rating")}
+    return "POST", "/dishes", {k: op[k] for k in ("restaurant", "food", "price", "taste", "location")}
+
+
+async def _http_client(host, port, ops, think):
+    """One keep-alive connection issuing `ops` back to back."""
+    reader, writer = await asyncio.open_connection(host, port)
+    results = []
+    try:
+        for op in ops:
+            method, path, body = http_request(op)
+            data = b"" if body is None else json.dumps(body).encode("utf-8")
+            start = time.monotonic()
+            writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value)
+            payload = await reader.readexactly(length)
+            if status < 300:
+                outcome = "ok"
+            elif status == 404:
+                outcome = "no match" if op["op"] == "search" else "unknown dish"
+            else:
+                error = json.loads(payload or b"{}").get("error", "")
+                outcome = "lock timeout" if "Could not lock" in error else f"error: HTTP {status}"
+            results.append((op["op"], start, time.monotonic() - start, outcome))
+            if think:
+                await asyncio.sleep(think)
+    finally:
+        writer.close()
+    return results
+
+
+def drive_http(url, slices, think=0.0):
+    """asyncio clients, one connection each, against a running service.py."""
+    parts = urlsplit(url)
+
+    async def run():
+        clients = [_http_client(parts.hostname, parts.port or 80, ops, think) for ops in slices]
+        return [r for rs in await asyncio.gather(*clients) for r in rs]
+
+    return asyncio.run(run())
+
+
+def start_server(workdir, workers):
+    """`python service.py` on a free port over the CSV copy in `workdir`; (process, url)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    service = os.path.join(os.path.dirname(os.path.abspath(__file__)), "service.py")
+    env = {**os.environ, "TASTEPRICE_DB": ""}
+    # own process group: the workers are children of service.py and go down with it
+    proc = subprocess.Popen([sys.executable, service, "--port", str(port), "--workers", str(workers)],
+                            cwd=workdir, env=env, stdout=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError("service.py exited during startup")
+            time.sleep(0.2)
+    return proc, f"http://127.0.0.1:{port}"
+
+
+# ========== REPORT ==========
+def vote_totals(store, keys):
+    """
+    {dish key: votes a new rating adds to} in the store right now, for the
+    rated dishes: votes_count, or 0 for a dish without a taste yet (its
+    first vote replaces the placeholder count, see storage.add_rating).
+    """
+    df, _ = store.load()
+    votes = pd.to_numeric(df["votes_count"], errors="coerce").fillna(1)
+    unrated = pd.to_numeric(df["taste"], errors="coerce").isna()
+    totals = {}
+    for restaurant, food, v, empty in zip(df["restaurant"], df["food"], votes, unrated):
+        key = dish_key(restaurant, food)
+        if key in keys and key not in totals:
+            totals[key] = 0 if empty else int(v)
+    return totals
+
+
+def summarize(results, clients, before=None, after=None):
+    """One row of the throughput / latency curve."""
+    kinds = np.array([r[0] for r in results])
+    starts = np.array([r[1] for r in results])
+    secs = np.array([r[2] for r in results])
+    outcomes = np.array([r[3] for r in results])
+    wall = float((starts + secs).max() - starts.min())
+    row = {"clients": clients, "ops": len(results), "seconds": round(wall, 3),
+           "ops_per_s": round(len(results) / wall, 1)}
+    for p in (50, 95, 99):
+        row[f"p{p}_ms"] = round(float(np.percentile(secs, p) * 1000), 2)
+    for kind in ("search", "suggest", "rate", "add_dish"):
+        if (kinds == kind).any():
+            row[f"{kind}_p95_ms"] = round(float(np.percentile(secs[kinds == kind], 95) * 1000), 2)
+    row["lock_timeouts"] = int((outcomes == "lock timeout").sum())
+    row["errors"] = int(np.char.startswith(outcomes.astype(str), "error").sum())
+    if before is not None:
+        accepted = int(((kinds == "rate") & (outcomes == "ok")).sum())
+        recorded = sum(after.get(k, 0) - v for k, v in before.items())
+        row["votes_accepted"] = accepted
+        row["votes_lost"] = max(0, accepted - recorded)
+    return row
+
+
+def replay(ops, levels=LEVELS, mode="threads", master_path=MASTER_CSV, log_path=EVENT_LOG,
+           url=None, server_workers=1, think=0.0, rounds=1):
+    """
+    Replay `ops` at each concurrency level (the ops are dealt round-robin
+    to the clients, `rounds` times over) on a scratch copy of the CSV
+    store, and return the curve as a DataFrame. With mode="http" and no
+    `url`, a local service.py is started on the copy.
+    """
+    workdir = tempfile.mkdtemp(prefix="tasteprice-replay-")
+    server = None
+    try:
+        master = os.path.join(workdir, os.path.basename(MASTER_CSV))
+        log = os.path.join(workdir, os.path.basename(EVENT_LOG))
+        shutil.copy(master_path, master)
+        if os.path.exists(log_path):
+            shutil.copy(log_path, log)
+        snapshot = os.path.splitext(master_path)[0] + ".snapshot"
+        if os.path.isdir(snapshot):
+            shutil.copytree(snapshot, os.path.splitext(master)[0] + ".snapshot")
+        store = CsvStore(master, log)
+        rated = {dish_key(op["restaurant"], op["food"]) for op in ops if op["op"] == "rate"}
+
+        app = None
+        if mode == "threads":
+            from service import TastePrice
+            app = TastePrice(store)
+        elif mode == "http" and url is None:
+            server, url = start_server(workdir, server_workers)
+
+        rows = []
+        for clients in levels:
+            slices = [ops[i::clients] * rounds for i in range(clients)]
+            before = vote_totals(store, rated) if url is None or server is not None else None
+            if mode == "threads":
+                results = drive_threads(app, slices, think)
+            elif mode == "processes":
+                results = drive_processes(master, log, slices, think)
+            else:
+                results = drive_http(url, slices, think)
+            after = vote_totals(store, rated) if before is not None else None
+            rows.append(summarize(results, clients, before, after))
+            print(f"  {clients:>3} client(s): {rows[-1]['ops_per_s']:>8} ops/s, "
+                  f"p95 {rows[-1]['p95_ms']} ms, {rows[-1]['lock_timeouts']} lock timeouts")
+        return pd.DataFrame(rows)
+    finally:
+        if server is not None:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load replay against the recommend / rate path")
+    parser.add_argument("--log", default=None, help=f"query log to replay (e.g. {QUERY_LOG}); default: synthetic mix")
+    parser.add_argument("--ops", type=int, default=2000, help="operations per level (synthetic) / max read from --log")
+    parser.add_argument("--rate-share", type=float, default=0.1, help="share of votes in the synthetic mix")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=["threads", "processes", "http"], default="threads")
+    parser.add_argument("--levels", type=int, nargs="+", default=LEVELS, help="concurrent clients per step")
+    parser.add_argument("--url", default=None, help="running service.py to hit (http mode; changes its data!)")
+    parser.add_argument("--server-workers", type=int, default=1, help="workers of the local service.py (http mode)")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds each client waits between operations")
+    parser.add_argument("--rounds", type=int, default=1, help="times each client repeats its share")
+    parser.add_argument("--out", default=None, help="write the curve as JSON")
+    args = parser.parse_args()
+
+    if args.log:
+        ops = read_query_log(args.log, args.ops)
+    else:
+        catalog, _ = CsvStore().load()
+        ops = synthetic_mix(catalog, args.ops, args.seed, args.rate_share)
+    counts = pd.Series([op["op"] for op in ops]).value_counts().to_dict()
+    print(f"🔁 Replaying {len(ops)} operations {counts} ({args.mode})")
+
+    curve = replay(ops, args.levels, args.mode, url=args.url, server_workers=args.server_workers,
+                   think=args.think, rounds=args.rounds)
+    print("\n📈 THROUGHPUT / LATENCY:\n")
+    print(curve.to_markdown(index=False))
+    if args.out:
+        curve.to_json(args.out, orient="records", indent=1)
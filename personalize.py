@@ -0,0 +1,172 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# ALS defaults: factor size, weighted-λ regularization, sweeps
+FACTORS = 16
+REG = 0.1
+ITERATIONS = 10
+
+
+# ========== MODEL ==========
+class TasteFactors:
+    """
+    Per-user taste learned from individual votes (see train):
+
+      predicted taste(user, dish) = catalog taste(dish) + user_factors[user] · dish_factors[dish]
+
+    A user the model was not trained on, or a dish none of its users
+    rated, keeps the catalog's global taste, so the ranking falls back to
+    the everyone-gets-the-same one.
+
+    users        : user ids, one per row of user_factors
+    user_factors : (users × f) float32
+    restaurants  : lower-cased restaurant of each dish, one per row of dish_factors
+    foods        : lower-cased dish name of each dish
+    dish_factors : (dishes × f) float32
+    info         : training parameters and counts
+    """
+
+    def __init__(self, users, user_factors, restaurants, foods, dish_factors, info=None):
+        self.users = np.asarray(users, dtype=str)
+        self.user_factors = np.asarray(user_factors, dtype=np.float32)
+        self.restaurants = np.asarray(restaurants, dtype=str)
+        self.foods = np.asarray(foods, dtype=str)
+        self.dish_factors = np.asarray(dish_factors, dtype=np.float32)
+        self.info = info or {}
+        self._user_ids = {user: i for i, user in enumerate(self.users.tolist())}
+
+    def __len__(self):
+        return len(self.users)
+
+    def user_vector(self, user):
+        """The user's factors, or None for a user the model has not seen."""
+        i = self._user_ids.get(str(user))
+        return None if i is None else self.user_factors[i]
+
+    def save(self, path):
+        """Write to `path` (.npz) through a temp file, so readers never see half a model."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, users=self.users, user_factors=self.user_factors, restaurants=self.restaurants,
+                     foods=self.foods, dish_factors=self.dish_factors, info=np.asarray(json.dumps(self.info)))
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["users"], data["user_factors"], data["restaurants"], data["foods"],
+                       data["dish_factors"], json.loads(str(data["info"])))
+
+
+# ========== ALS ==========
+def solve_factors(matrix, other, reg, block=65536):
+    """
+    One ALS half-step: least-squares factors for every row of the sparse
+    (CSR) `matrix` given the factors of its columns, `other`. Row u solves
+
+      (Σ y_j y_jᵀ + reg · n_u · I) x_u = Σ r_uj y_j     over the n_u columns it rated
+
+    Rows are taken in blocks of about `block` ratings. A block's Σ y_j y_jᵀ
+    is one sparse product of its rating pattern with the flattened outer
+    products of the columns it touches, and its small systems are solved
+    in one batched np.linalg.solve. Every row must have at least one rating.
+    """
+    from scipy import sparse
+
+    n, f = matrix.shape[0], other.shape[1]
+    indptr, columns, values = matrix.indptr, matrix.indices, matrix.data
+    counts = np.diff(indptr)
+    out = np.empty((n, f))
+    eye = np.eye(f)
+    start = 0
+    while start < n:
+        stop = min(max(int(np.searchsorted(indptr, indptr[start] + block, side="right")) - 1, start + 1), n)
+        lo, hi = indptr[start], indptr[stop]
+        touched, local = np.unique(columns[lo:hi], return_inverse=True)
+        y = other[touched]
+        pattern = sparse.csr_matrix((np.ones(hi - lo), local, indptr[start:stop + 1] - lo),
+                                    shape=(stop - start, len(touched)))
+        gram = (pattern @ (y[:, :, None] * y[:, None, :]).reshape(len(touched), f * f)).reshape(-1, f, f)
+        gram += reg * counts[start:stop, None, None] * eye
+        rhs = sparse.csr_matrix((values[lo:hi], local, indptr[start:stop + 1] - lo),
+                                shape=(stop - start, len(touched))) @ y
+        out[start:stop] = np.linalg.solve(gram, rhs[..., None])[..., 0]
+        start = stop
+    return out
+
+
+def als(users, dishes, values, shape, factors=FACTORS, reg=REG, iterations=ITERATIONS, seed=0):
+    """
+    Alternating least squares on the sparse matrix with `values` at
+    (users, dishes): (user factors, dish factors) whose products
+    approximate the observed entries. CPU only, NumPy + SciPy sparse.
+    """
+    from scipy import sparse
+
+    by_user = sparse.csr_matrix((np.asarray(values, dtype=np.float64), (users, dishes)), shape=shape)
+    by_dish = by_user.T.tocsr()
+    rng = np.random.default_rng(seed)
+    y = rng.normal(scale=0.1, size=(shape[1], factors))
+    x = np.zeros((shape[0], factors))
+    for _ in range(iterations):
+        x = solve_factors(by_user, y, reg)
+        y = solve_factors(by_dish, x, reg)
+    return x, y
+
+
+# ========== TRAINING ==========
+def train(engine, ratings, factors=FACTORS, reg=REG, iterations=ITERATIONS, seed=0):
+    """
+    TasteFactors from per-user votes (a store.user_ratings() frame). Each
+    vote becomes how far the user sits from the dish's taste in `engine`
+    (the catalog the app ranks with); repeated votes on a dish are
+    averaged, and votes on dishes no longer in the catalog are dropped.
+    The user × dish matrix of those offsets is factorized with ALS.
+    """
+    rows = engine.positions(ratings["restaurant"].tolist(), ratings["food"].tolist())
+    known = rows >= 0
+    votes = pd.DataFrame({"user": ratings["user"].astype(str).to_numpy()[known], "row": rows[known],
+                          "offset": ratings["rating"].to_numpy(dtype=np.float64)[known]
+                                    - np.nan_to_num(engine.taste[rows[known]].astype(np.float64))})
+    votes = votes.groupby(["user", "row"], sort=False, as_index=False)["offset"].mean()
+    user_ids, users = pd.factorize(votes["user"])
+    dish_ids, dishes = pd.factorize(votes["row"])
+    x, y = als(user_ids, dish_ids, votes["offset"].to_numpy(), (len(users), len(dishes)),
+               factors, reg, iterations, seed)
+
+    names = engine.frame(dishes.to_numpy())
+    info = {"factors": factors, "reg": reg, "iterations": iterations, "ratings": int(known.sum()),
+            "users": len(users), "dishes": len(dishes), "trained_at": time.time()}
+    return TasteFactors(users.to_numpy(), x, names["restaurant"].astype(str).str.lower().to_numpy(),
+                        names["food"].astype(str).str.lower().to_numpy(), y, info)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from engine import RecommendationEngine
+    from storage import get_store
+
+    parser = argparse.ArgumentParser(description="Train per-user taste factors from the stored votes")
+    parser.add_argument("--factors", type=int, default=FACTORS)
+    parser.add_argument("--reg", type=float, default=REG)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    args = parser.parse_args()
+
+    store = get_store()
+    engine = RecommendationEngine.from_store(store)
+    if engine is None:
+        raise SystemExit("Dataset not found! Please run data prep script first.")
+    ratings = store.user_ratings()
+    if not len(ratings):
+        raise SystemExit("No per-user votes recorded yet: nothing to train on.")
+    started = time.perf_counter()
+    model = train(engine, ratings, args.factors, args.reg, args.iterations)
+    model.save(store.factors_path)
+    print(f"✅ Taste factors for {model.info['users']} users × {model.info['dishes']} dishes "
+          f"({model.info['ratings']} votes) written to {store.factors_path} in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,1036 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+import numpy as np
+from pandas.util import hash_array
+from rapidfuzz import fuzz, process
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_name(text):
+    """
+    Canonical form used for matching: lowercased, accents stripped,
+    punctuation collapsed to single spaces. 'Jollof  Rice!' -> 'jollof rice'
+    """
+    if text is None or text != text:  # None / NaN
+        return ""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = text.encode("ascii", "ignore").decode("ascii").lower()
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def char_ngrams(key, n=3):
+    """Set of padded character n-grams of an already-normalized string."""
+    if not key:
+        return set()
+    padded = f" {key} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def pack_postings(postings):
+    """{key: int32 array} -> (keys, offsets, flat ids) for writing to disk."""
+    keys = list(postings)
+    lengths = np.fromiter((len(postings[k]) for k in keys), dtype=np.int64, count=len(keys))
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    flat = np.concatenate([postings[k] for k in keys]) if keys else np.empty(0, dtype=np.int32)
+    return keys, offsets, flat.astype(np.int32, copy=False)
+
+
+def unpack_postings(keys, offsets, flat):
+    """Inverse of pack_postings; every posting list is a view into `flat`."""
+    return {k: flat[offsets[i]:offsets[i + 1]] for i, k in enumerate(keys)}
+
+
+def factorize(values):
+    """(distinct values in first-seen order, int32 code per value); pandas columns are factorized in C."""
+    if hasattr(values, "factorize"):
+        codes, uniques = values.factorize(use_na_sentinel=False)
+        return list(uniques), codes.astype(np.int32)
+    ids = {}
+    codes = np.fromiter((ids.setdefault(v, len(ids)) for v in values), dtype=np.int32)
+    return list(ids), codes
+
+
+def group_rows(ids):
+    """{id: sorted row positions} for an array holding one id per row."""
+    order = np.argsort(ids, kind="stable").astype(np.int32)
+    uniq, starts = np.unique(ids[order], return_index=True)
+    bounds = np.append(starts, len(order))
+    return {int(u): order[bounds[j]:bounds[j + 1]] for j, u in enumerate(uniq)}
+
+
+class DishNameIndex:
+    """
+    Fuzzy lookup over the unique dish names of the catalog.
+
+    Names are normalized once and blocked by character trigrams, so a query
+    only scores the few names that share grams with it instead of the
+    whole catalog.
+
+    names          : iterable of raw dish names (duplicates / NaN allowed)
+    ngram          : n-gram length used for blocking
+    max_candidates : how many blocked names get a real fuzzy score
+    """
+
+    # extract_many: largest (dense cdist pairs / blocked pairs) still worth one cdist call
+    max_dense_ratio = 2.0
+
+    def __init__(self, names, ngram=3, max_candidates=200):
+        self.ngram = ngram
+        self.max_candidates = max_candidates
+        self.names = []      # first raw spelling seen for each normalized key
+        self.keys = []       # normalized key, same order as self.names
+        self._key_ids = {}
+        for name in names:
+            key = normalize_name(name)
+            if not key or key in self._key_ids:
+                continue
+            self._key_ids[key] = len(self.keys)
+            self.keys.append(key)
+            self.names.append(name)
+
+        postings = defaultdict(list)
+        gram_counts = []
+        for i, key in enumerate(self.keys):
+            grams = char_ngrams(key, ngram)
+            gram_counts.append(len(grams))
+            for gram in grams:
+                postings[gram].append(i)
+        self._postings = {g: np.asarray(ids, dtype=np.int32) for g, ids in postings.items()}
+        self._gram_counts = np.asarray(gram_counts, dtype=np.int32)
+
+    def add(self, name):
+        """Index one more dish name (no-op if its normalized form is known)."""
+        key = normalize_name(name)
+        if not key or key in self._key_ids:
+            return
+        i = len(self.keys)
+        self._key_ids[key] = i
+        self.keys.append(key)
+        self.names.append(name)
+        grams = char_ngrams(key, self.ngram)
+        for gram in grams:
+            ids = self._postings.get(gram)
+            self._postings[gram] = np.array([i], dtype=np.int32) if ids is None else np.append(ids, np.int32(i))
+        self._gram_counts = np.append(self._gram_counts, np.int32(len(grams)))
+
+    @classmethod
+    def from_frame(cls, df, column="food", **kwargs):
+        return cls(df[column].dropna().unique().tolist(), **kwargs)
+
+    def state(self):
+        """Lists + arrays that rebuild this index without re-tokenizing (see snapshot.py)."""
+        grams, offsets, ids = pack_postings(self._postings)
+        return {"names": self.names, "keys": self.keys, "grams": grams,
+                "offsets": offsets, "ids": ids, "gram_counts": self._gram_counts,
+                "ngram": self.ngram, "max_candidates": self.max_candidates}
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls([], ngram=state["ngram"], max_candidates=state["max_candidates"])
+        index.names = list(state["names"])
+        index.keys = list(state["keys"])
+        index._key_ids = {key: i for i, key in enumerate(index.keys)}
+        index._postings = unpack_postings(state["grams"], state["offsets"], state["ids"])
+        index._gram_counts = state["gram_counts"]
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def candidates(self, query):
+        """Ids of the names most similar to the query by n-gram overlap (Dice)."""
+        grams = char_ngrams(normalize_name(query), self.ngram)
+        lists = [self._postings[g] for g in grams if g in self._postings]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        ids, hits = np.unique(np.concatenate(lists), return_counts=True)
+        if len(ids) > self.max_candidates:
+            dice = hits / (self._gram_counts[ids] + len(grams))
+            keep = np.argpartition(-dice, self.max_candidates - 1)[:self.max_candidates]
+            ids = np.sort(ids[keep])
+        return ids
+
+    def extract(self, query, limit=10, score_cutoff=70):
+        """
+        Same contract as rapidfuzz.process.extract over the unique names:
+        returns a list of (name, score, name_id), best first.
+        """
+        q = normalize_name(query)
+        ids = self.candidates(q)
+        if len(ids) == 0:
+            return []
+        choices = {int(i): self.keys[i] for i in ids}
+        results = process.extract(q, choices, scorer=fuzz.WRatio,
+                                  limit=limit, score_cutoff=score_cutoff)
+        return [(self.names[i], score, i) for _, score, i in results]
+
+    def extract_many(self, queries, limit=10, score_cutoff=70, workers=-1):
+        """
+        extract() for a batch of queries with a single process.cdist call
+        over the union of their blocked candidates; each query still only
+        sees its own candidates, so results match extract() one by one.
+
+        When the queries share few candidates the dense query × union
+        matrix costs far more than the blocked pairs, and each query is
+        scored on its own instead.
+        """
+        keys = [normalize_name(q) for q in queries]
+        cand = [self.candidates(k) for k in keys]
+        union = np.unique(np.concatenate(cand)) if any(len(c) for c in cand) else np.empty(0, dtype=np.int32)
+        if len(union) == 0:
+            return [[] for _ in keys]
+        if len(keys) * len(union) > self.max_dense_ratio * sum(len(c) for c in cand):
+            return [self.extract(k, limit=limit, score_cutoff=score_cutoff) for k in keys]
+        scores = process.cdist(keys, [self.keys[i] for i in union], scorer=fuzz.WRatio,
+                               score_cutoff=score_cutoff, dtype=np.float64, workers=workers)
+        out = []
+        for q, ids in enumerate(cand):
+            cols = np.searchsorted(union, ids)
+            row = scores[q, cols]
+            hit = row >= score_cutoff
+            ids, row = ids[hit], row[hit]
+            best = np.lexsort((ids, -row))[:limit]  # score desc, then index order like extract()
+            out.append([(self.names[ids[i]], float(row[i]), int(ids[i])) for i in best])
+        return out
+
+
+class RowTokenIndex:
+    """
+    Inverted index from normalized dish-name tokens to row positions.
+
+    Replaces the `df['food'].str.contains(pattern)` scan: the rows whose
+    name contains a phrase come from intersecting the token postings of
+    that phrase, so the cost follows the size of the result, not the table.
+
+    foods : sequence of raw dish names, one per row (positional ids)
+
+    Each distinct name is normalized once: `keys` holds them and
+    `row_codes` (int32, -1 for removed rows) points each row at its key,
+    so a snapshot maps the per-row part instead of loading a string per row.
+    """
+
+    def __init__(self, foods):
+        names, codes = factorize(foods)
+        self.keys = [normalize_name(f) for f in names]
+        self.row_codes = codes
+        self._key_ids = None
+        token_keys = defaultdict(list)
+        for k, key in enumerate(self.keys):
+            for token in set(key.split()):
+                token_keys[token].append(k)
+        key_rows = group_rows(codes)
+        self._postings = {t: np.sort(np.concatenate([key_rows[k] for k in ks if k in key_rows])).astype(np.int32)
+                          for t, ks in token_keys.items()}
+
+    @classmethod
+    def from_frame(cls, df, column="food"):
+        return cls(df[column])
+
+    def state(self):
+        tokens, offsets, rows = pack_postings(self._postings)
+        return {"keys": self.keys, "row_codes": self.row_codes, "tokens": tokens, "offsets": offsets, "rows": rows}
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls([])
+        index.keys = list(state["keys"])
+        index.row_codes = state["row_codes"]
+        index._postings = unpack_postings(state["tokens"], state["offsets"], state["rows"])
+        return index
+
+    def row_key(self, row):
+        code = self.row_codes[row]
+        return self.keys[code] if code >= 0 else ""
+
+    def add(self, food):
+        """Index the next row position; postings stay sorted since it is the largest."""
+        row = len(self.row_codes)
+        key = normalize_name(food)
+        if self._key_ids is None:
+            self._key_ids = {k: i for i, k in enumerate(self.keys)}
+        code = self._key_ids.setdefault(key, len(self.keys))
+        if code == len(self.keys):
+            self.keys.append(key)
+        self.row_codes = np.append(self.row_codes, np.int32(code))
+        for token in set(key.split()):
+            rows = self._postings.get(token)
+            self._postings[token] = np.array([row], dtype=np.int32) if rows is None else np.append(rows, np.int32(row))
+        return row
+
+    def remove(self, row):
+        """Drop a row from every posting list; its position stays reserved."""
+        for token in set(self.row_key(row).split()):
+            rows = self._postings[token]
+            self._postings[token] = rows[rows != row]
+        self.row_codes[row] = -1
+
+    def __len__(self):
+        return len(self.row_codes)
+
+    def rows_containing(self, name, within=None):
+        """
+        Row positions whose normalized name contains `name` as a whole-word
+        phrase; only among the sorted rows `within` when given.
+        """
+        tokens = normalize_name(name).split()
+        if not tokens:
+            return np.empty(0, dtype=np.int32)
+        lists = [] if within is None else [within]
+        for token in set(tokens):
+            rows = self._postings.get(token)
+            if rows is None:
+                return np.empty(0, dtype=np.int32)
+            lists.append(rows)
+        lists.sort(key=len)
+        rows = lists[0]
+        for other in lists[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        if len(tokens) > 1:
+            phrase = f" {' '.join(tokens)} "
+            rows = rows[[phrase in f" {self.row_key(r)} " for r in rows]]
+        return rows
+
+    def rows_for_names(self, names, within=None):
+        """Sorted union of rows_containing() over several matched names."""
+        parts = [self.rows_containing(n, within) for n in names]
+        if not parts:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(parts))
+
+
+class DishKeyIndex:
+    """
+    (restaurant, food) -> row positions, the lookup behind rating or
+    updating a dish by name. Every row's lower-cased key is hashed to 64
+    bits (pandas' hash_array, the same in every process) and the hashes
+    are kept sorted next to their rows: a lookup is one searchsorted over
+    two arrays that a snapshot maps, instead of a dict of a million tuples
+    per process. Different keys may share a hash; callers check the rows
+    they get back.
+
+    keys : "restaurant\x1ffood" per row (see key()), lower-cased
+    """
+
+    def __init__(self, keys):
+        hashes = self.hash(keys)
+        order = np.argsort(hashes, kind="stable")
+        self.hashes = hashes[order]
+        self.rows = order.astype(np.int32)
+        self._added = {}  # hash -> rows appended since (ascending)
+
+    @staticmethod
+    def key(restaurant, food):
+        return f"{restaurant}\x1f{food}"  # not NUL: the hash reads C strings
+
+    @staticmethod
+    def hash(keys):
+        return hash_array(np.asarray(keys, dtype=object), categorize=False) if len(keys) else np.empty(0, dtype=np.uint64)
+
+    @classmethod
+    def from_frame(cls, df):
+        keys = df['restaurant'].astype(str).str.lower() + "\x1f" + df['food'].astype(str).str.lower()
+        return cls(keys.to_numpy(dtype=object))
+
+    def state(self):
+        hashes, rows = self.hashes, self.rows
+        if self._added:
+            extra = [(h, r) for h, rs in self._added.items() for r in rs]
+            hashes = np.concatenate([hashes, np.array([h for h, _ in extra], dtype=np.uint64)])
+            rows = np.concatenate([rows, np.array([r for _, r in extra], dtype=np.int32)])
+            order = np.lexsort((rows, hashes))
+            hashes, rows = hashes[order], rows[order]
+        return {"hashes": hashes, "rows": rows}
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls([])
+        index.hashes, index.rows = state["hashes"], state["rows"]
+        return index
+
+    def add(self, key, row):
+        """Index a new row (larger than every row already indexed)."""
+        self._added.setdefault(int(self.hash([key])[0]), []).append(row)
+
+    def rows_for(self, key):
+        """Row positions whose key hashes like `key`, ascending."""
+        h = self.hash([key])[0]
+        lo, hi = np.searchsorted(self.hashes, h, side="left"), np.searchsorted(self.hashes, h, side="right")
+        rows = self.rows[lo:hi]
+        added = self._added.get(int(h))
+        return np.concatenate([rows, np.asarray(added, dtype=np.int32)]) if added else rows
+
+    def lookup(self, keys):
+        """First row of rows_for() for each of many keys (-1 when none), with one searchsorted."""
+        h = self.hash(keys)
+        rows = np.full(len(h), -1, dtype=np.int64)
+        if len(self.hashes):
+            i = np.minimum(np.searchsorted(self.hashes, h), len(self.hashes) - 1)
+            hit = self.hashes[i] == h
+            rows[hit] = self.rows[i[hit]]
+        if self._added:
+            for j in np.flatnonzero(rows < 0):
+                added = self._added.get(int(h[j]))
+                if added:
+                    rows[j] = added[0]
+        return rows
+
+
+class FacetIndex:
+    """
+    Row positions partitioned by where and what a dish is: one partition
+    per normalized location, per normalized dish category and per
+    (location, category) pair that occurs, plus "all". A partition is a
+    (dimension, facet id) pair whose rows are one slice of a flat array,
+    so a snapshot maps them; rows appended later are kept on the side.
+    Removed rows stay in their partitions (callers check `alive`).
+
+    locations, categories : raw values, one per row (positional ids)
+
+    Missing values share the "" facet, which no filter selects.
+    """
+
+    DIMENSIONS = ("location", "category", "pair")
+
+    def __init__(self, locations, categories):
+        self.names, self.ids = {}, {}
+        for dim, values in (("location", locations), ("category", categories)):
+            self.names[dim], self.ids[dim] = self._facets(values)
+        width = np.int64(len(self.names["category"]))
+        pairs, pair_ids = np.unique(self.ids["location"].astype(np.int64) * width + self.ids["category"],
+                                    return_inverse=True)
+        self.pair_locations = (pairs // max(width, 1)).astype(np.int32)
+        self.pair_categories = (pairs % max(width, 1)).astype(np.int32)
+        self.ids["pair"] = pair_ids.astype(np.int32).reshape(-1)
+        self._postings = {dim: self._group(self.ids[dim], self._count(dim)) for dim in self.DIMENSIONS}
+        self._init_lookups()
+
+    def _init_lookups(self):
+        self._added = {}  # (dim, facet) -> rows appended or moved in since (ascending)
+        self._moved = False  # a row changed facets: slices may hold rows that left
+        self._name_ids = None
+        self._pair_ids = None
+        self._matches = {}
+
+    @staticmethod
+    def _facets(values):
+        """(normalized facet names, int32 facet id per row); spellings that normalize alike share a facet."""
+        raw, codes = factorize(values)
+        names = {}
+        remap = np.fromiter((names.setdefault(normalize_name(v), len(names)) for v in raw), dtype=np.int32,
+                            count=len(raw))
+        return list(names), remap[codes] if len(codes) else codes
+
+    @staticmethod
+    def _group(ids, count):
+        """(offsets, rows): the rows of facet f are rows[offsets[f]:offsets[f + 1]], ascending."""
+        order = np.argsort(ids, kind="stable").astype(np.int32)
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(ids, minlength=count)))).astype(np.int64)
+        return offsets, order
+
+    def _count(self, dim):
+        return len(self.pair_locations) if dim == "pair" else len(self.names[dim])
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df["location"], df["dish_category"])
+
+    def state(self):
+        state = {"locations": self.names["location"], "categories": self.names["category"],
+                 "pair_locations": self.pair_locations, "pair_categories": self.pair_categories}
+        for dim in self.DIMENSIONS:
+            offsets, rows = (self._group(self.ids[dim], self._count(dim)) if self._added or self._moved
+                             else self._postings[dim])
+            state.update({f"{dim}_ids": self.ids[dim], f"{dim}_offsets": offsets, f"{dim}_rows": rows})
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls.__new__(cls)
+        index.names = {"location": list(state["locations"]), "category": list(state["categories"])}
+        index.pair_locations, index.pair_categories = state["pair_locations"], state["pair_categories"]
+        index.ids = {dim: state[f"{dim}_ids"] for dim in cls.DIMENSIONS}
+        index._postings = {dim: (state[f"{dim}_offsets"], state[f"{dim}_rows"]) for dim in cls.DIMENSIONS}
+        index._init_lookups()
+        return index
+
+    def __len__(self):
+        return len(self.ids["location"])
+
+    def _facet_ids(self, location, category):
+        """Facet ids (location, category, pair) for raw values, creating facets that are new."""
+        if self._name_ids is None:
+            self._name_ids = {dim: {name: i for i, name in enumerate(self.names[dim])} for dim in self.names}
+            self._pair_ids = {(int(l), int(c)): p for p, (l, c) in
+                              enumerate(zip(self.pair_locations, self.pair_categories))}
+        ids = []
+        for dim, value in (("location", location), ("category", category)):
+            name = normalize_name(value)
+            if name not in self._name_ids[dim]:
+                self._name_ids[dim][name] = len(self.names[dim])
+                self.names[dim].append(name)
+                self._matches.clear()
+            ids.append(self._name_ids[dim][name])
+        pair = self._pair_ids.get(tuple(ids))
+        if pair is None:
+            pair = self._pair_ids[tuple(ids)] = len(self.pair_locations)
+            self.pair_locations = np.append(self.pair_locations, np.int32(ids[0]))
+            self.pair_categories = np.append(self.pair_categories, np.int32(ids[1]))
+        return ids + [pair]
+
+    def add(self, location, category):
+        """Index the next row position. Returns it."""
+        row = len(self)
+        for dim, facet in zip(self.DIMENSIONS, self._facet_ids(location, category)):
+            self.ids[dim] = np.append(self.ids[dim], np.int32(facet))
+            self._added.setdefault((dim, facet), []).append(row)
+        return row
+
+    def move(self, row, location, category):
+        """A row's location / category changed: it leaves its partitions for the new ones."""
+        for dim, facet in zip(self.DIMENSIONS, self._facet_ids(location, category)):
+            if self.ids[dim][row] != facet:
+                self.ids[dim][row] = facet
+                added = self._added.setdefault((dim, facet), [])
+                added.append(row)
+                added.sort()
+                self._moved = True
+
+    def facets_of(self, row):
+        """Every partition holding this row: [("all", 0), ("location", id), ...]."""
+        return [("all", 0)] + [(dim, int(self.ids[dim][row])) for dim in self.DIMENSIONS]
+
+    def rows(self, dim, facet):
+        """Sorted row positions of one partition (removed rows included)."""
+        if dim == "all":
+            return np.arange(len(self), dtype=np.int32)
+        offsets, flat = self._postings[dim]
+        rows = flat[offsets[facet]:offsets[facet + 1]] if facet + 1 < len(offsets) else flat[:0]
+        added = self._added.get((dim, facet))
+        if added:
+            rows = np.unique(np.concatenate([rows, np.asarray(added, dtype=np.int32)]))
+        if self._moved:
+            rows = rows[self.ids[dim][rows] == facet]
+        return rows
+
+    def match(self, dim, text):
+        """Facet ids of `dim` whose name contains `text` as a whole-word prefix: "osu" -> "accra osu"."""
+        query = normalize_name(text)
+        key = (dim, query)
+        if key not in self._matches:
+            pattern = re.compile(rf"(?:^| ){re.escape(query)}")
+            self._matches[key] = [i for i, name in enumerate(self.names[dim]) if name and pattern.search(name)]
+        return self._matches[key]
+
+    def partitions(self, location="", category=""):
+        """
+        The partitions covering a location and / or dish category filter
+        (see match), all of one dimension: locations, categories, or
+        their pairs when both are given. None without a filter (the whole
+        catalog), [] when a filter matches nothing.
+        """
+        location, category = normalize_name(location), normalize_name(category)
+        if not location and not category:
+            return None
+        if not category:
+            return [("location", f) for f in self.match("location", location)]
+        if not location:
+            return [("category", f) for f in self.match("category", category)]
+        locations, categories = set(self.match("location", location)), set(self.match("category", category))
+        return [("pair", p) for p, (l, c) in enumerate(zip(self.pair_locations.tolist(), self.pair_categories.tolist()))
+                if l in locations and c in categories]
+
+    def rows_in(self, partitions):
+        """Sorted rows of the union of `partitions` (as returned by partitions())."""
+        if len(partitions) == 1:
+            return self.rows(*partitions[0])
+        return np.unique(np.concatenate([self.rows(*part) for part in partitions] or [np.empty(0, np.int32)]))
+
+    def within(self, rows, partitions):
+        """Mask over `rows` of those in any of `partitions` (as returned by partitions())."""
+        if not partitions:
+            return np.zeros(len(rows), dtype=bool)
+        dim = partitions[0][0]
+        return np.isin(self.ids[dim][rows], [facet for _, facet in partitions])
+
+
+class PrefixIndex:
+    """
+    Typeahead lookup over unique normalized keys (restaurant or dish names).
+
+    Every word-start suffix of every key sits in one sorted list, a prefix
+    trie flattened into an array: the keys having a word that starts with
+    'ric' ('jollof rice', 'rice and stew') are one bisect range. Character
+    trigram postings find keys containing the text anywhere ('llof').
+
+    keys : unique normalized keys; a key's id is its position
+    """
+
+    def __init__(self, keys=()):
+        self.keys = list(keys)
+        self._key_ids = {key: i for i, key in enumerate(self.keys)}
+        suffixes, owners = [], []
+        for i, key in enumerate(self.keys):
+            for suffix in self._suffixes(key):
+                suffixes.append(suffix)
+                owners.append(i)
+        order = sorted(range(len(suffixes)), key=suffixes.__getitem__)
+        self._suffixes_sorted = [suffixes[j] for j in order]
+        self._owners = np.asarray(owners, dtype=np.int32)[order]
+        postings = defaultdict(list)
+        for i, key in enumerate(self.keys):
+            for gram in self._grams(key):
+                postings[gram].append(i)
+        self._postings = {g: np.asarray(ids, dtype=np.int32) for g, ids in postings.items()}
+
+    @staticmethod
+    def _suffixes(key):
+        return [key[m.start():] for m in re.finditer(r"\S+", key)]
+
+    @staticmethod
+    def _grams(text, n=3):
+        """Unpadded n-grams: a key containing `text` contains every one of them."""
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def add(self, key):
+        """Id of `key`, indexing it first if it is new. Postings stay sorted since it is the largest."""
+        i = self._key_ids.get(key)
+        if i is not None:
+            return i
+        i = len(self.keys)
+        self._key_ids[key] = i
+        self.keys.append(key)
+        for suffix in self._suffixes(key):
+            at = bisect_right(self._suffixes_sorted, suffix)
+            self._suffixes_sorted.insert(at, suffix)
+            self._owners = np.insert(self._owners, at, np.int32(i))
+        for gram in self._grams(key):
+            ids = self._postings.get(gram)
+            self._postings[gram] = np.array([i], dtype=np.int32) if ids is None else np.append(ids, np.int32(i))
+        return i
+
+    def id_of(self, key):
+        return self._key_ids.get(key)
+
+    def state(self):
+        grams, offsets, ids = pack_postings(self._postings)
+        return {"keys": self.keys, "suffixes": self._suffixes_sorted, "owners": self._owners,
+                "grams": grams, "offsets": offsets, "ids": ids}
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        index.keys = list(state["keys"])
+        index._key_ids = {key: i for i, key in enumerate(index.keys)}
+        index._suffixes_sorted = list(state["suffixes"])
+        index._owners = state["owners"]
+        index._postings = unpack_postings(state["grams"], state["offsets"], state["ids"])
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefixed(self, prefix):
+        """Ids (sorted) of the keys with a word starting with `prefix` (normalized)."""
+        if not prefix:
+            return np.empty(0, dtype=np.int32)
+        lo = bisect_left(self._suffixes_sorted, prefix)
+        hi = bisect_left(self._suffixes_sorted, prefix + "\x7f", lo)  # keys are [0-9a-z ]
+        return np.unique(self._owners[lo:hi])
+
+    def containing(self, text):
+        """Ids (sorted) of the keys containing `text` anywhere; needs at least 3 characters."""
+        grams = self._grams(text)
+        if not grams:
+            return np.empty(0, dtype=np.int32)
+        lists = []
+        for gram in grams:
+            ids = self._postings.get(gram)
+            if ids is None:
+                return np.empty(0, dtype=np.int32)
+            lists.append(ids)
+        lists.sort(key=len)
+        ids = lists[0]
+        for other in lists[1:]:
+            ids = np.intersect1d(ids, other, assume_unique=True)
+        if len(text) > 3:
+            ids = ids[[text in self.keys[i] for i in ids]]
+        return ids
+
+    def lookup(self, text):
+        """(ids, is_prefix): word-prefix matches plus substring matches, sorted by id."""
+        prefixed = self.prefixed(text)
+        ids = np.union1d(prefixed, self.containing(text)) if len(text) >= 3 else prefixed
+        return ids, np.isin(ids, prefixed, assume_unique=True)
+
+
+class Typeahead:
+    """
+    Live suggestions for the search box and the rating form, ranked by
+    votes_count.
+
+    Restaurant and dish names are each indexed once as unique normalized
+    keys (PrefixIndex); every catalog row points at its restaurant and dish
+    id. Word-prefix matches rank above mid-word ones, then by votes.
+    Ratings and new or removed rows are folded in place (vote / add /
+    remove), so suggestions never wait for a rebuild.
+
+    restaurants, foods : raw names, one per row (positional ids)
+    votes              : votes_count per row
+    """
+
+    def __init__(self, restaurants=(), foods=(), votes=()):
+        rest_names, row_rest = factorize(restaurants)
+        food_names, row_food = factorize(foods)
+        rest_keys = [normalize_name(r) for r in rest_names]
+        dish_keys = [normalize_name(f) for f in food_names]
+        self.restaurants = PrefixIndex(dict.fromkeys(rest_keys))
+        self.dishes = PrefixIndex(dict.fromkeys(dish_keys))
+        rest_ids = np.fromiter(map(self.restaurants.id_of, rest_keys), dtype=np.int32, count=len(rest_keys))
+        dish_ids = np.fromiter(map(self.dishes.id_of, dish_keys), dtype=np.int32, count=len(dish_keys))
+        # display spelling of each dish: the first one seen
+        self.dish_names = [None] * len(self.dishes)
+        for food, i in zip(food_names, dish_ids.tolist()):
+            if self.dish_names[i] is None:
+                self.dish_names[i] = food
+        self.row_rest = rest_ids[row_rest]
+        self.row_dish = dish_ids[row_food]
+        self.row_votes = np.asarray(votes, dtype=np.int64).copy()
+        self.alive = np.ones(len(self.row_rest), dtype=bool)
+        self.dish_votes = np.bincount(self.row_dish, weights=self.row_votes, minlength=len(self.dishes)).astype(np.int64)
+        self.dish_live = np.bincount(self.row_dish, minlength=len(self.dishes)).astype(np.int32)
+        self.rest_live = np.bincount(self.row_rest, minlength=len(self.restaurants)).astype(np.int32)
+        self._rest_rows = group_rows(self.row_rest)
+        self._dish_rows = group_rows(self.row_dish)
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df['restaurant'], df['food'], df['votes_count'].to_numpy())
+
+    def state(self):
+        rests = {f"rest.{k}": v for k, v in self.restaurants.state().items()}
+        dishes = {f"dish.{k}": v for k, v in self.dishes.state().items()}
+        rest_ids, rest_offsets, rest_rows = pack_postings(self._rest_rows)
+        dish_ids, dish_offsets, dish_rows = pack_postings(self._dish_rows)
+        return {**rests, **dishes, "dish_names": self.dish_names,
+                "row_rest": self.row_rest, "row_dish": self.row_dish, "row_votes": self.row_votes,
+                "alive": self.alive, "dish_votes": self.dish_votes, "dish_live": self.dish_live,
+                "rest_live": self.rest_live,
+                "rest_ids": rest_ids, "rest_offsets": rest_offsets, "rest_rows": rest_rows,
+                "dish_ids": dish_ids, "dish_offsets": dish_offsets, "dish_rows": dish_rows}
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        index.restaurants = PrefixIndex.from_state({k[5:]: v for k, v in state.items() if k.startswith("rest.")})
+        index.dishes = PrefixIndex.from_state({k[5:]: v for k, v in state.items() if k.startswith("dish.")})
+        index.dish_names = list(state["dish_names"])
+        for name in ("row_rest", "row_dish", "row_votes", "alive", "dish_votes", "dish_live", "rest_live"):
+            setattr(index, name, state[name])
+        index._rest_rows = unpack_postings(state["rest_ids"], state["rest_offsets"], state["rest_rows"])
+        index._dish_rows = unpack_postings(state["dish_ids"], state["dish_offsets"], state["dish_rows"])
+        return index
+
+    def __len__(self):
+        return len(self.row_rest)
+
+    # ---- updates (positions follow the engine's rows) ----
+    def add(self, restaurant, food, votes=1):
+        """Index the next row position."""
+        row = len(self.row_rest)
+        r = self.restaurants.add(normalize_name(restaurant))
+        if r == len(self.rest_live):
+            self.rest_live = np.append(self.rest_live, np.int32(0))
+        key = normalize_name(food)
+        d = self.dishes.add(key)
+        if d == len(self.dish_names):
+            self.dish_names.append(food)
+            self.dish_votes = np.append(self.dish_votes, np.int64(0))
+            self.dish_live = np.append(self.dish_live, np.int32(0))
+        self.row_rest = np.append(self.row_rest, np.int32(r))
+        self.row_dish = np.append(self.row_dish, np.int32(d))
+        self.row_votes = np.append(self.row_votes, np.int64(votes))
+        self.alive = np.append(self.alive, True)
+        self.dish_votes[d] += votes
+        self.dish_live[d] += 1
+        self.rest_live[r] += 1
+        for postings, i in ((self._rest_rows, r), (self._dish_rows, d)):
+            rows = postings.get(i)
+            postings[i] = np.array([row], dtype=np.int32) if rows is None else np.append(rows, np.int32(row))
+        return row
+
+    def vote(self, row, votes):
+        """Set the votes_count of a row (after a rating)."""
+        self.dish_votes[self.row_dish[row]] += votes - self.row_votes[row]
+        self.row_votes[row] = votes
+
+    def remove(self, row):
+        if not self.alive[row]:
+            return
+        self.alive[row] = False
+        d = self.row_dish[row]
+        self.dish_votes[d] -= self.row_votes[row]
+        self.dish_live[d] -= 1
+        self.rest_live[self.row_rest[row]] -= 1
+
+    # ---- lookups ----
+    def restaurant_rows(self, restaurant):
+        """Live row positions of one restaurant (exact name, normalized)."""
+        r = self.restaurants.id_of(normalize_name(restaurant))
+        rows = self._rest_rows.get(r) if r is not None else None
+        return np.empty(0, dtype=np.int32) if rows is None else rows[self.alive[rows]]
+
+    def suggest_dishes(self, query, limit=5):
+        """Dish names for a partial query: word-prefix matches first, then by total votes."""
+        ids, is_prefix = self.dishes.lookup(normalize_name(query))
+        live = self.dish_live[ids] > 0
+        ids, is_prefix = ids[live], is_prefix[live]
+        best = np.lexsort((ids, -self.dish_votes[ids], ~is_prefix))[:limit]
+        return [self.dish_names[i] for i in ids[best]]
+
+    def suggest_rows(self, restaurant="", food="", limit=5):
+        """
+        Row positions of the dishes matching both partial names (either may
+        be empty), one per (restaurant, dish) pair: word-prefix matches
+        first, then by votes.
+        """
+        sides = []
+        for index, live, row_ids, postings, text in (
+                (self.restaurants, self.rest_live, self.row_rest, self._rest_rows, restaurant),
+                (self.dishes, self.dish_live, self.row_dish, self._dish_rows, food)):
+            text = normalize_name(text)
+            if text:
+                ids, is_prefix = index.lookup(text)
+                if not len(ids):
+                    return np.empty(0, dtype=np.int32)
+                sides.append((live[ids].sum(), ids, is_prefix, row_ids, postings, len(index)))
+        if not sides:
+            return np.empty(0, dtype=np.int32)
+        # expand the side with fewer live rows, filter by the other
+        sides.sort(key=lambda s: s[0])
+        postings = sides[0][4]
+        rows = np.concatenate([postings[i] for i in sides[0][1].tolist() if i in postings])
+        rows = rows[self.alive[rows]]
+        prefix_hits = np.zeros(len(rows), dtype=np.int64)
+        for _, ids, is_prefix, row_ids, _, n_names in sides:
+            # 0 = no match, 1 = mid-word match, 2 = word-prefix match, per name id
+            grade = np.zeros(n_names, dtype=np.int8)
+            grade[ids] = 1 + is_prefix
+            g = grade[row_ids[rows]]
+            rows, prefix_hits = rows[g > 0], prefix_hits[g > 0] + (g[g > 0] == 2)
+        # only the best few get sorted; spelling variants of one pair need headroom
+        score = prefix_hits * (1 << 40) + self.row_votes[rows]
+        take = 4 * limit
+        while True:
+            keep = np.arange(len(rows))
+            if take < len(rows):
+                kth = np.partition(score, len(rows) - take)[len(rows) - take]
+                keep = np.flatnonzero(score >= kth)
+            top = rows[keep][np.lexsort((rows[keep], -score[keep]))]
+            pairs = self.row_rest[top].astype(np.int64) * len(self.dishes) + self.row_dish[top]
+            _, first = np.unique(pairs, return_index=True)
+            if len(first) >= limit or len(keep) == len(rows):
+                return top[np.sort(first)[:limit]]
+            take = len(rows)
+
+
+class SemanticIndex:
+    """
+    TF-IDF retrieval over dish name + category + description, for queries
+    that string similarity on the name alone misses ("spicy rice",
+    "fried yam kontomire").
+
+    Rows are folded into their distinct texts first (chains repeat the
+    same dish), each text becomes one L2-normalized vector of word 1-2 gram
+    and character 3-gram weights, and a query is one sparse product with
+    the term-major transpose, so only the postings of its own terms are
+    read. Texts added later reuse the fitted vocabulary and IDF and go to a
+    small side block scored alongside the matrix, folded into it once
+    FOLD_DOCS of them pile up (like the store's log compaction). An index
+    loaded from a snapshot only builds its vectorizers (and imports
+    scikit-learn) on the first query.
+
+    texts : one document per row (positional ids), see document()
+    """
+
+    # Texts added since the last fold, kept out of the (re-transposed) main matrix
+    FOLD_DOCS = 256
+
+    def __init__(self, texts=()):
+        self.docs, row_doc = factorize(texts)  # distinct texts
+        self._doc_ids = {text: i for i, text in enumerate(self.docs)}
+        self.n_rows = len(row_doc)
+        self._doc_rows = group_rows(row_doc)
+        self._vectorizers = self._matrix = self._side = self._by_term = None
+        self._model = None  # snapshot state not yet turned into vectorizers + matrix
+        self._lock = threading.Lock()
+        if self.docs:
+            self._vectorizers = self._make_vectorizers()
+            try:
+                self._matrix = self._stack([v.fit_transform(self.docs) for v in self._vectorizers])
+            except ValueError:  # no usable terms at all (names of digits / single letters)
+                self._vectorizers = None
+
+    @staticmethod
+    def document(food, category=None, description=None):
+        """The text a row is retrieved by."""
+        return " ".join(str(part) for part in (food, category, description) if part is not None and part == part)
+
+    @classmethod
+    def from_frame(cls, df):
+        parts = [df[c].astype(object).where(df[c].notna(), "").astype(str)
+                 for c in ("food", "dish_category", "description") if c in df.columns]
+        return cls(parts[0].str.cat(parts[1:], sep=" ").str.strip() if parts else [])
+
+    @staticmethod
+    def _make_vectorizers(vocabularies=(None, None)):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        word, char = vocabularies
+        return (TfidfVectorizer(preprocessor=normalize_name, ngram_range=(1, 2), sublinear_tf=True,
+                                dtype=np.float32, vocabulary=word),
+                TfidfVectorizer(preprocessor=normalize_name, analyzer="char_wb", ngram_range=(3, 3),
+                                sublinear_tf=True, dtype=np.float32, vocabulary=char))
+
+    @staticmethod
+    def _stack(blocks):
+        """Word + char blocks side by side, each row rescaled to unit length (cosine = dot product)."""
+        from scipy import sparse
+        from sklearn.preprocessing import normalize
+
+        return normalize(sparse.hstack(blocks, format="csr", dtype=np.float32))
+
+    def _transform(self, texts):
+        return self._stack([v.transform(texts) for v in self._vectorizers])
+
+    def state(self):
+        state = {"docs": self.docs, "n_rows": self.n_rows}
+        doc_ids, offsets, rows = pack_postings(self._doc_rows)
+        state.update(doc_ids=doc_ids, offsets=offsets, rows=rows)
+        if self._model is not None:
+            state.update(self._model)
+        elif self._vectorizers is not None:
+            self._fold()
+            for name, v in zip(("word", "char"), self._vectorizers):
+                state[f"{name}_vocab"] = sorted(v.vocabulary_, key=v.vocabulary_.get)
+                state[f"{name}_idf"] = v.idf_.astype(np.float64)
+            m = self._matrix
+            state.update(data=m.data, indices=m.indices, indptr=m.indptr, n_terms=m.shape[1])
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        index.docs = list(state["docs"])
+        index._doc_ids = {text: i for i, text in enumerate(index.docs)}
+        index.n_rows = state["n_rows"]
+        index._doc_rows = unpack_postings(state["doc_ids"], state["offsets"], state["rows"])
+        if "word_vocab" in state:
+            index._model = {k: state[k] for k in ("word_vocab", "word_idf", "char_vocab", "char_idf",
+                                                  "data", "indices", "indptr", "n_terms")}
+        return index
+
+    def _load_model(self):
+        if self._model is None:
+            return
+        from scipy import sparse
+
+        with self._lock:
+            model = self._model
+            if model is None:
+                return
+            vectorizers = self._make_vectorizers((model["word_vocab"], model["char_vocab"]))
+            for name, v in zip(("word", "char"), vectorizers):
+                v.idf_ = model[f"{name}_idf"]
+            self._matrix = sparse.csr_matrix((model["data"], model["indices"], model["indptr"]),
+                                             shape=(len(self.docs), model["n_terms"]))
+            self._vectorizers, self._model = vectorizers, None
+
+    def __len__(self):
+        return self.n_rows
+
+    def _doc_id(self, text):
+        """Id of a distinct text, vectorized with the fitted vocabulary when new."""
+        i = self._doc_ids.get(text)
+        if i is None:
+            self._load_model()
+            i = self._doc_ids[text] = len(self.docs)
+            self.docs.append(text)
+            if self._vectorizers is not None:
+                from scipy import sparse
+
+                vector = self._transform([text])
+                self._side = vector if self._side is None else sparse.vstack([self._side, vector], format="csr")
+                if self._side.shape[0] >= self.FOLD_DOCS:
+                    self._fold()
+        return i
+
+    def _fold(self):
+        """Append the side block to the main matrix (its term-major copy is rebuilt on the next query)."""
+        if self._side is None:
+            return
+        from scipy import sparse
+
+        self._matrix = sparse.vstack([self._matrix, self._side], format="csr")
+        self._side = None
+
+    def add(self, text):
+        """Index the next row position."""
+        row = self.n_rows
+        self.n_rows += 1
+        i = self._doc_id(text)
+        rows = self._doc_rows.get(i)
+        self._doc_rows[i] = np.array([row], dtype=np.int32) if rows is None else np.append(rows, np.int32(row))
+        return row
+
+    def move(self, row, text, old_text=None):
+        """
+        Retrieve an indexed row by `text` from now on (its category or
+        description changed). `old_text`, the text it had, saves looking
+        for the row in every text's rows.
+        """
+        old = self._doc_ids.get(old_text)
+        if old is None or row not in self._doc_rows.get(old, ()):
+            old = next((d for d, rows in self._doc_rows.items() if row in rows), None)
+        if old is not None:
+            rows = self._doc_rows[old]
+            self._doc_rows[old] = rows[rows != row]
+        i = self._doc_id(text)
+        rows = self._doc_rows.get(i, np.empty(0, dtype=np.int32))
+        self._doc_rows[i] = np.insert(rows, np.searchsorted(rows, row), np.int32(row))
+
+    def search(self, query, min_similarity=0.2):
+        """
+        (row positions sorted, cosine similarity of each) for the rows whose
+        text is at least `min_similarity` similar to the query.
+        """
+        empty = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        self._load_model()
+        if self._vectorizers is None:
+            return empty
+        q = self._transform([query])
+        if q.nnz == 0:
+            return empty
+        # main matrix before side block: a fold in between drops new texts from this query, never doubles them
+        matrix = self._matrix
+        side = self._side
+        if self._by_term is None or self._by_term[0] is not matrix:
+            self._by_term = matrix, matrix.T.tocsr()
+        sims = self._by_term[1][q.indices].T @ q.data
+        if side is not None:
+            sims = np.concatenate([sims, (side @ q.T).toarray().ravel()])
+        docs = np.flatnonzero(sims >= min_similarity)
+        if not len(docs):
+            return empty
+        none = np.empty(0, dtype=np.int32)  # a text added but not yet given its row
+        parts = [self._doc_rows.get(i, none) for i in docs.tolist()]
+        rows = np.concatenate(parts)
+        row_sims = np.repeat(sims[docs].astype(np.float32), [len(p) for p in parts])
+        order = np.argsort(rows, kind="stable")
+        return rows[order], row_sims[order]
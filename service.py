@@ -0,0 +1,498 @@
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+from engine import RecommendationEngine
+from entity_resolution import find_duplicate
+from instrumentation import note, request, stage, summary
+from storage import get_store, new_entry_row
+
+DEFAULT_PORT = 8502
+
+# recommend(mode=...): fuzzy name match, TF-IDF over name / category /
+# description, or fuzzy first and TF-IDF only when no name matches
+SEARCH_MODES = ("fuzzy", "semantic", "auto")
+
+
+def records(df):
+    """DataFrame rows as plain dicts with NaN -> None (JSON-safe once numpy scalars are unwrapped)."""
+    return [{k: (None if isinstance(v, float) and math.isnan(v) else v) for k, v in row.items()}
+            for row in df.to_dict("records")]
+
+
+# ========== ENGINE FACADE ==========
+class TastePrice:
+    """
+    The recommend / rate / add logic behind both the Streamlit app and the
+    HTTP service, over one storage backend and one shared engine.
+
+    Every read starts with refresh(), which folds in what other processes
+    recorded, maps a newer snapshot version once one is published and
+    rebuilds the engine only when the store replaced its data.
+
+    store : storage backend, get_store() by default
+    """
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else get_store()
+        self.engine = RecommendationEngine.from_store(self.store)
+        self._reload_lock = threading.Lock()
+
+    def ready(self):
+        return self.engine is not None
+
+    def refresh(self):
+        """
+        Catch up with the store. A newer published snapshot version (see
+        snapshot.py) is mapped in place of the current engine; otherwise
+        the events since the last sync are applied to it.
+        """
+        if self.engine is not None and not self.engine.superseded() and self.engine.sync():
+            return
+        with self._reload_lock:
+            if self.engine is None or self.engine.superseded() or not self.engine.sync():
+                self.engine = RecommendationEngine.from_store(self.store)
+
+    def recommend(self, dish_name, top_k=5, cheap_bias=0.5, cutoff=70, mode="fuzzy", user=None, location="",
+                  category=""):
+        """
+        (matched_name, [row dicts]) or (None, message), like
+        RecommendationEngine.recommend; `mode` is one of SEARCH_MODES.
+        Name matches are ranked by `user`'s own taste when personalize.py
+        has trained factors for them. `location` / `category` restrict the
+        results to matching locations / dish categories.
+        """
+        scope = {"location": location, "category": category}
+        with request("search", query=dish_name, bias=cheap_bias, top_k=top_k, mode=mode, **scope):
+            with stage("refresh"):
+                self.refresh()
+            if mode == "semantic":
+                match, result = self.engine.recommend_semantic(dish_name, top_k=top_k, cheap_bias=cheap_bias,
+                                                               **scope)
+            else:
+                match, result = self.engine.recommend(dish_name, top_k=top_k, cheap_bias=cheap_bias, cutoff=cutoff,
+                                                      user=user, **scope)
+                if match is None and mode == "auto":
+                    note(fallback="semantic")
+                    match, semantic = self.engine.recommend_semantic(dish_name, top_k=top_k, cheap_bias=cheap_bias,
+                                                                     **scope)
+                    if match is not None:
+                        result = semantic
+            if match is None:
+                note(results=0)
+                return None, result
+            with stage("serialize"):
+                rows = records(result)
+            note(results=len(rows))
+            return match, rows
+
+    def recommend_batch(self, dish_names, biases=(0.5,), top_k=5, cutoff=70):
+        """recommend() for every (dish, bias) pair, dish-major (see RecommendationEngine.recommend_batch)."""
+        with request("search_batch", queries=len(dish_names), biases=list(biases), top_k=top_k):
+            with stage("refresh"):
+                self.refresh()
+            matches, results = self.engine.recommend_batch(dish_names, biases, top_k=top_k, cutoff=cutoff)
+            note(matched=sum(m is not None for m in matches), results=len(results))
+            with stage("serialize"):
+                buckets = {}
+                for row in records(results):
+                    del row['rank']
+                    buckets.setdefault((row.pop('query'), row.pop('cheap_bias')), []).append(row)
+        return [(None, f"No close matches found for '{dish_name}'") if match is None
+                else (match, buckets.get((i, float(b)), []))
+                for i, (dish_name, match) in enumerate(zip(dish_names, matches)) for b in biases]
+
+    def leaderboard(self, location="", category="", cheap_bias=0.5, top_k=10):
+        """
+        [row dicts] of the best-value dishes of a location and / or dish
+        category (either may be empty), best first; see
+        RecommendationEngine.leaderboard.
+        """
+        with request("leaderboard", location=location, category=category, bias=cheap_bias, top_k=top_k):
+            with stage("refresh"):
+                self.refresh()
+            rows, scores = self.engine.leaderboard(location, category, cheap_bias=cheap_bias, top_k=top_k)
+            with stage("materialize"):
+                result = self.engine.materialize(rows, scores)
+            with stage("serialize"):
+                found = records(result)
+            note(results=len(found))
+            return found
+
+    def suggest(self, query="", restaurant="", food="", limit=5):
+        """
+        Typeahead: dish names for `query`, or (restaurant, food) pairs for
+        the rating form when restaurant / food are given, most voted first.
+        A query nothing starts with or contains (a typo) falls back to
+        fuzzy-matched names.
+        """
+        with request("suggest", query=query, restaurant=restaurant, food=food):
+            with stage("refresh"):
+                self.refresh()
+            with stage("search"):
+                if restaurant or food:
+                    found = self.engine.suggest_pairs(restaurant, food, limit=limit)
+                elif query:
+                    found = self.engine.suggest(query, limit=limit) or self.engine.match(query, cutoff=60, limit=limit)
+                else:
+                    found = []
+            note(results=len(found))
+            return found
+
+    def rate(self, restaurant, food, rating, user=None):
+        """
+        Record one vote (also kept per `user`, for personalize.py). Returns
+        the updated row as a dict, or None if the dish is unknown.
+        """
+        with request("rate", restaurant=restaurant, food=food, rating=rating):
+            with stage("refresh"):
+                self.refresh()
+            pos = self.engine.position(restaurant, food)
+            note(found=pos is not None)
+            if pos is None:
+                return None
+            match = self.engine.df.iloc[pos]
+            with stage("record"):
+                if not self.store.record_rating(match['restaurant'], match['food'], rating, user=user):
+                    return None
+            with stage("compact"):
+                self.store.maybe_compact()
+            with stage("apply"):
+                self.refresh()  # fold the vote into the shared in-memory catalog
+            pos = self.engine.position(restaurant, food)
+            return records(self.engine.display([pos]))[0]
+
+    def add_dish(self, restaurant, food, price, taste, location, portion_size="", dish_category="",
+                 description="", source="user_submission"):
+        """
+        Record one new dish and return the stored row. A dish the restaurant
+        already lists under another spelling (see entity_resolution) gets the
+        taste as a vote instead, and its updated row is returned.
+        """
+        with request("add_dish", restaurant=restaurant, food=food, price=price):
+            with stage("refresh"):
+                self.refresh()
+            with stage("dedupe"):
+                # only the restaurant's own rows: no full catalog frame per submission
+                duplicate = None if self.engine is None else find_duplicate(
+                    self.engine.frame(self.engine.restaurant_rows(restaurant)), restaurant, food, price)
+            note(duplicate=duplicate is not None)
+            if duplicate is not None and taste is not None:
+                rated = self.rate(*duplicate, taste)
+                if rated is not None:
+                    return rated
+            row = new_entry_row(restaurant, food, price, taste, location, portion_size, dish_category,
+                                description, source=source)
+            with stage("record"):
+                self.store.record_new_dish(row)
+            with stage("compact"):
+                self.store.maybe_compact()
+            with stage("apply"):
+                self.refresh()  # next search includes the new dish, no reload
+            return row
+
+    def diagnostics(self):
+        """Rolling stage percentiles of the requests traced in this process (see instrumentation.py)."""
+        return summary()
+
+
+# ========== HTTP CLIENT ==========
+class TastePriceClient:
+    """
+    Same methods as TastePrice, served by a remote `python service.py`.
+    Used by the Streamlit app when TASTEPRICE_API is set.
+    """
+
+    def __init__(self, base_url, timeout=10.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _call(self, path, params=None, body=None):
+        url = self.base_url + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with stage("api"), urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            payload = json.loads(e.read() or b"{}")
+            if e.code == 404 and "error" in payload:
+                return payload
+            raise RuntimeError(payload.get("error", str(e))) from e
+
+    def ready(self):
+        try:
+            return self._call("/health").get("rows", 0) > 0
+        except (OSError, RuntimeError):
+            return False
+
+    def diagnostics(self):
+        return self._call("/diagnostics")
+
+    def recommend(self, dish_name, top_k=5, cheap_bias=0.5, cutoff=70, mode="fuzzy", user=None, location="",
+                  category=""):
+        params = {"q": dish_name, "k": top_k, "bias": cheap_bias, "cutoff": cutoff, "mode": mode}
+        for key, value in (("user", user), ("location", location), ("category", category)):
+            if value:
+                params[key] = value
+        res = self._call("/recommend", params)
+        return (None, res["error"]) if "error" in res else (res["match"], res["results"])
+
+    def recommend_batch(self, dish_names, biases=(0.5,), top_k=5, cutoff=70):
+        res = self._call("/recommend/batch", body={"dishes": list(dish_names), "biases": list(biases),
+                                                   "top_k": top_k, "cutoff": cutoff})
+        return [(None, r["error"]) if "error" in r else (r["match"], r["results"]) for r in res["results"]]
+
+    def leaderboard(self, location="", category="", cheap_bias=0.5, top_k=10):
+        return self._call("/leaderboard", {"location": location, "category": category, "bias": cheap_bias,
+                                           "k": top_k})["results"]
+
+    def suggest(self, query="", restaurant="", food="", limit=5):
+        res = self._call("/suggest", {"q": query, "restaurant": restaurant, "food": food, "limit": limit})
+        return [tuple(s) if isinstance(s, list) else s for s in res["suggestions"]]
+
+    def rate(self, restaurant, food, rating, user=None):
+        res = self._call("/rate", body={"restaurant": restaurant, "food": food, "rating": rating, "user": user})
+        return None if "error" in res else res["dish"]
+
+    def add_dish(self, restaurant, food, price, taste, location, portion_size="", dish_category="",
+                 description="", source="user_submission"):
+        return self._call("/dishes", body={
+            "restaurant": restaurant, "food": food, "price": price, "taste": taste,
+            "location": location, "portion_size": portion_size, "dish_category": dish_category,
+            "description": description, "source": source})["dish"]
+
+
+# ========== HTTP SERVICE ==========
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def _number(params, key, default, cast=float):
+    try:
+        return cast(params.get(key, default))
+    except (TypeError, ValueError):
+        raise HttpError(400, f"'{key}' must be a number")
+
+
+def _required(body, *keys):
+    missing = [k for k in keys if body.get(k) in (None, "")]
+    if missing:
+        raise HttpError(400, f"missing field(s): {', '.join(missing)}")
+
+
+class TastePriceServer:
+    """
+    Minimal asyncio HTTP/1.1 JSON API over a TastePrice instance.
+
+      GET  /health
+      GET  /recommend?q=jollof&bias=0.5&k=5   (&mode=semantic|auto, see SEARCH_MODES; &user=<id>;
+                                               &location=osu&category=rice)
+      POST /recommend/batch   {"dishes": [...], "biases": [...], "top_k": 5}
+      GET  /leaderboard?location=osu&category=rice&bias=0.5&k=10   (either filter optional)
+      GET  /suggest?q=jol     (or ?restaurant=..&food=.. for rating-form pairs)
+      POST /rate              {"restaurant", "food", "rating", "user" (optional)}
+      POST /dishes            {"restaurant", "food", "price", "taste", "location", ...}
+      GET  /diagnostics       stage percentiles of this worker's traced requests
+
+    Engine calls run on the default thread pool so one slow query does not
+    stall the other connections; the engine itself is thread-safe.
+    """
+
+    def __init__(self, app, sync_interval=2.0):
+        self.app = app
+        self.sync_interval = sync_interval
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("GET", "/recommend"): self.recommend,
+            ("POST", "/recommend/batch"): self.recommend_batch,
+            ("GET", "/leaderboard"): self.leaderboard,
+            ("GET", "/suggest"): self.suggest,
+            ("POST", "/rate"): self.rate,
+            ("POST", "/dishes"): self.add_dish,
+            ("GET", "/diagnostics"): self.diagnostics,
+        }
+
+    # ----- handlers: (params, body) -> (status, payload), run off the event loop -----
+    def health(self, params, body):
+        return 200, {"status": "ok", "rows": len(self.app.engine) if self.app.ready() else 0}
+
+    def diagnostics(self, params, body):
+        return 200, self.app.diagnostics()
+
+    def recommend(self, params, body):
+        q = params.get("q", "")
+        if not q:
+            raise HttpError(400, "missing query parameter 'q'")
+        mode = params.get("mode", "fuzzy")
+        if mode not in SEARCH_MODES:
+            raise HttpError(400, f"'mode' must be one of {', '.join(SEARCH_MODES)}")
+        match, result = self.app.recommend(q, top_k=_number(params, "k", 5, int),
+                                           cheap_bias=_number(params, "bias", 0.5),
+                                           cutoff=_number(params, "cutoff", 70), mode=mode,
+                                           user=params.get("user") or None,
+                                           location=params.get("location", ""), category=params.get("category", ""))
+        if match is None:
+            return 404, {"error": result}
+        return 200, {"match": match, "results": result}
+
+    def recommend_batch(self, params, body):
+        dishes = body.get("dishes")
+        biases = body.get("biases", [0.5])
+        if not isinstance(dishes, list) or not isinstance(biases, list):
+            raise HttpError(400, "'dishes' and 'biases' must be lists")
+        try:
+            biases = [float(b) for b in biases]
+        except (TypeError, ValueError):
+            raise HttpError(400, "'biases' must be numbers")
+        results = self.app.recommend_batch([str(d) for d in dishes], biases,
+                                           top_k=_number(body, "top_k", 5, int),
+                                           cutoff=_number(body, "cutoff", 70))
+        pairs = [(d, b) for d in dishes for b in biases]
+        return 200, {"results": [
+            {"dish": d, "cheap_bias": b, **({"error": r} if m is None else {"match": m, "results": r})}
+            for (d, b), (m, r) in zip(pairs, results)]}
+
+    def leaderboard(self, params, body):
+        bias = _number(params, "bias", 0.5)
+        if not 0 <= bias <= 1:
+            raise HttpError(400, "'bias' must be between 0 and 1")
+        return 200, {"results": self.app.leaderboard(params.get("location", ""), params.get("category", ""),
+                                                     cheap_bias=bias, top_k=_number(params, "k", 10, int))}
+
+    def suggest(self, params, body):
+        return 200, {"suggestions": self.app.suggest(params.get("q", ""), params.get("restaurant", ""),
+                                                     params.get("food", ""),
+                                                     limit=_number(params, "limit", 5, int))}
+
+    def rate(self, params, body):
+        _required(body, "restaurant", "food", "rating")
+        rating = _number(body, "rating", None)
+        if not 1 <= rating <= 10:
+            raise HttpError(400, "'rating' must be between 1 and 10")
+        dish = self.app.rate(body["restaurant"], body["food"], rating, user=body.get("user") or None)
+        if dish is None:
+            return 404, {"error": f"No entry found for '{body['food']}' at '{body['restaurant']}'"}
+        return 200, {"dish": dish}
+
+    def add_dish(self, params, body):
+        _required(body, "restaurant", "food", "price", "location")
+        price = _number(body, "price", None)
+        taste = _number(body, "taste", 7)
+        fields = {k: body.get(k, "") for k in ("portion_size", "dish_category", "description")}
+        row = self.app.add_dish(body["restaurant"], body["food"], price, taste, body["location"],
+                                source=body.get("source", "user_submission"), **fields)
+        return 201, {"dish": row}
+
+    # ----- transport -----
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0) or 0)
+                raw = await reader.readexactly(length) if length else b""
+
+                url = urllib.parse.urlsplit(target)
+                params = dict(urllib.parse.parse_qsl(url.query))
+                try:
+                    handler = self.routes.get((method, url.path))
+                    if handler is None:
+                        known = any(path == url.path for _, path in self.routes)
+                        raise HttpError(405 if known else 404, f"no route for {method} {url.path}")
+                    try:
+                        body = json.loads(raw) if raw else {}
+                    except ValueError:
+                        raise HttpError(400, "body is not valid JSON")
+                    if not isinstance(body, dict):
+                        raise HttpError(400, "body must be a JSON object")
+                    status, payload = await loop.run_in_executor(None, handler, params, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+
+                data = json.dumps(payload, default=_json_default, ensure_ascii=False).encode("utf-8")
+                keep_alive = version.strip() == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # client went away or sent garbage; drop the connection
+        finally:
+            writer.close()
+
+    async def _sync_forever(self):
+        """Pick up writes made by other workers / the Streamlit app between requests."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await loop.run_in_executor(None, self.app.refresh)
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT, reuse_port=False):
+        server = await asyncio.start_server(self.handle, host, port, reuse_port=reuse_port or None)
+        syncer = asyncio.create_task(self._sync_forever())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            syncer.cancel()
+
+
+def run_worker(host, port, reuse_port=False):
+    app = TastePrice()
+    if not app.ready():
+        raise SystemExit("Dataset not found! Please run data prep script first.")
+    asyncio.run(TastePriceServer(app).serve(host, port, reuse_port))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TastePrice recommendation API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("TASTEPRICE_PORT", DEFAULT_PORT)))
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes sharing the port (SO_REUSEPORT, Linux / BSD)")
+    args = parser.parse_args()
+
+    print(f"🍗 TastePrice API on http://{args.host}:{args.port} ({args.workers} worker(s))")
+    if args.workers == 1:
+        run_worker(args.host, args.port)
+    else:
+        workers = [multiprocessing.Process(target=run_worker, args=(args.host, args.port, True))
+                   for _ in range(args.workers)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
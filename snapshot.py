@@ -0,0 +1,256 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from catalog import Descriptions
+from search_index import DishKeyIndex, DishNameIndex, FacetIndex, RowTokenIndex, SemanticIndex, Typeahead
+from storage import FileLock
+
+# Bump when the on-disk layout changes; older snapshots are then rebuilt
+SNAPSHOT_FORMAT = 6
+# Engine keyword -> (file prefix, index class) of every saved search index
+INDEXES = {
+    "name_index": ("names", DishNameIndex),
+    "row_index": ("rows", RowTokenIndex),
+    "typeahead": ("typeahead", Typeahead),
+    "text_index": ("text", SemanticIndex),
+    "key_index": ("keys", DishKeyIndex),
+    "facets": ("facets", FacetIndex),
+}
+# How long a process waits for another one's build before building itself
+BUILD_WAIT = 600.0
+
+
+# ========== LAYOUT ==========
+# <snapshot dir>/
+#   CURRENT             name of the live version directory (swapped atomically)
+#   <version>/
+#     meta.json         row count, column list, store cursor, index scalars
+#     strings.json      string tables: distinct values / categories per text
+#                       column, dish names / keys / grams / tokens of the indexes
+#     col.<name>.npy    numeric column, or codes into its string table
+#     index.npy         DataFrame index labels
+#     descriptions.codes.npy  int32 code per row into descriptions.json
+#     descriptions.json distinct descriptions, read on first use only
+#     names.<key>.npy   DishNameIndex posting arrays
+#     rows.<key>.npy    RowTokenIndex row -> name key codes, posting arrays
+#     typeahead.<key>.npy  Typeahead row -> name ids, votes, suffix owners, postings
+#     text.<key>.npy    SemanticIndex TF-IDF matrix (CSR), IDF weights, text -> rows
+#     keys.<key>.npy    DishKeyIndex sorted (restaurant, food) hashes + rows
+#     facets.<key>.npy  FacetIndex row -> location / category / pair ids, partition rows
+#
+# Everything numeric is opened with np.load(mmap_mode="c"): the pages are
+# mapped, not read, and copy-on-write, so the engine can still update rows
+# in place without touching the file. Categorical columns come back as
+# categoricals over their mapped codes, so workers on one host share them.
+#
+# Publish / subscribe: one process per host builds a version (holding
+# publish_lock(), so the others wait for it instead of parsing the store
+# too) and swaps CURRENT; every worker polls current_version() and maps a
+# new version when it appears. Pages are shared through the page cache, so
+# another replica adds its Python objects, not another copy of the catalog.
+
+
+def _load_array(path):
+    try:
+        # plain ndarray view of the mapping: np.memmap slices are slow to create
+        return np.asarray(np.load(path, mmap_mode="c"))
+    except ValueError:  # zero-length arrays cannot be mapped
+        return np.load(path)
+
+
+def _as_tuple(value):
+    """JSON turns the store cursor's tuples into lists; turn them back."""
+    if isinstance(value, list):
+        return tuple(_as_tuple(v) for v in value)
+    return value
+
+
+def _save_state(dirpath, prefix, state, meta, strings):
+    """Arrays -> <prefix>.<key>.npy, lists -> strings.json, scalars -> meta.json."""
+    for key, value in state.items():
+        name = f"{prefix}.{key}"
+        if isinstance(value, np.ndarray):
+            np.save(os.path.join(dirpath, name + ".npy"), value)
+            meta["arrays"].append(name)
+        elif isinstance(value, list):
+            strings[name] = value
+        else:
+            meta["scalars"][name] = value
+
+
+def _load_state(dirpath, prefix, meta, strings):
+    state = {}
+    for name in meta["arrays"]:
+        if name.startswith(prefix + "."):
+            state[name[len(prefix) + 1:]] = _load_array(os.path.join(dirpath, name + ".npy"))
+    for source in (strings, meta["scalars"]):
+        for name, value in source.items():
+            if name.startswith(prefix + "."):
+                state[name[len(prefix) + 1:]] = value
+    return state
+
+
+# ========== WRITE ==========
+def save_snapshot(path, df, descriptions, indexes, cursor):
+    """
+    Write the compact catalog (catalog.compact_catalog), its Descriptions
+    and the search indexes ({engine keyword: index}, see INDEXES) as of
+    `cursor` into a new version directory, then point CURRENT at it.
+    Older versions are removed. Returns the version directory.
+    """
+    os.makedirs(path, exist_ok=True)
+    version = f"v{time.time_ns()}-{os.getpid()}"
+    dirpath = os.path.join(path, version)
+    os.makedirs(dirpath)
+
+    meta = {"format": SNAPSHOT_FORMAT, "rows": len(df), "cursor": cursor,
+            "columns": [], "arrays": [], "scalars": {}}
+    strings = {}
+    np.save(os.path.join(dirpath, "index.npy"), df.index.to_numpy(dtype=np.int64))
+
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(dirpath, f"col.{column}.npy"), values.cat.codes.to_numpy())
+            strings[f"col.{column}"] = values.cat.categories.tolist()
+            meta["columns"].append({"name": column, "kind": "category"})
+        elif values.dtype.kind in "biuf":
+            np.save(os.path.join(dirpath, f"col.{column}.npy"), values.to_numpy())
+            meta["columns"].append({"name": column, "kind": "array"})
+        else:
+            codes, uniques = pd.factorize(values, use_na_sentinel=True)
+            np.save(os.path.join(dirpath, f"col.{column}.npy"), codes.astype(np.int32))
+            strings[f"col.{column}"] = np.asarray(uniques, dtype=object).tolist()
+            meta["columns"].append({"name": column, "kind": "strings"})
+
+    state = descriptions.state()
+    np.save(os.path.join(dirpath, "descriptions.codes.npy"), state["codes"])
+    with open(os.path.join(dirpath, "descriptions.json"), "w", encoding="utf-8") as f:
+        json.dump(state["texts"], f, ensure_ascii=False)
+    for keyword, (prefix, _) in INDEXES.items():
+        _save_state(dirpath, prefix, indexes[keyword].state(), meta, strings)
+    with open(os.path.join(dirpath, "strings.json"), "w", encoding="utf-8") as f:
+        json.dump(strings, f, ensure_ascii=False)
+    with open(os.path.join(dirpath, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    tmp_path = os.path.join(path, f"CURRENT.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(path, "CURRENT"))
+
+    # processes that still map an old version keep their pages (POSIX unlink);
+    # where removal fails the directory is retried on the next save
+    for entry in os.listdir(path):
+        if entry != version and entry.startswith("v"):
+            shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+    return dirpath
+
+
+# ========== READ ==========
+def _text_loader(path):
+    """
+    Read the JSON list at `path` later. The file is opened now, so a newer
+    snapshot deleting this version first does not lose it (POSIX unlink).
+    """
+    f = open(path, encoding="utf-8")
+
+    def load():
+        with f:
+            return json.load(f)
+    return load
+
+
+def load_snapshot(path):
+    """
+    (compact DataFrame, Descriptions, {engine keyword: index}, cursor,
+    version) from the current snapshot, or None if there is none / it is
+    from another format. Descriptions are only read when first needed.
+    The caller decides whether the cursor is still valid for its store.
+    """
+    try:
+        version = current_version(path)
+        dirpath = os.path.join(path, version)
+        with open(os.path.join(dirpath, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != SNAPSHOT_FORMAT:
+            return None
+        with open(os.path.join(dirpath, "strings.json"), encoding="utf-8") as f:
+            strings = json.load(f)
+
+        columns = {}
+        for column in meta["columns"]:
+            name = column["name"]
+            values = _load_array(os.path.join(dirpath, f"col.{name}.npy"))
+            if column["kind"] == "category":
+                values = pd.Categorical.from_codes(values, strings[f"col.{name}"])
+            elif column["kind"] == "strings":
+                # code -1 (missing) picks the trailing NaN
+                table = np.array(strings[f"col.{name}"] + [np.nan], dtype=object)
+                values = table[values]
+            columns[name] = values
+        index = pd.Index(_load_array(os.path.join(dirpath, "index.npy")))
+        df = pd.DataFrame(columns, index=index, copy=False)
+        descriptions = Descriptions(_load_array(os.path.join(dirpath, "descriptions.codes.npy")),
+                                    loader=_text_loader(os.path.join(dirpath, "descriptions.json")))
+
+        indexes = {keyword: cls.from_state(_load_state(dirpath, prefix, meta, strings))
+                   for keyword, (prefix, cls) in INDEXES.items()}
+    except (OSError, TypeError, ValueError, KeyError):
+        return None  # missing, half-deleted or unreadable: rebuild from the store
+    return df, descriptions, indexes, _as_tuple(meta["cursor"]), version
+
+
+# ========== PUBLISH / SUBSCRIBE ==========
+def current_version(path):
+    """Name of the published version directory, or None. One small read: workers poll it per request."""
+    try:
+        with open(os.path.join(path, "CURRENT")) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def publish_lock(path):
+    """Held while building + publishing a version, so one process per host does it."""
+    return FileLock(path, timeout=BUILD_WAIT, stale_after=BUILD_WAIT)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from engine import RecommendationEngine
+    from storage import get_store
+
+    parser = argparse.ArgumentParser(description="Build and publish the catalog snapshot that workers map")
+    parser.add_argument("--watch", type=float, default=0, metavar="SECONDS",
+                        help="keep running as the host's builder: every SECONDS, publish a new version "
+                             "if ratings / dishes arrived (re-parsing only when the store was replaced)")
+    args = parser.parse_args()
+
+    store = get_store()
+    started = time.perf_counter()
+    with publish_lock(store.snapshot_dir):
+        engine = RecommendationEngine.from_store(store, use_snapshot=False)
+        if engine is None:
+            raise SystemExit("Dataset not found! Please run data prep script first.")
+        engine.publish()
+    print(f"✅ Snapshot of {len(engine)} rows written to {store.snapshot_dir} "
+          f"in {time.perf_counter() - started:.2f}s")
+
+    while args.watch:
+        time.sleep(args.watch)
+        published = engine.cursor
+        started = time.perf_counter()
+        with publish_lock(store.snapshot_dir):
+            if not engine.sync():
+                engine = RecommendationEngine.from_store(store, use_snapshot=False)
+            elif engine.cursor == published:
+                continue
+            engine.publish()
+        print(f"📦 Published {engine.version} ({len(engine)} rows) in {time.perf_counter() - started:.2f}s")
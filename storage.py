@@ -0,0 +1,753 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+MASTER_CSV = "ghana_restaurants_master.csv"
+EVENT_LOG = "ghana_restaurants_events.jsonl"
+# Per-user votes (personalize.py trains on them); never compacted away
+RATINGS_LOG = "ghana_restaurants_ratings.jsonl"
+SQLITE_DB = "tasteprice.db"
+
+# Catalog columns, in master CSV order
+COLUMNS = ["restaurant", "food", "price", "taste", "location", "portion_size",
+           "dish_category", "description", "source_url", "votes_count"]
+
+# Columns of store.user_ratings()
+USER_RATING_COLUMNS = ["user", "restaurant", "food", "rating", "ts"]
+
+# Fold the log into the master snapshot once it grows past this size
+COMPACT_BYTES = 256 * 1024
+
+
+# ========== LOCKING ==========
+class FileLock:
+    """
+    Portable lock file (O_CREAT | O_EXCL), works on Windows and across
+    Streamlit sessions / processes. Held only for one append, or for the
+    duration of a compaction.
+    """
+
+    def __init__(self, path, timeout=10.0, stale_after=60.0):
+        self.path = path + ".lock"
+        self.timeout = timeout
+        self.stale_after = stale_after
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        os.remove(self.path)  # holder died mid-write
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Could not lock {self.path}")
+                time.sleep(0.01)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# ========== ROW HELPERS ==========
+def dish_key(restaurant, food):
+    return (str(restaurant).lower(), str(food).lower())
+
+
+def add_rating(df, restaurant, food, new_rating):
+    mask = (df['restaurant'].str.lower() == restaurant.lower()) & \
+           (df['food'].str.lower() == food.lower())
+
+    if not mask.any():
+        return None, f"❌ No entry found for '{food}' at '{restaurant}'. Add it first!"
+
+    idx = df[mask].index[0]
+
+    # 🔥 SAFELY CONVERT TO NUMERIC
+    old_avg = pd.to_numeric(df.at[idx, 'taste'], errors='coerce')
+    old_votes = pd.to_numeric(df.at[idx, 'votes_count'], errors='coerce')
+
+    # Handle NaN or invalid values
+    if pd.isna(old_avg) or pd.isna(old_votes):
+        old_avg = 0.0
+        old_votes = 0
+
+    # Calculate new average
+    new_avg = (old_avg * old_votes + new_rating) / (old_votes + 1)
+
+    # Update DataFrame
+    df.at[idx, 'taste'] = new_avg
+    df.at[idx, 'votes_count'] = old_votes + 1
+
+    msg = f"✅ Updated {food} at {restaurant}: new avg taste = {new_avg:.2f} ({int(old_votes + 1)} votes)"
+    return df, msg
+
+
+def new_entry_row(restaurant, food, price, rating, location, portion_size, category, description="", source="user_submission"):
+    return {
+        "restaurant": restaurant.strip().title(),
+        "food": food.strip().title(),
+        "price": float(price),
+        "taste": float(rating),
+        "location": location.strip().title(),
+        "portion_size": portion_size,
+        "dish_category": category.strip().title() if category else "Uncategorized",
+        "description": description.strip() if description else None,
+        "source_url": source,
+        "votes_count": 1
+    }
+
+
+def add_new_entry(df, restaurant, food, price, rating, location, portion_size, category, description="", source="user"):
+    new_row = new_entry_row(restaurant, food, price, rating, location, portion_size, category, description, source)
+    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+    return df
+
+
+# ========== EVENT LOG ==========
+def append_event(event, log_path=EVENT_LOG):
+    """One JSON line, one O_APPEND write. This is the whole cost of a vote."""
+    line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+    with FileLock(log_path):
+        fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def log_rating(restaurant, food, rating, log_path=EVENT_LOG):
+    event = {"type": "rating", "ts": time.time(),
+             "restaurant": restaurant, "food": food, "rating": float(rating)}
+    append_event(event, log_path)
+    return event
+
+
+def log_user_rating(user, restaurant, food, rating, log_path=RATINGS_LOG):
+    event = {"ts": time.time(), "user": str(user), "restaurant": restaurant, "food": food,
+             "rating": float(rating)}
+    append_event(event, log_path)
+    return event
+
+
+def log_new_dish(row, log_path=EVENT_LOG):
+    event = {"type": "new_dish", "ts": time.time(), "row": row}
+    append_event(event, log_path)
+    return event
+
+
+def log_dish_update(restaurant, food, fields, log_path=EVENT_LOG):
+    event = {"type": "dish_update", "ts": time.time(),
+             "restaurant": restaurant, "food": food, "fields": fields}
+    append_event(event, log_path)
+    return event
+
+
+def log_dish_removal(restaurant, food, log_path=EVENT_LOG):
+    event = {"type": "dish_remove", "ts": time.time(), "restaurant": restaurant, "food": food}
+    append_event(event, log_path)
+    return event
+
+
+def read_events_from(log_path=EVENT_LOG, offset=0):
+    """
+    Complete events appended after byte `offset`, plus the offset to resume
+    from. Lets a long-lived process tail the log instead of re-reading it.
+    """
+    if not os.path.exists(log_path):
+        return [], 0
+    events = []
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # torn trailing write; picked up on the next read
+            offset += len(line)
+            line = line.strip()
+            if line:
+                events.append(json.loads(line.decode("utf-8")))
+    return events, offset
+
+
+def read_events(log_path=EVENT_LOG):
+    """All complete events in the log, oldest first."""
+    return read_events_from(log_path, 0)[0]
+
+
+def read_user_ratings(log_path=RATINGS_LOG):
+    """Every per-user vote as a DataFrame (user, restaurant, food, rating, ts), oldest first."""
+    return pd.DataFrame(read_events(log_path), columns=USER_RATING_COLUMNS)
+
+
+def apply_events(df, events):
+    """
+    Fold rating / new-dish / dish-update / dish-removal events into a raw
+    (unprepared) master frame. Same arithmetic as add_rating, but with a
+    key → row map built once per batch instead of a full-table string
+    comparison per vote.
+    """
+    if not events:
+        return df
+    df = df.reset_index(drop=True)
+    df['taste'] = pd.to_numeric(df['taste'], errors='coerce')
+    df['votes_count'] = pd.to_numeric(df['votes_count'], errors='coerce')
+    if any(event["type"] == "dish_update" for event in events):
+        df['price'] = pd.to_numeric(df['price'], errors='coerce')
+        df = df.astype({c: object for c in COLUMNS if c in df.columns and df[c].dtype.kind not in "biuf"})
+    taste = df['taste'].to_numpy(dtype=float, copy=True)
+    votes = df['votes_count'].to_numpy(dtype=float, copy=True)
+
+    positions = {}
+    for i, key in enumerate(zip(df['restaurant'].astype(str).str.lower(), df['food'].astype(str).str.lower())):
+        positions.setdefault(key, i)
+
+    new_rows = []
+    removed = []
+    for event in events:
+        if event["type"] == "new_dish":
+            row = dict(event["row"])
+            new_rows.append(row)
+            positions.setdefault(dish_key(row["restaurant"], row["food"]), ("new", len(new_rows) - 1))
+        elif event["type"] == "rating":
+            where = positions.get(dish_key(event["restaurant"], event["food"]))
+            if where is None:
+                continue  # dish was never added; same as add_rating returning None
+            if isinstance(where, tuple):
+                row = new_rows[where[1]]
+                old_avg, old_votes = row.get("taste"), row.get("votes_count")
+            else:
+                old_avg, old_votes = taste[where], votes[where]
+            if pd.isna(old_avg) or pd.isna(old_votes):
+                old_avg, old_votes = 0.0, 0
+            new_avg = (old_avg * old_votes + event["rating"]) / (old_votes + 1)
+            if isinstance(where, tuple):
+                row["taste"], row["votes_count"] = new_avg, old_votes + 1
+            else:
+                taste[where], votes[where] = new_avg, old_votes + 1
+        elif event["type"] == "dish_update":
+            where = positions.get(dish_key(event["restaurant"], event["food"]))
+            if where is None:
+                continue
+            for column, value in event["fields"].items():
+                if isinstance(where, tuple):
+                    new_rows[where[1]][column] = value
+                else:
+                    df.at[where, column] = value
+        elif event["type"] == "dish_remove":
+            where = positions.pop(dish_key(event["restaurant"], event["food"]), None)
+            if isinstance(where, tuple):
+                new_rows[where[1]] = None
+            elif where is not None:
+                removed.append(where)
+
+    df['taste'] = taste
+    df['votes_count'] = votes
+    if removed:
+        df = df.drop(index=removed).reset_index(drop=True)
+    new_rows = [row for row in new_rows if row is not None]
+    if new_rows:
+        df = pd.concat([df, pd.DataFrame(new_rows)], ignore_index=True)
+    df['votes_count'] = df['votes_count'].fillna(1).astype(int)
+    return df
+
+
+def file_version(path):
+    """(mtime_ns, size) of a file; changes whenever compaction replaces it."""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def read_master_state(master_path=MASTER_CSV, log_path=EVENT_LOG):
+    """
+    (master with pending events applied, master version, log offset), read
+    consistently: if a compaction swaps the master mid-read, read again.
+    The offset is where a tailing reader should resume (read_events_from).
+    """
+    while True:
+        # the lock makes (master version, log contents) one consistent pair;
+        # only the small log is read while holding it
+        with FileLock(log_path):
+            version = file_version(master_path)
+            events, offset = read_events_from(log_path, 0)
+        df = pd.read_csv(master_path)
+        if file_version(master_path) == version:
+            return apply_events(df, events), version, offset
+
+
+def read_master(master_path=MASTER_CSV, log_path=EVENT_LOG):
+    """Master snapshot with every pending event applied on top."""
+    return read_master_state(master_path, log_path)[0]
+
+
+def compact(master_path=MASTER_CSV, log_path=EVENT_LOG):
+    """
+    Fold the event log into the master CSV and truncate the log.
+    Writers are blocked for the duration; the snapshot is replaced atomically.
+    Returns the number of events folded.
+    """
+    with FileLock(log_path):
+        events = read_events(log_path)
+        if not events:
+            return 0
+        df = apply_events(pd.read_csv(master_path), events)
+        tmp_path = master_path + ".tmp"
+        df.to_csv(tmp_path, index=False, encoding="utf-8")
+        os.replace(tmp_path, master_path)
+        open(log_path, "w").close()
+    return len(events)
+
+
+def maybe_compact(master_path=MASTER_CSV, log_path=EVENT_LOG, max_bytes=COMPACT_BYTES):
+    """Compact only once the log is big enough to be worth a full rewrite."""
+    if os.path.exists(log_path) and os.path.getsize(log_path) >= max_bytes:
+        return compact(master_path, log_path)
+    return 0
+
+
+def get_matching_dishes(df, query_rest="", query_food="", limit=5):
+    """
+    Returns list of (restaurant, food) tuples matching partial input.
+    """
+    mask = True
+    if query_rest.strip():
+        mask &= df['restaurant'].str.contains(query_rest, case=False, na=False, regex=False)
+    if query_food.strip():
+        mask &= df['food'].str.contains(query_food, case=False, na=False, regex=False)
+    matches = df[mask][['restaurant', 'food']].drop_duplicates().head(limit)
+    return list(matches.itertuples(index=False, name=None))
+
+
+# ========== DATA-ACCESS LAYER ==========
+class CsvStore:
+    """
+    Master CSV snapshot + append-only event log (the default backend).
+
+    All stores share one interface:
+      load()                 -> (raw catalog DataFrame, cursor)
+      changes(cursor)        -> (events since cursor, new cursor); events is
+                                None when the snapshot was replaced and the
+                                caller must load() again
+      record_rating(..., user=None)
+                             -> False if the dish does not exist; with a
+                                user the vote is also kept per user
+      user_ratings()         -> DataFrame of per-user votes (USER_RATING_COLUMNS)
+      record_new_dish(row)
+      record_dish_update(restaurant, food, fields) / record_dish_removal(...)
+                             -> False if the dish does not exist
+      search_dishes(...)     -> [(restaurant, food), ...]
+      replace_catalog(df)    -> bulk write from ingestion
+      maybe_compact()
+    """
+
+    def __init__(self, master_path=MASTER_CSV, log_path=EVENT_LOG, ratings_path=RATINGS_LOG):
+        self.master_path = master_path
+        self.log_path = log_path
+        self.ratings_path = ratings_path
+
+    @property
+    def snapshot_dir(self):
+        """Where snapshot.py keeps the compiled copy of this catalog."""
+        return os.path.splitext(self.master_path)[0] + ".snapshot"
+
+    @property
+    def factors_path(self):
+        """Where personalize.py keeps the taste factors trained on this catalog's votes."""
+        return os.path.splitext(self.master_path)[0] + ".factors.npz"
+
+    def exists(self):
+        return os.path.exists(self.master_path)
+
+    def load(self):
+        df, version, offset = read_master_state(self.master_path, self.log_path)
+        return df, (version, offset)
+
+    def changes(self, cursor):
+        version, offset = cursor
+        if not self.exists() or file_version(self.master_path) != version:
+            return None, cursor
+        events, new_offset = read_events_from(self.log_path, offset)
+        return events, (version, max(offset, new_offset))
+
+    def record_rating(self, restaurant, food, rating, user=None):
+        # existence is checked by the caller against the live catalog;
+        # a rating for an unknown dish is ignored when folded
+        log_rating(restaurant, food, rating, self.log_path)
+        if user:
+            log_user_rating(user, restaurant, food, rating, self.ratings_path)
+        return True
+
+    def user_ratings(self):
+        return read_user_ratings(self.ratings_path)
+
+    def record_new_dish(self, row):
+        log_new_dish(row, self.log_path)
+
+    def record_dish_update(self, restaurant, food, fields):
+        log_dish_update(restaurant, food, fields, self.log_path)
+        return True
+
+    def record_dish_removal(self, restaurant, food):
+        log_dish_removal(restaurant, food, self.log_path)
+        return True
+
+    def search_dishes(self, query_rest="", query_food="", limit=5, frame=None):
+        """Substring search over the in-memory catalog (`frame`); no index on CSV."""
+        if frame is None:
+            frame = read_master(self.master_path, self.log_path)
+        return get_matching_dishes(frame, query_rest, query_food, limit)
+
+    def replace_catalog(self, df):
+        """Atomically swap in a new master snapshot and drop pending events."""
+        with FileLock(self.log_path):
+            tmp_path = self.master_path + ".tmp"
+            df.to_csv(tmp_path, index=False, encoding="utf-8")
+            os.replace(tmp_path, self.master_path)
+            open(self.log_path, "w").close()
+
+    def compact(self):
+        return compact(self.master_path, self.log_path)
+
+    def maybe_compact(self):
+        return maybe_compact(self.master_path, self.log_path)
+
+
+class SQLiteStore:
+    """
+    Indexed SQLite backend (WAL mode, safe for concurrent sessions).
+
+    dishes      : the catalog, with lowercased restaurant/food key columns
+                  indexed together, plus indexes on location and category
+    dishes_fts  : FTS5 trigram index over restaurant + food for substring search
+    events      : change feed (same JSON events as the CSV log) so running
+                  engines can apply deltas instead of reloading
+    ratings     : per-user votes, kept across catalog replacements
+    meta        : `generation`, bumped whenever the catalog is replaced
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS dishes (
+        id INTEGER PRIMARY KEY,
+        restaurant TEXT, food TEXT, price REAL, taste REAL, location TEXT,
+        portion_size TEXT, dish_category TEXT, description TEXT, source_url TEXT,
+        votes_count INTEGER NOT NULL DEFAULT 1,
+        restaurant_norm TEXT NOT NULL, food_norm TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_dishes_key ON dishes(restaurant_norm, food_norm);
+    CREATE INDEX IF NOT EXISTS ix_dishes_location ON dishes(location);
+    CREATE INDEX IF NOT EXISTS ix_dishes_category ON dishes(dish_category);
+
+    CREATE VIRTUAL TABLE IF NOT EXISTS dishes_fts USING fts5(
+        restaurant, food, content='dishes', content_rowid='id', tokenize='trigram'
+    );
+    CREATE TRIGGER IF NOT EXISTS dishes_ai AFTER INSERT ON dishes BEGIN
+        INSERT INTO dishes_fts(rowid, restaurant, food) VALUES (new.id, new.restaurant, new.food);
+    END;
+    CREATE TRIGGER IF NOT EXISTS dishes_ad AFTER DELETE ON dishes BEGIN
+        INSERT INTO dishes_fts(dishes_fts, rowid, restaurant, food) VALUES ('delete', old.id, old.restaurant, old.food);
+    END;
+    CREATE TRIGGER IF NOT EXISTS dishes_au AFTER UPDATE OF restaurant, food ON dishes BEGIN
+        INSERT INTO dishes_fts(dishes_fts, rowid, restaurant, food) VALUES ('delete', old.id, old.restaurant, old.food);
+        INSERT INTO dishes_fts(rowid, restaurant, food) VALUES (new.id, new.restaurant, new.food);
+    END;
+
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, payload TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+
+    CREATE TABLE IF NOT EXISTS ratings (
+        id INTEGER PRIMARY KEY, ts REAL NOT NULL, user_id TEXT NOT NULL,
+        restaurant TEXT, food TEXT, rating REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_ratings_user ON ratings(user_id);
+    """
+
+    # change-feed rows kept around for engines that lag behind
+    KEEP_EVENTS = 100_000
+
+    def __init__(self, db_path=SQLITE_DB):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+        # seeded from the clock so a re-created database never reuses an old
+        # generation (snapshots and running engines key on it)
+        conn.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('generation', ?)",
+                     (str(time.time_ns()),))
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    @property
+    def snapshot_dir(self):
+        return os.path.splitext(self.db_path)[0] + ".snapshot"
+
+    @property
+    def factors_path(self):
+        return os.path.splitext(self.db_path)[0] + ".factors.npz"
+
+    def exists(self):
+        return self._conn().execute("SELECT EXISTS(SELECT 1 FROM dishes)").fetchone()[0] == 1
+
+    def _generation(self, conn):
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0])
+
+    def load(self):
+        conn = self._conn()
+        conn.execute("BEGIN")  # one read snapshot for rows + cursor
+        try:
+            df = pd.read_sql_query(f"SELECT {', '.join(COLUMNS)} FROM dishes ORDER BY id", conn)
+            last = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+            cursor = (self._generation(conn), last)
+        finally:
+            conn.execute("COMMIT")
+        return df, cursor
+
+    def changes(self, cursor):
+        generation, last = cursor
+        conn = self._conn()
+        if self._generation(conn) != generation:
+            return None, cursor
+        first = conn.execute("SELECT MIN(id) FROM events").fetchone()[0]
+        if first is not None and first > last + 1:
+            return None, cursor  # fell behind the pruned feed
+        rows = conn.execute("SELECT id, payload FROM events WHERE id > ? ORDER BY id", (last,)).fetchall()
+        if not rows:
+            return [], cursor
+        return [json.loads(p) for _, p in rows], (generation, rows[-1][0])
+
+    def _append_event(self, conn, event):
+        conn.execute("INSERT INTO events(ts, payload) VALUES (?, ?)",
+                     (event["ts"], json.dumps(event, ensure_ascii=False)))
+
+    def record_rating(self, restaurant, food, rating, user=None):
+        """Index seek on (restaurant_norm, food_norm); same arithmetic as add_rating."""
+        r_norm, f_norm = dish_key(restaurant, food)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, restaurant, food, taste, votes_count FROM dishes "
+                "WHERE restaurant_norm = ? AND food_norm = ? ORDER BY id LIMIT 1",
+                (r_norm, f_norm)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            dish_id, restaurant, food, old_avg, old_votes = row
+            if old_avg is None or old_votes is None:
+                old_avg, old_votes = 0.0, 0
+            new_avg = (old_avg * old_votes + rating) / (old_votes + 1)
+            conn.execute("UPDATE dishes SET taste = ?, votes_count = ? WHERE id = ?",
+                         (new_avg, old_votes + 1, dish_id))
+            self._append_event(conn, {"type": "rating", "ts": time.time(), "restaurant": restaurant,
+                                      "food": food, "rating": float(rating)})
+            if user:
+                self._insert_user_ratings(conn, [(time.time(), str(user), restaurant, food, float(rating))])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def _insert_user_ratings(self, conn, records):
+        conn.executemany("INSERT INTO ratings(ts, user_id, restaurant, food, rating) VALUES (?, ?, ?, ?, ?)",
+                         records)
+
+    def user_ratings(self):
+        return pd.read_sql_query("SELECT user_id AS user, restaurant, food, rating, ts FROM ratings ORDER BY id",
+                                 self._conn())
+
+    def record_new_dish(self, row):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._insert_rows(conn, [row])
+            self._append_event(conn, {"type": "new_dish", "ts": time.time(), "row": row})
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _first_dish(self, conn, restaurant, food):
+        r_norm, f_norm = dish_key(restaurant, food)
+        return conn.execute(
+            "SELECT id, restaurant, food FROM dishes WHERE restaurant_norm = ? AND food_norm = ? "
+            "ORDER BY id LIMIT 1", (r_norm, f_norm)).fetchone()
+
+    def record_dish_update(self, restaurant, food, fields):
+        """Overwrite catalog fields (price, category, ...) of one dish; the key columns stay."""
+        fields = {c: v for c, v in fields.items() if c in COLUMNS and c not in ("restaurant", "food")}
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._first_dish(conn, restaurant, food)
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            if fields:
+                conn.execute(f"UPDATE dishes SET {', '.join(f'{c} = ?' for c in fields)} WHERE id = ?",
+                             list(fields.values()) + [row[0]])
+            self._append_event(conn, {"type": "dish_update", "ts": time.time(), "restaurant": row[1],
+                                      "food": row[2], "fields": fields})
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def record_dish_removal(self, restaurant, food):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._first_dish(conn, restaurant, food)
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("DELETE FROM dishes WHERE id = ?", (row[0],))
+            self._append_event(conn, {"type": "dish_remove", "ts": time.time(),
+                                      "restaurant": row[1], "food": row[2]})
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def _insert_rows(self, conn, rows):
+        records = []
+        for row in rows:
+            values = [row.get(c) for c in COLUMNS]
+            values = [None if (v is not None and v != v) else v for v in values]  # NaN -> NULL
+            for i in (2, 3):  # price, taste
+                values[i] = pd.to_numeric(values[i], errors="coerce")
+                values[i] = None if pd.isna(values[i]) else float(values[i])
+            votes = pd.to_numeric(values[9], errors="coerce")
+            values[9] = 1 if pd.isna(votes) else int(votes)
+            records.append(values + list(dish_key(values[0], values[1])))
+        conn.executemany(
+            f"INSERT INTO dishes({', '.join(COLUMNS)}, restaurant_norm, food_norm) "
+            f"VALUES ({', '.join('?' * (len(COLUMNS) + 2))})", records)
+
+    def search_dishes(self, query_rest="", query_food="", limit=5, frame=None):
+        """
+        Substring match on restaurant and food through the trigram FTS index;
+        terms shorter than 3 characters fall back to LIKE.
+        """
+        where, params, fts = [], [], []
+        for column, term in (("restaurant", query_rest.strip()), ("food", query_food.strip())):
+            if not term:
+                continue
+            if len(term) >= 3:
+                fts.append(f'{column} : "{term.replace(chr(34), chr(34) * 2)}"')
+            else:
+                where.append(f"d.{column} LIKE ? ESCAPE '\\'")
+                params.append("%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        sql = "SELECT d.restaurant, d.food FROM dishes d"
+        if fts:
+            sql += " JOIN dishes_fts f ON f.rowid = d.id"
+            where.insert(0, "dishes_fts MATCH ?")
+            params.insert(0, " AND ".join(fts))
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY d.restaurant, d.food ORDER BY MIN(d.id) LIMIT ?"
+        return [tuple(r) for r in self._conn().execute(sql, params + [limit]).fetchall()]
+
+    def replace_catalog(self, df):
+        """Bulk load (ingestion / migration); bumps the generation so engines reload."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM dishes")
+            self._insert_rows(conn, df.reindex(columns=COLUMNS).to_dict("records"))
+            conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("PRAGMA optimize")
+
+    def import_user_ratings(self, votes):
+        """
+        Bulk insert per-user votes (a user_ratings()-shaped DataFrame). A
+        vote already stored (same user, dish and timestamp) is skipped, so
+        importing the same log twice does not count it twice.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = set(conn.execute("SELECT user_id, restaurant, food, ts FROM ratings"))
+            records = [r for r in votes[["ts", "user", "restaurant", "food", "rating"]]
+                       .astype({"user": str}).itertuples(index=False, name=None)
+                       if (r[1], r[2], r[3], r[0]) not in stored]
+            self._insert_user_ratings(conn, records)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def compact(self):
+        """Prune the change feed; the dishes table is always current."""
+        conn = self._conn()
+        cur = conn.execute("DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?",
+                           (self.KEEP_EVENTS,))
+        return cur.rowcount
+
+    def maybe_compact(self):
+        return self.compact()
+
+
+def get_store():
+    """
+    Storage backend for this process: SQLite when TASTEPRICE_DB points at a
+    database (see `python storage.py migrate`), else the CSV + event log.
+    """
+    db_path = os.environ.get("TASTEPRICE_DB")
+    if db_path:
+        return SQLiteStore(db_path)
+    return CsvStore()
+
+
+def migrate_csv_to_sqlite(master_path=MASTER_CSV, log_path=EVENT_LOG, db_path=SQLITE_DB,
+                          ratings_path=RATINGS_LOG):
+    """One-shot migration: master CSV + pending events + per-user votes -> SQLite. Returns row count."""
+    df = read_master(master_path, log_path)
+    store = SQLiteStore(db_path)
+    store.replace_catalog(df)
+    store.import_user_ratings(read_user_ratings(ratings_path))
+    return len(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TastePrice storage maintenance")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("compact", help="fold the CSV event log into the master CSV")
+    migrate = sub.add_parser("migrate", help="copy the CSV catalog into SQLite")
+    migrate.add_argument("--db", default=SQLITE_DB)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        n = migrate_csv_to_sqlite(db_path=args.db)
+        print(f"✅ Migrated {n} rows from {MASTER_CSV} into {args.db}")
+        print(f"   Run the app with TASTEPRICE_DB={args.db} to use it")
+    else:
+        n = compact()
+        print(f"✅ Folded {n} events from {EVENT_LOG} into {MASTER_CSV}")
@@ -1,6 +1,18 @@
-import requests
-from bs4 import BeautifulSoup
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
+import soupsieve as sv
+from bs4 import BeautifulSoup
+
+from chowdeck_scraper import MenuFetcher
+
+OUTPUT_CSV = "ghana_restaurant_menus.csv"
+CACHE_DIR = ".http_cache"
 
 restaurants = {
     # Format: url : (restaurant name, parser type)
@@ -17,130 +29,233 @@ restaurants = {
     "https://zengardengh.com/menu/": ("Zen Garden", "generic"),
 }
 
-rows = []
+# The API fetcher asks for JSON; menu sites get a browser-like Accept
+HTML_HEADERS = {"Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8"}
+
+
+# ========== RESPONSE CACHE ==========
+class ResponseCache:
+    """
+    Raw HTTP responses on disk, so parsers can be re-run without the network.
+
+      <root>/objects/<sha256>      response body, named by its content hash
+                                   (identical pages are stored once)
+      <root>/urls/<sha1(url)>.json url, body hash, ETag / Last-Modified,
+                                   encoding and fetch time of the last 200
+
+    Validators are sent back as If-None-Match / If-Modified-Since; a 304
+    keeps the stored body.
+    """
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "urls"), exist_ok=True)
+
+    def _entry_path(self, url):
+        return os.path.join(self.root, "urls", hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+    def object_path(self, digest):
+        return os.path.join(self.root, "objects", digest)
+
+    def _write_json(self, path, data):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def entry(self, url):
+        """Stored metadata for `url`, or None if never fetched (or its body is gone)."""
+        try:
+            with open(self._entry_path(url), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if os.path.exists(self.object_path(entry["sha256"])) else None
+
+    def validators(self, entry):
+        """Conditional request headers for a stored entry."""
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, response):
+        body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        entry = {"url": url, "sha256": digest, "etag": response.headers.get("ETag"),
+                 "last_modified": response.headers.get("Last-Modified"),
+                 # what response.text would have decoded with
+                 "encoding": response.encoding or response.apparent_encoding,
+                 "fetched_at": time.time()}
+        self._write_json(self._entry_path(url), entry)
+        return entry
+
+    def revalidated(self, url, entry, response):
+        """A 304 for `entry`: same body, possibly refreshed validators."""
+        entry = {**entry, "fetched_at": time.time(),
+                 "etag": response.headers.get("ETag", entry.get("etag")),
+                 "last_modified": response.headers.get("Last-Modified", entry.get("last_modified"))}
+        self._write_json(self._entry_path(url), entry)
+        return entry
+
+
+def fetch_page(fetcher, cache, url):
+    """(cache entry, "fetched" | "not modified") for one page, revalidating what is cached."""
+    entry = cache.entry(url)
+    response = fetcher.get(url, headers={**HTML_HEADERS, **cache.validators(entry)})
+    if response.status_code == 304 and entry is not None:
+        return cache.revalidated(url, entry, response), "not modified"
+    return cache.store(url, response), "fetched"
+
+
+def fetch_pages(urls, cache, fetcher=None, offline=False):
+    """
+    {url: cache entry} for every page, fetched concurrently. Offline, only
+    the cache is read. A page that fails to fetch falls back to its cached
+    copy when there is one.
+    """
+    pages, stats = {}, {"fetched": 0, "not modified": 0, "cached": 0, "failed": 0}
+    if offline:
+        for url in urls:
+            entry = cache.entry(url)
+            if entry is None:
+                print(f"⚠️ Not in cache: {url}")
+                stats["failed"] += 1
+            else:
+                pages[url] = entry
+                stats["cached"] += 1
+        return pages, stats
+
+    fetcher = fetcher or MenuFetcher()
+    for url, result in fetcher.fetch_all(urls, fetch=lambda u: fetch_page(fetcher, cache, u)):
+        if isinstance(result, Exception):
+            entry = cache.entry(url)
+            print(f"⚠️ Failed on {restaurants.get(url, (url,))[0]}: {result}"
+                  + (" (using cached copy)" if entry else ""))
+            if entry is None:
+                stats["failed"] += 1
+                continue
+            pages[url], source = entry, "cached"
+        else:
+            pages[url], source = result
+        stats[source] += 1
+    return pages, stats
+
 
 # ------------------------------
-# Define parser functions BELOW
+# Define parsers BELOW
 # ------------------------------
 
-def parse_pizarea(url, restaurant_name):
-    """Scraper for Pizarea menu structure"""
-    data = []
-    res = requests.get(url, timeout=15)
-    soup = BeautifulSoup(res.text, "lxml")
-
-    items = soup.find_all("div", class_="menu-item")
-    for item in items:
-        name = item.find("h4").get_text(strip=True) if item.find("h4") else "N/A"
-        price = item.find("span", class_="menu_price").get_text(strip=True) if item.find("span", class_="menu_price") else "N/A"
-        desc = item.find("p").get_text(strip=True) if item.find("p") else ""
-        data.append({
-            "restaurant": restaurant_name,
-            "food": name,
-            "price": price,
-            "taste": "N/A",
-            "location": "Accra",
-            "portion_size": "N/A",
-            "dish_category": "Uncategorized",
-            "description": desc,
-            "source_url": url
-        })
-    return data
+# Site layouts: one CSS selector per menu item, then one per field inside
+# it. Compiled once per process; each field is a single select_one lookup.
+SITE_SELECTORS = {
+    "pizarea": {"item": "div.menu-item", "food": "h4",
+                "price": "span.menu_price", "description": "p"},
+    "ghanamenu": {"item": "div.menu-listing", "food": "span.name",
+                  "price": "span.price", "description": "span.description"},
+    "qrmenu": {"item": "div.qm-menu-item", "food": "h3",
+               "price": "div.qm-item-price", "description": "div.qm-item-description"},
+}
+_COMPILED = {site: {field: sv.compile(css) for field, css in fields.items()}
+             for site, fields in SITE_SELECTORS.items()}
+_GENERIC_ITEMS = sv.compile("h4, li")
 
 
-def parse_ghanamenu(url, restaurant_name):
-    """Scraper for GhanaMenu.com listing pages"""
-    data = []
-    res = requests.get(url, timeout=15)
-    soup = BeautifulSoup(res.text, "lxml")
-
-    items = soup.find_all("div", class_="menu-listing")
-    for item in items:
-        name = item.find("span", class_="name").get_text(strip=True) if item.find("span", class_="name") else "N/A"
-        price = item.find("span", class_="price").get_text(strip=True) if item.find("span", class_="price") else "N/A"
-        desc = item.find("span", class_="description").get_text(strip=True) if item.find("span", class_="description") else ""
-        data.append({
-            "restaurant": restaurant_name,
-            "food": name,
-            "price": price,
-            "taste": "N/A",
-            "location": "Accra",
-            "portion_size": "N/A",
-            "dish_category": "Uncategorized",
-            "description": desc,
-            "source_url": url
-        })
-    return data
+def menu_row(restaurant_name, url, food, price, description):
+    return {
+        "restaurant": restaurant_name,
+        "food": food,
+        "price": price,
+        "taste": "N/A",
+        "location": "Accra",
+        "portion_size": "N/A",
+        "dish_category": "Uncategorized",
+        "description": description,
+        "source_url": url
+    }
 
 
-def parse_qrmenu(url, restaurant_name):
-    """Scraper for QRMenu pages"""
-    data = []
-    res = requests.get(url, timeout=15)
-    soup = BeautifulSoup(res.text, "lxml")
-
-    items = soup.find_all("div", class_="qm-menu-item")
-    for item in items:
-        name = item.find("h3").get_text(strip=True) if item.find("h3") else "N/A"
-        price = item.find("div", class_="qm-item-price").get_text(strip=True) if item.find("div", class_="qm-item-price") else "N/A"
-        desc = item.find("div", class_="qm-item-description").get_text(strip=True) if item.find("div", class_="qm-item-description") else ""
-        data.append({
-            "restaurant": restaurant_name,
-            "food": name,
-            "price": price,
-            "taste": "N/A",
-            "location": "Accra",
-            "portion_size": "N/A",
-            "dish_category": "Uncategorized",
-            "description": desc,
-            "source_url": url
-        })
-    return data
+def _text(item, pattern, default):
+    node = pattern.select_one(item)
+    return node.get_text(strip=True) if node is not None else default
 
 
-def parse_generic(url, restaurant_name):
-    """Fallback: try to grab all <li>, <h4>, <span class=price> etc."""
-    data = []
-    res = requests.get(url, timeout=15)
-    soup = BeautifulSoup(res.text, "lxml")
+def parse_site(soup, url, restaurant_name, site):
+    """Menu items of a known layout (pizarea, ghanamenu, qrmenu)."""
+    select = _COMPILED[site]
+    return [menu_row(restaurant_name, url,
+                     _text(item, select["food"], "N/A"),
+                     _text(item, select["price"], "N/A"),
+                     _text(item, select["description"], ""))
+            for item in select["item"].select(soup)]
+
 
-    items = soup.find_all(["h4","li"])  # Very loose
-    for item in items:
+def parse_generic(soup, url, restaurant_name):
+    """Fallback: every <h4> / <li> whose text carries a cedi price."""
+    data = []
+    for item in _GENERIC_ITEMS.select(soup):  # Very loose
         text = item.get_text(" ", strip=True)
         if "₵" in text or "GHS" in text:
-            data.append({
-                "restaurant": restaurant_name,
-                "food": text,
-                "price": text,
-                "taste": "N/A",
-                "location": "Accra",
-                "portion_size": "N/A",
-                "dish_category": "Uncategorized",
-                "description": "",
-                "source_url": url
-            })
+            data.append(menu_row(restaurant_name, url, text, text, ""))
     return data
 
 
-# ----------------------
-# Dispatcher
-# ----------------------
-parsers = {
-    "pizarea": parse_pizarea,
-    "ghanamenu": parse_ghanamenu,
-    "qrmenu": parse_qrmenu,
-    "generic": parse_generic
-}
+def parse_page(job):
+    """(cached body path, encoding, url, restaurant, parser type) -> rows. Runs in a worker process."""
+    path, encoding, url, restaurant_name, parser_key = job
+    with open(path, "rb") as f:
+        html = f.read().decode(encoding or "utf-8", errors="replace")
+    soup = BeautifulSoup(html, "lxml")
+    if parser_key in _COMPILED:
+        return parse_site(soup, url, restaurant_name, parser_key)
+    return parse_generic(soup, url, restaurant_name)
+
+
+def parse_pages(pages, cache, jobs=None):
+    """Rows of every cached page, in `restaurants` order, parsed in a process pool."""
+    work = [(cache.object_path(pages[url]["sha256"]), pages[url]["encoding"], url, *restaurants[url])
+            for url in restaurants if url in pages]
+    if jobs == 1 or len(work) <= 1:
+        results = list(map(parse_page, work))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(parse_page, work))
+    rows = []
+    for (_, _, url, name, _), page_rows in zip(work, results):
+        print(f"Parsed {name} from {url}: {len(page_rows)} dishes")
+        rows.extend(page_rows)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Restaurant website menu scraper")
+    parser.add_argument("--out", default=OUTPUT_CSV)
+    parser.add_argument("--cache", default=CACHE_DIR, help="on-disk response cache directory")
+    parser.add_argument("--offline", action="store_true",
+                        help="parse the cached pages only (e.g. after fixing a parser); no network")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--per-host", type=int, default=2)
+    parser.add_argument("--jobs", type=int, default=None, help="parser processes (1 = in-process)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    cache = ResponseCache(args.cache)
+    fetcher = None if args.offline else MenuFetcher(concurrency=args.concurrency, per_host=args.per_host)
+    pages, stats = fetch_pages(list(restaurants), cache, fetcher, offline=args.offline)
+    print("🌐 " + ", ".join(f"{n} {source}" for source, n in stats.items()))
+    rows = parse_pages(pages, cache, jobs=args.jobs)
 
-for url, (name, parser_key) in restaurants.items():
-    print(f"Fetching {name} from {url}")
-    parser = parsers.get(parser_key, parse_generic)
-    try:
-        rows.extend(parser(url, name))
-    except Exception as e:
-        print(f"⚠️ Failed on {name}: {e}")
-
-# Save everything into CSV
-df = pd.DataFrame(rows)
-df.to_csv("ghana_restaurant_menus.csv", index=False, encoding="utf-8")
-print(f"✅ Saved {len(df)} dishes from {len(restaurants)} restaurants into ghana_restaurant_menus.csv")
\ No newline at end of file
+    # Save everything into CSV
+    df = pd.DataFrame(rows)
+    df.to_csv(args.out, index=False, encoding="utf-8")
+    print(f"✅ Saved {len(df)} dishes from {len(pages)} pages into {args.out} "
+          f"in {time.perf_counter() - started:.1f}s")